@@ -0,0 +1,84 @@
+package main
+
+import "sync"
+
+// Outcome is the status and body of a response, and the number of seconds
+// after which to retry if the server was too busy.
+type Outcome struct {
+	Status     int
+	Body       interface{}
+	RetryAfter int
+}
+
+// call is a request being served. Identical requests that arrive
+// meanwhile wait for it and share its outcome.
+type call struct {
+	done    chan struct{}
+	outcome Outcome
+}
+
+// CoalesceStats counts, for an operation, the requests that were run and
+// those that shared the outcome of an identical request already running.
+type CoalesceStats struct {
+	Run       int
+	Coalesced int
+}
+
+// Coalescer runs identical concurrent requests once, e.g. a class solving
+// the same exercise at the same time.
+type Coalescer struct {
+	mu    sync.Mutex
+	calls map[string]*call
+	stats map[string]*CoalesceStats
+}
+
+func NewCoalescer() *Coalescer {
+	return &Coalescer{
+		calls: make(map[string]*call),
+		stats: make(map[string]*CoalesceStats),
+	}
+}
+
+// Do runs fn for the request with the operation and key, unless an
+// identical request is already running, in which case it waits for that
+// request and returns its outcome instead. It also returns whether the
+// outcome was shared.
+func (c *Coalescer) Do(operation string, key string, fn func() Outcome) (Outcome, bool) {
+	key = operation + "\x00" + key
+	c.mu.Lock()
+	stats := c.stats[operation]
+	if stats == nil {
+		stats = &CoalesceStats{}
+		c.stats[operation] = stats
+	}
+	if cl, ok := c.calls[key]; ok {
+		stats.Coalesced++
+		c.mu.Unlock()
+		<-cl.done
+		return cl.outcome, true
+	}
+	cl := &call{done: make(chan struct{})}
+	c.calls[key] = cl
+	stats.Run++
+	c.mu.Unlock()
+
+	defer func() {
+		c.mu.Lock()
+		delete(c.calls, key)
+		c.mu.Unlock()
+		close(cl.done)
+	}()
+	cl.outcome = fn()
+	return cl.outcome, false
+}
+
+// Stats returns the counts of each operation so far.
+func (c *Coalescer) Stats() map[string]CoalesceStats {
+	c.mu.Lock()
+	defer c.mu.Unlock()
+	stats := make(map[string]CoalesceStats, len(c.stats))
+	for op, s := range c.stats {
+		stats[op] = *s
+	}
+	return stats
+}
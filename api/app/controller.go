@@ -3,7 +3,9 @@ package main
 import (
 	"encoding/json"
 	"fmt"
+	"math"
 	"net/http"
+	"strconv"
 	"time"
 
 	"github.com/gin-gonic/gin"
@@ -14,15 +16,22 @@ type Request map[string]interface{}
 type Response struct {
 	// 200 OK response containing OR
 	Pretty map[string]interface{} `json:"pretty"` // string or string[]
-	Image  *string                `json:"image"`
+	Image  []byte                 `json:"image"`  // Encoded as Base64
 	Answer interface{}            `json:"answer"` // string, string[], or nil
+	// The full text of an answer that was too large and was summarised
+	Attachment *string `json:"attachment,omitempty"`
 	// 400 Bad Request response containing
 	ErrorName    *string `json:"name"`
 	ErrorMessage *string `json:"message"`
 }
 
-func HandleOperation(operation string, timeout time.Duration) gin.HandlerFunc {
+// coalescer shares the outcome of a request between identical requests
+// made at the same time.
+var coalescer = NewCoalescer()
+
+func HandleOperation(operation string, class PoolClass) gin.HandlerFunc {
 	return func(c *gin.Context) {
+		start := time.Now()
 		// Parse the request
 		var args Request
 		if err := c.ShouldBindJSON(&args); err != nil {
@@ -30,45 +39,97 @@ func HandleOperation(operation string, timeout time.Duration) gin.HandlerFunc {
 				"name":    "BadRequest",
 				"message": err.Error(),
 			})
+			metrics.ObserveRequest(c.FullPath(), http.StatusBadRequest, time.Since(start))
 			return
 		}
-		req := map[string]interface{}{
-			"operation": operation,
-			"args":      args,
+
+		// Identical requests made at the same time share one worker. The
+		// keys of maps are sorted when marshalled, so equal arguments give
+		// equal keys. This cannot fail, as args was decoded from JSON.
+		key, _ := json.Marshal(args)
+		outcome, _ := coalescer.Do(operation, string(key), func() Outcome {
+			return runOperation(operation, class, args)
+		})
+		if outcome.RetryAfter > 0 {
+			c.Header("Retry-After", strconv.Itoa(outcome.RetryAfter))
 		}
+		c.JSON(outcome.Status, outcome.Body)
+		metrics.ObserveRequest(c.FullPath(), outcome.Status, time.Since(start))
+	}
+}
 
-		// Offload the request to a worker
-		worker := workerPool.GetWorker()
-		if worker == nil {
-			errMsg := "No available workers"
-			c.JSON(http.StatusInternalServerError, gin.H{"error": errMsg})
-			return
+// runOperation offloads the request to a worker and returns the response.
+func runOperation(operation string, class PoolClass, args Request) Outcome {
+	timeout := class.Timeout
+	// Wait for a worker if they are all busy
+	wait := time.Duration(float64(timeout) * QueueWaitFraction)
+	worker, err := workerPools[class.Name].GetWorker(operation, wait)
+	if err != nil {
+		// Ask the client to retry once the current requests are done
+		return Outcome{
+			Status:     http.StatusTooManyRequests,
+			Body:       gin.H{"error": err.Error()},
+			RetryAfter: int(math.Ceil(timeout.Seconds())),
 		}
-		resp, err := worker.SendRequest(req, timeout)
-		if err != nil {
-			if err.Error() == "worker timed out and was killed" {
-				errMsg := fmt.Sprintf("Exceeded time limit of %.1f seconds",
-					timeout.Seconds())
-				c.JSON(http.StatusGatewayTimeout, gin.H{"error": errMsg})
-				return
-			}
-			c.JSON(http.StatusInternalServerError, gin.H{"error": err.Error()})
-			return
+	}
+	// The time spent waiting does not count towards the time limit
+	deadline := time.Now().Add(timeout)
+	req := map[string]interface{}{
+		"operation": operation,
+		"args":      args,
+		"deadline":  float64(deadline.UnixNano()) / 1e9,
+	}
+	timeoutMsg := fmt.Sprintf("Exceeded time limit of %.1f seconds",
+		timeout.Seconds())
+	frame, err := worker.SendRequest(req, timeout+KillGrace)
+	if err != nil {
+		if err.Error() == "worker timed out and was killed" {
+			metrics.CountTimeoutKill(class.Name)
+			return Outcome{Status: http.StatusGatewayTimeout, Body: gin.H{"error": timeoutMsg}}
 		}
+		return Outcome{Status: http.StatusInternalServerError, Body: gin.H{"error": err.Error()}}
+	}
 
-		// Parse the JSON output
-		var result Response
-		if err := json.Unmarshal(resp, &result); err != nil {
-			errMsg := "error parsing JSON output: " + err.Error()
-			c.JSON(http.StatusInternalServerError, gin.H{"error": errMsg})
-			return
-		}
+	// Parse the JSON header and attach the raw image
+	var result Response
+	if err := json.Unmarshal(frame.Header, &result); err != nil {
+		errMsg := "error parsing JSON output: " + err.Error()
+		return Outcome{Status: http.StatusInternalServerError, Body: gin.H{"error": errMsg}}
+	}
+	if len(frame.Image) > 0 {
+		result.Image = frame.Image
+	}
+	var stats FrameStats
+	if err := json.Unmarshal(frame.Stats, &stats); err == nil {
+		metrics.ObserveStages(operation, stats)
+	}
 
-		if result.ErrorName != nil {
-			c.JSON(http.StatusBadRequest, &result)
-			return
-		}
+	if result.ErrorName != nil && *result.ErrorName == "TimeoutError" {
+		return Outcome{Status: http.StatusGatewayTimeout, Body: gin.H{"error": timeoutMsg}}
+	}
 
-		c.JSON(http.StatusOK, &result)
+	if result.ErrorName != nil {
+		return Outcome{Status: http.StatusBadRequest, Body: &result}
+	}
+
+	return Outcome{Status: http.StatusOK, Body: &result}
+}
+
+// HandleReady reports how many warm workers each pool has, and whether
+// every pool has at least one to serve requests.
+func HandleReady(c *gin.Context) {
+	ready := true
+	pools := gin.H{}
+	for name, pool := range workerPools {
+		live, idle := pool.Available()
+		pools[name] = gin.H{"workers": live, "idle": idle}
+		if live == 0 {
+			ready = false
+		}
+	}
+	status := http.StatusOK
+	if !ready {
+		status = http.StatusServiceUnavailable
 	}
+	c.JSON(status, gin.H{"ready": ready, "pools": pools})
 }
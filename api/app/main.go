@@ -9,14 +9,14 @@ const (
 	port = "8080"
 )
 
-var workerPool *WorkerPool
+var workerPools WorkerPools
 
 func main() {
-	// Create the worker pool
+	// Create the worker pools
 	var err error
-	workerPool, err = NewWorkerPool(4)
+	workerPools, err = NewWorkerPools(PoolClasses)
 	if err != nil {
-		panic(fmt.Sprintf("Failed to start worker pool: %v", err))
+		panic(fmt.Sprintf("Failed to start worker pools: %v", err))
 	}
 
 	// Start the server
@@ -3,21 +3,26 @@ package main
 import (
 	"bytes"
 	"encoding/json"
+	"fmt"
 	"net/http"
 	"net/http/httptest"
 	"os"
+	"strings"
+	"sync"
+	"sync/atomic"
 	"testing"
+	"time"
 
 	"github.com/gin-gonic/gin"
 	"github.com/stretchr/testify/assert"
 )
 
 func TestMain(m *testing.M) {
-	// Create the worker pool before running tests
+	// Create the worker pools before running tests
 	var err error
-	workerPool, err = NewWorkerPool(4)
+	workerPools, err = NewWorkerPools(PoolClasses)
 	if err != nil {
-		panic("Failed to start worker pool for tests: " + err.Error())
+		panic("Failed to start worker pools for tests: " + err.Error())
 	}
 	os.Exit(m.Run())
 }
@@ -90,6 +95,383 @@ func TestHealthEndpoint(t *testing.T) {
 	assert.Equal(t, "ok", response["status"])
 }
 
+func TestReadyEndpoint(t *testing.T) {
+	gin.SetMode(gin.TestMode)
+	router := SetupRouter()
+
+	w, response := makeTestRequest(t, router, "GET", "/ready", nil)
+
+	assert.Equal(t, http.StatusOK, w.Code)
+	assert.Equal(t, true, response["ready"])
+	pools := response["pools"].(map[string]interface{})
+	assert.Len(t, pools, len(PoolClasses))
+	algebra := pools[AlgebraClass.Name].(map[string]interface{})
+	assert.GreaterOrEqual(t, algebra["workers"], float64(1))
+}
+
+func TestProbe(t *testing.T) {
+	class := PoolClass{Name: "test", MinWorkers: 1, MaxWorkers: 1, MaxQueue: 1, Timeout: Timeout}
+	pool, err := NewWorkerPool(class, workerPools[TextClass.Name].spawner, NewWorkerBudget(2))
+	assert.Nil(t, err)
+	defer pool.kill()
+
+	// A healthy worker is kept
+	w := pool.Workers()[0]
+	pool.probe()
+	assert.False(t, w.IsDead())
+	assert.Equal(t, int64(1), w.requests.Load())
+	assert.Equal(t, w, pool.Workers()[0])
+
+	// A worker using too much memory is replaced
+	class.MaxRSS = 1
+	pool, err = NewWorkerPool(class, workerPools[TextClass.Name].spawner, NewWorkerBudget(2))
+	assert.Nil(t, err)
+	defer pool.kill()
+	w = pool.Workers()[0]
+	pool.probe()
+	assert.True(t, w.IsDead())
+	deadline := time.Now().Add(StartupTimeout)
+	for pool.Workers()[0] == w && time.Now().Before(deadline) {
+		time.Sleep(10 * time.Millisecond)
+	}
+	assert.True(t, pool.Workers()[0] != w)
+	live, idle := pool.Available()
+	assert.Equal(t, 1, live)
+	assert.Equal(t, 1, idle)
+}
+
+func TestKillOnce(t *testing.T) {
+	var kills atomic.Int32
+	released := make(chan struct{}, 2)
+	w := &Worker{
+		kill: func() error {
+			kills.Add(1)
+			return nil
+		},
+		release: func() { released <- struct{}{} },
+	}
+	w.Kill()
+	w.Kill()
+	<-released
+	assert.True(t, w.IsDead())
+	assert.Equal(t, int32(1), kills.Load())
+	assert.Equal(t, 0, len(released))
+
+	// A worker whose ping timed out is only killed by the timeout
+	class := PoolClass{Name: "test", MinWorkers: 1, MaxWorkers: 1, MaxQueue: 1, Timeout: Timeout}
+	pool, err := NewWorkerPool(class, workerPools[TextClass.Name].spawner, NewWorkerBudget(2))
+	assert.Nil(t, err)
+	defer pool.kill()
+	w = pool.Workers()[0]
+	kill := w.kill
+	w.kill = func() error {
+		kills.Add(1)
+		return kill()
+	}
+	assert.True(t, w.TryAcquire())
+	req := map[string]interface{}{
+		"operation": "evaluate_expression",
+		"args":      map[string]interface{}{"expr": "99^99999999!"},
+	}
+	_, err = w.SendRequest(req, 100*time.Millisecond)
+	assert.NotNil(t, err)
+	pool.probe()
+	assert.Equal(t, int32(2), kills.Load())
+}
+
+func TestMetricsEndpoint(t *testing.T) {
+	gin.SetMode(gin.TestMode)
+	router := SetupRouter()
+
+	args := map[string]interface{}{"expr": "2^10+3/4"}
+	makeTestRequest(t, router, "POST", "/evaluate", args)
+	w := httptest.NewRecorder()
+	req, _ := http.NewRequest("GET", "/metrics", nil)
+	router.ServeHTTP(w, req)
+
+	assert.Equal(t, http.StatusOK, w.Code)
+	body := w.Body.String()
+	for _, line := range []string{
+		"# TYPE das_http_request_duration_seconds histogram",
+		`das_http_requests_total{route="/evaluate",code="200"} `,
+		`das_http_request_duration_seconds_bucket{route="/evaluate",le="+Inf"} `,
+		`das_queue_wait_seconds_count{class="algebra"} `,
+		`das_stage_duration_seconds_count{operation="evaluate_expression",stage="compute"} `,
+		`das_workers{class="graph3d"} 1`,
+		`das_requests_run_total{operation="evaluate_expression"} `,
+		`das_worker_requests_total{class="algebra",pid="`,
+	} {
+		assert.Contains(t, body, line)
+	}
+}
+
+func TestZygoteSpawn(t *testing.T) {
+	zygote := workerPools[TextClass.Name].spawner.zygote
+	if zygote == nil {
+		t.Skip("zygote unavailable")
+	}
+
+	start := time.Now()
+	w, err := zygote.Spawn()
+	assert.Nil(t, err)
+	assert.Less(t, time.Since(start), Timeout)
+
+	assert.True(t, w.TryAcquire())
+	req := map[string]interface{}{
+		"operation": "evaluate_expression",
+		"args":      map[string]interface{}{"expr": "1+1"},
+	}
+	frame, err := w.SendRequest(req, Timeout)
+	assert.Nil(t, err)
+	assert.Contains(t, string(frame.Header), `"answer": "2"`)
+	assert.NotEqual(t, 0, len(frame.Image))
+
+	// Once the worker has exited and been reaped by the zygote, it is no
+	// longer killed by its PID, which may belong to another process
+	w.stdin.Close()
+	proc := fmt.Sprintf("/proc/%d", w.Pid())
+	for i := 0; i < 100; i++ {
+		if _, err := os.Stat(proc); err != nil {
+			break
+		}
+		time.Sleep(50 * time.Millisecond)
+	}
+	assert.Equal(t, os.ErrProcessDone, w.kill())
+	w.release()
+}
+
+func TestSpawnerRestart(t *testing.T) {
+	spawner := NewSpawner()
+	defer spawner.Close()
+	if spawner.zygote == nil {
+		t.Skip("zygote unavailable")
+	}
+	spawner.zygote.Close()
+	for !spawner.zygote.IsDead() {
+		time.Sleep(10 * time.Millisecond)
+	}
+
+	// Workers are started directly while the zygote restarts
+	w, err := spawner.Spawn()
+	assert.Nil(t, err)
+	w.Kill()
+	for i := 0; i < 600 && spawner.liveZygote() == nil; i++ {
+		time.Sleep(50 * time.Millisecond)
+	}
+	assert.NotNil(t, spawner.liveZygote())
+}
+
+func TestDeadlineKeepsWorkerAlive(t *testing.T) {
+	w, err := workerPools[AlgebraClass.Name].GetWorker("evaluate_expression", Timeout)
+	assert.Nil(t, err)
+	req := map[string]interface{}{
+		"operation": "evaluate_expression",
+		"args":      map[string]interface{}{"expr": "99^99999999!"},
+		"deadline":  float64(time.Now().Add(200*time.Millisecond).UnixNano()) / 1e9,
+	}
+	frame, err := w.SendRequest(req, Timeout+KillGrace)
+	assert.Nil(t, err)
+	assert.Contains(t, string(frame.Header), `"name": "TimeoutError"`)
+	assert.False(t, w.IsDead())
+}
+
+// newTestPool makes a pool of workers without processes, for testing the
+// queue. Workers taken from it are freed with unlock.
+func newTestPool(num int, maxQueue int) *WorkerPool {
+	class := PoolClass{Name: "test", MinWorkers: num, MaxWorkers: num, MaxQueue: maxQueue}
+	pool := &WorkerPool{
+		class:       class,
+		replaceChan: make(chan *Worker, num),
+		minWorkers:  num,
+		maxWorkers:  num,
+		budget:      NewWorkerBudget(num),
+		scaleChan:   make(chan struct{}, 1),
+		queues:      make(map[string][]*waiter),
+		maxQueue:    maxQueue,
+	}
+	for i := 0; i < num; i++ {
+		pool.workers = append(pool.workers, &Worker{onRelease: pool.dispatch})
+	}
+	pool.budget.take(num)
+	return pool
+}
+
+func TestQueueOrder(t *testing.T) {
+	pool := newTestPool(1, 3)
+	w, err := pool.GetWorker("text", 0)
+	assert.Nil(t, err)
+
+	// Two graphs wait before a text request, which is served between them
+	order := make(chan string, 3)
+	for i, class := range []string{"graph", "graph", "text"} {
+		go func(class string) {
+			w, err := pool.GetWorker(class, time.Second)
+			assert.Nil(t, err)
+			order <- class
+			w.unlock()
+		}(class)
+		// Wait for it to join the queue before the next one
+		for pool.QueueStats().Depth <= i {
+			time.Sleep(time.Millisecond)
+		}
+	}
+	// The queue is full
+	_, err = pool.GetWorker("text", time.Second)
+	assert.Equal(t, ErrQueueFull, err)
+
+	w.unlock()
+	assert.Equal(t, "graph", <-order)
+	assert.Equal(t, "text", <-order)
+	assert.Equal(t, "graph", <-order)
+
+	stats := pool.QueueStats()
+	assert.Equal(t, 0, stats.Depth)
+	assert.Equal(t, 3, stats.MaxDepth)
+	assert.Equal(t, 4, stats.Served)
+	assert.Equal(t, 3, stats.Queued)
+	assert.Equal(t, 1, stats.Rejected)
+}
+
+func TestQueueTimeout(t *testing.T) {
+	pool := newTestPool(1, 1)
+	w, err := pool.GetWorker("text", 0)
+	assert.Nil(t, err)
+
+	start := time.Now()
+	_, err = pool.GetWorker("text", 50*time.Millisecond)
+	assert.Equal(t, ErrQueueTimeout, err)
+	assert.GreaterOrEqual(t, time.Since(start), 50*time.Millisecond)
+	assert.Equal(t, 0, pool.QueueStats().Depth)
+	assert.Equal(t, 1, pool.QueueStats().TimedOut)
+
+	// The worker is free for the next request once it is released
+	w.unlock()
+	w, err = pool.GetWorker("text", 0)
+	assert.Nil(t, err)
+	assert.NotNil(t, w)
+}
+
+func TestAutoscale(t *testing.T) {
+	class := PoolClass{Name: "test", MinWorkers: 1, MaxWorkers: 2, MaxQueue: 1, Timeout: Timeout}
+	pool, err := NewWorkerPool(class, workerPools[TextClass.Name].spawner, NewWorkerBudget(2))
+	assert.Nil(t, err)
+	defer pool.kill()
+
+	// A request waiting for the busy worker makes the pool grow
+	w1, err := pool.GetWorker("evaluate_expression", 0)
+	assert.Nil(t, err)
+	w2, err := pool.GetWorker("evaluate_expression", StartupTimeout)
+	assert.Nil(t, err)
+	assert.True(t, w1 != w2)
+	stats := pool.ScaleStats()
+	assert.Equal(t, 2, stats.Workers)
+	assert.Equal(t, 1, stats.ScaleUps)
+	assert.True(t, stats.TotalSpawn > 0)
+
+	// The spare worker is retired once idle for the cool-down, which is 0
+	w1.unlock()
+	w2.unlock()
+	deadline := time.Now().Add(5 * ScaleInterval)
+	for pool.ScaleStats().Workers > 1 && time.Now().Before(deadline) {
+		time.Sleep(10 * time.Millisecond)
+	}
+	stats = pool.ScaleStats()
+	assert.Equal(t, 1, stats.Workers)
+	assert.Equal(t, 1, stats.ScaleDowns)
+}
+
+func TestScaleLimits(t *testing.T) {
+	// A pool does not grow past the budget shared with the other pools
+	pool := newTestPool(2, 1)
+	pool.maxWorkers = 3
+	w1, err := pool.GetWorker("text", 0)
+	assert.Nil(t, err)
+	w2, err := pool.GetWorker("text", 0)
+	assert.Nil(t, err)
+	pool.scale()
+	assert.Equal(t, 0, pool.ScaleStats().Starting)
+	assert.Equal(t, 2, pool.budget.Used())
+
+	// Dead workers do not count towards the minimum
+	pool.minWorkers = 1
+	w1.dead.Store(true)
+	w1.unlock()
+	w2.unlock()
+	pool.scale()
+	assert.Equal(t, 2, pool.ScaleStats().Workers)
+	assert.Equal(t, 0, pool.ScaleStats().ScaleDowns)
+}
+
+func TestCoalescer(t *testing.T) {
+	c := NewCoalescer()
+	release := make(chan struct{})
+	runs := make(chan string, 10)
+	run := func(key string) func() Outcome {
+		return func() Outcome {
+			runs <- key
+			<-release
+			return Outcome{Status: http.StatusOK, Body: key}
+		}
+	}
+
+	// The first request runs, and identical ones wait for it
+	var wg sync.WaitGroup
+	for i := 0; i < 5; i++ {
+		wg.Add(1)
+		go func() {
+			defer wg.Done()
+			outcome, _ := c.Do("solve_equation", `{"expr":"x^2=4"}`, run("a"))
+			assert.Equal(t, "a", outcome.Body)
+		}()
+		if i == 0 {
+			<-runs
+		}
+	}
+	// Requests with other arguments or operations run separately
+	go c.Do("solve_equation", `{"expr":"x^2=9"}`, run("b"))
+	go c.Do("factor_expression", `{"expr":"x^2=4"}`, run("c"))
+	<-runs
+	<-runs
+	for c.Stats()["solve_equation"].Coalesced < 4 {
+		time.Sleep(time.Millisecond)
+	}
+	close(release)
+	wg.Wait()
+
+	assert.Equal(t, 0, len(runs))
+	stats := c.Stats()
+	assert.Equal(t, CoalesceStats{Run: 2, Coalesced: 4}, stats["solve_equation"])
+	assert.Equal(t, CoalesceStats{Run: 1, Coalesced: 0}, stats["factor_expression"])
+
+	// Requests after it has finished run again
+	_, shared := c.Do("solve_equation", `{"expr":"x^2=4"}`, func() Outcome { return Outcome{} })
+	assert.False(t, shared)
+}
+
+func TestTooManyRequests(t *testing.T) {
+	gin.SetMode(gin.TestMode)
+	router := SetupRouter()
+
+	// Swap in a graph pool whose only worker is busy and that has no queue
+	pool := newTestPool(1, 0)
+	_, err := pool.GetWorker("graph_func_single", 0)
+	assert.Nil(t, err)
+	defer func(p *WorkerPool) { workerPools[GraphClass.Name] = p }(workerPools[GraphClass.Name])
+	workerPools[GraphClass.Name] = pool
+
+	args := map[string]interface{}{"expr": "x^2", "var": "x"}
+	w, response := makeTestRequest(t, router, "POST", "/graph-func-single", args)
+
+	assert.Equal(t, http.StatusTooManyRequests, w.Code)
+	assert.Equal(t, "2", w.Header().Get("Retry-After"))
+	assert.Equal(t, ErrQueueFull.Error(), response["error"])
+
+	// Other classes of operations have their own workers
+	args = map[string]interface{}{"expr": "1+1"}
+	w, _ = makeTestRequest(t, router, "POST", "/evaluate", args)
+	assert.Equal(t, http.StatusOK, w.Code)
+}
+
 func TestInvalidInput(t *testing.T) {
 	gin.SetMode(gin.TestMode)
 	router := SetupRouter()
@@ -225,6 +607,18 @@ func TestExpandEndpoint(t *testing.T) {
 	}
 }
 
+func TestLargeResult(t *testing.T) {
+	gin.SetMode(gin.TestMode)
+	router := SetupRouter()
+
+	args := map[string]interface{}{"expr": "(x+y+z)^30"}
+	w, response := makeTestRequest(t, router, "POST", "/expand", args)
+
+	assert.Equal(t, http.StatusOK, w.Code)
+	assert.True(t, strings.HasSuffix(response["answer"].(string), "… 488 more terms"))
+	assert.Contains(t, response["attachment"], "+z^30")
+}
+
 func TestFactorEndpoint(t *testing.T) {
 	gin.SetMode(gin.TestMode)
 	router := SetupRouter()
@@ -0,0 +1,269 @@
+package main
+
+import (
+	"fmt"
+	"net/http"
+	"sort"
+	"strconv"
+	"strings"
+	"sync"
+	"time"
+
+	"github.com/gin-gonic/gin"
+)
+
+// DurationBuckets are the upper bounds, in seconds, of the buckets of all
+// duration histograms. They span the stages of a cached request up to the
+// time limit of a 3D graph.
+var DurationBuckets = []float64{
+	0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5,
+}
+
+// histogram counts observations into DurationBuckets.
+type histogram struct {
+	counts []uint64 // For each bucket, and then above the last one
+	sum    float64
+	count  uint64
+}
+
+func (h *histogram) observe(seconds float64) {
+	if h.counts == nil {
+		h.counts = make([]uint64, len(DurationBuckets)+1)
+	}
+	h.counts[sort.SearchFloat64s(DurationBuckets, seconds)]++
+	h.sum += seconds
+	h.count++
+}
+
+// labels are the names and values of a metric's labels, in order.
+type labels []string
+
+func (l labels) String() string {
+	parts := make([]string, 0, len(l)/2)
+	for i := 0; i+1 < len(l); i += 2 {
+		parts = append(parts, l[i]+"="+strconv.Quote(l[i+1]))
+	}
+	return strings.Join(parts, ",")
+}
+
+// Metrics collects the measurements of the server and its workers, which
+// are exposed at /metrics in the Prometheus text format.
+type Metrics struct {
+	mu       sync.Mutex
+	requests map[string]uint64     // By route and status code
+	latency  map[string]*histogram // By route
+	wait     map[string]*histogram // Queue wait, by class
+	spawn    map[string]*histogram // Starting workers, by class and reason
+	kills    map[string]uint64     // Workers killed for timing out, by class
+	recycles map[string]uint64     // Workers failing probes, by class and reason
+	stages   map[string]*histogram // By operation and stage
+	cached   map[string]uint64     // Responses from the workers' caches
+}
+
+func NewMetrics() *Metrics {
+	return &Metrics{
+		requests: make(map[string]uint64),
+		latency:  make(map[string]*histogram),
+		wait:     make(map[string]*histogram),
+		spawn:    make(map[string]*histogram),
+		kills:    make(map[string]uint64),
+		recycles: make(map[string]uint64),
+		stages:   make(map[string]*histogram),
+		cached:   make(map[string]uint64),
+	}
+}
+
+// metrics is shared by the whole server.
+var metrics = NewMetrics()
+
+// observeLocked adds the observation to the histogram with the labels.
+// m.mu must be held.
+func (m *Metrics) observeLocked(hists map[string]*histogram, l labels, d time.Duration) {
+	k := l.String()
+	h := hists[k]
+	if h == nil {
+		h = &histogram{}
+		hists[k] = h
+	}
+	h.observe(d.Seconds())
+}
+
+// ObserveRequest records a request to a route and how long it took.
+func (m *Metrics) ObserveRequest(route string, status int, d time.Duration) {
+	m.mu.Lock()
+	defer m.mu.Unlock()
+	m.requests[labels{"route", route, "code", strconv.Itoa(status)}.String()]++
+	m.observeLocked(m.latency, labels{"route", route}, d)
+}
+
+// ObserveQueueWait records how long a request waited for a worker.
+func (m *Metrics) ObserveQueueWait(class string, d time.Duration) {
+	m.mu.Lock()
+	defer m.mu.Unlock()
+	m.observeLocked(m.wait, labels{"class", class}, d)
+}
+
+// ObserveSpawn records how long starting a worker took. The reason is
+// "respawn" for replacing a dead worker, or "scale" for scaling up.
+func (m *Metrics) ObserveSpawn(class string, reason string, d time.Duration) {
+	m.mu.Lock()
+	defer m.mu.Unlock()
+	m.observeLocked(m.spawn, labels{"class", class, "reason", reason}, d)
+}
+
+// CountTimeoutKill records a worker killed for not answering in time.
+func (m *Metrics) CountTimeoutKill(class string) {
+	m.mu.Lock()
+	defer m.mu.Unlock()
+	m.kills[labels{"class", class}.String()]++
+}
+
+// CountRecycle records a worker replaced for failing a health probe. The
+// reason is "unresponsive", "slow" or "memory".
+func (m *Metrics) CountRecycle(class string, reason string) {
+	m.mu.Lock()
+	defer m.mu.Unlock()
+	m.recycles[labels{"class", class, "reason", reason}.String()]++
+}
+
+// ObserveStages records the stats a worker reported for an operation.
+func (m *Metrics) ObserveStages(operation string, stats FrameStats) {
+	m.mu.Lock()
+	defer m.mu.Unlock()
+	for stage, seconds := range stats.Stages {
+		d := time.Duration(seconds * float64(time.Second))
+		m.observeLocked(m.stages, labels{"operation", operation, "stage", stage}, d)
+	}
+	if stats.Cached {
+		m.cached[labels{"operation", operation}.String()]++
+	}
+}
+
+// sortedKeys returns the keys of the map in order, so that the output is
+// stable between scrapes.
+func sortedKeys[V any](values map[string]V) []string {
+	keys := make([]string, 0, len(values))
+	for k := range values {
+		keys = append(keys, k)
+	}
+	sort.Strings(keys)
+	return keys
+}
+
+// writeHeader writes the HELP and TYPE lines of a metric.
+func writeHeader(b *strings.Builder, name string, kind string, help string) {
+	fmt.Fprintf(b, "# HELP %s %s\n# TYPE %s %s\n", name, help, name, kind)
+}
+
+func writeValues[V uint64 | int64 | int | float64](b *strings.Builder, name string, kind string, help string, values map[string]V) {
+	writeHeader(b, name, kind, help)
+	for _, k := range sortedKeys(values) {
+		fmt.Fprintf(b, "%s{%s} %v\n", name, k, values[k])
+	}
+}
+
+func writeHistograms(b *strings.Builder, name string, help string, hists map[string]*histogram) {
+	writeHeader(b, name, "histogram", help)
+	for _, k := range sortedKeys(hists) {
+		h := hists[k]
+		var cumulative uint64
+		for i, le := range DurationBuckets {
+			cumulative += h.counts[i]
+			fmt.Fprintf(b, "%s_bucket{%s,le=\"%g\"} %d\n", name, k, le, cumulative)
+		}
+		fmt.Fprintf(b, "%s_bucket{%s,le=\"+Inf\"} %d\n", name, k, h.count)
+		fmt.Fprintf(b, "%s_sum{%s} %g\n", name, k, h.sum)
+		fmt.Fprintf(b, "%s_count{%s} %d\n", name, k, h.count)
+	}
+}
+
+// Write writes the metrics, and those of the pools and coalescer, in the
+// Prometheus text format.
+func (m *Metrics) Write(b *strings.Builder, pools WorkerPools, coalescer *Coalescer) {
+	m.mu.Lock()
+	writeValues(b, "das_http_requests_total", "counter",
+		"Requests by route and status code.", m.requests)
+	writeHistograms(b, "das_http_request_duration_seconds",
+		"Time taken to answer requests.", m.latency)
+	writeHistograms(b, "das_queue_wait_seconds",
+		"Time requests waited for a free worker.", m.wait)
+	writeHistograms(b, "das_worker_spawn_duration_seconds",
+		"Time taken to start workers, to replace dead ones or scale up.", m.spawn)
+	writeValues(b, "das_worker_timeout_kills_total", "counter",
+		"Workers killed for not answering in time.", m.kills)
+	writeValues(b, "das_worker_recycles_total", "counter",
+		"Workers replaced for failing a health probe.", m.recycles)
+	writeHistograms(b, "das_stage_duration_seconds",
+		"Time workers spent in each stage of an operation.", m.stages)
+	writeValues(b, "das_cached_responses_total", "counter",
+		"Responses served from the workers' caches.", m.cached)
+	m.mu.Unlock()
+
+	// Measured by the pools and coalescer themselves
+	depth := map[string]int{}
+	rejected := map[string]int{}
+	timedOut := map[string]int{}
+	workers := map[string]int{}
+	starting := map[string]int{}
+	scaleUps := map[string]int{}
+	scaleDowns := map[string]int{}
+	rss := map[string]int64{}
+	served := map[string]int64{}
+	for _, name := range sortedKeys(pools) {
+		pool := pools[name]
+		class := labels{"class", name}.String()
+		queue := pool.QueueStats()
+		depth[class] = queue.Depth
+		rejected[class] = queue.Rejected
+		timedOut[class] = queue.TimedOut
+		scale := pool.ScaleStats()
+		workers[class] = scale.Workers
+		starting[class] = scale.Starting
+		scaleUps[class] = scale.ScaleUps
+		scaleDowns[class] = scale.ScaleDowns
+		for _, w := range pool.Workers() {
+			worker := labels{"class", name, "pid", strconv.Itoa(w.Pid())}.String()
+			served[worker] = w.requests.Load()
+			if bytes, err := w.RSS(); err == nil {
+				rss[worker] = bytes
+			}
+		}
+	}
+	writeValues(b, "das_queue_depth", "gauge",
+		"Requests waiting for a free worker.", depth)
+	writeValues(b, "das_queue_rejected_total", "counter",
+		"Requests turned away as the queue was full.", rejected)
+	writeValues(b, "das_queue_timed_out_total", "counter",
+		"Requests that gave up waiting for a free worker.", timedOut)
+	writeValues(b, "das_workers", "gauge",
+		"Workers in each pool, including dead ones being replaced.", workers)
+	writeValues(b, "das_workers_starting", "gauge",
+		"Workers being started to scale up.", starting)
+	writeValues(b, "das_scale_ups_total", "counter",
+		"Workers started to scale up.", scaleUps)
+	writeValues(b, "das_scale_downs_total", "counter",
+		"Idle workers retired to scale down.", scaleDowns)
+	writeValues(b, "das_worker_rss_bytes", "gauge",
+		"Memory resident in each worker.", rss)
+	writeValues(b, "das_worker_requests_total", "counter",
+		"Requests sent to each worker.", served)
+
+	run := map[string]int{}
+	coalesced := map[string]int{}
+	for op, stats := range coalescer.Stats() {
+		operation := labels{"operation", op}.String()
+		run[operation] = stats.Run
+		coalesced[operation] = stats.Coalesced
+	}
+	writeValues(b, "das_requests_run_total", "counter",
+		"Requests run by a worker.", run)
+	writeValues(b, "das_requests_coalesced_total", "counter",
+		"Requests that shared the response of an identical request.", coalesced)
+}
+
+// HandleMetrics exposes the metrics in the Prometheus text format.
+func HandleMetrics(c *gin.Context) {
+	var b strings.Builder
+	metrics.Write(&b, workerPools, coalescer)
+	c.Data(http.StatusOK, "text/plain; version=0.0.4; charset=utf-8", []byte(b.String()))
+}
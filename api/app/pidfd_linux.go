@@ -0,0 +1,53 @@
+//go:build linux
+
+package main
+
+import (
+	"os"
+	"sync"
+
+	"golang.org/x/sys/unix"
+)
+
+// processHandle refers to a process that is not a child of the server
+// through a pidfd. Unlike its PID, which the system may give to an
+// unrelated process once it has exited and been reaped, the pidfd keeps
+// referring to the same process.
+type processHandle struct {
+	mu sync.Mutex
+	fd int // -1 once closed
+}
+
+// openProcess takes a handle to the process with the PID, which must still
+// be running.
+func openProcess(pid int) (*processHandle, error) {
+	fd, err := unix.PidfdOpen(pid, 0)
+	if err != nil {
+		return nil, err
+	}
+	return &processHandle{fd: fd}, nil
+}
+
+// Kill kills the process if it is still running.
+func (h *processHandle) Kill() error {
+	h.mu.Lock()
+	defer h.mu.Unlock()
+	if h.fd < 0 {
+		return os.ErrProcessDone
+	}
+	err := unix.PidfdSendSignal(h.fd, unix.SIGKILL, nil, 0)
+	if err == unix.ESRCH {
+		return os.ErrProcessDone
+	}
+	return err
+}
+
+// Close frees the pidfd. The process can no longer be killed through it.
+func (h *processHandle) Close() {
+	h.mu.Lock()
+	defer h.mu.Unlock()
+	if h.fd >= 0 {
+		unix.Close(h.fd)
+		h.fd = -1
+	}
+}
@@ -0,0 +1,32 @@
+//go:build !linux
+
+package main
+
+import "os"
+
+// processHandle refers to a process that is not a child of the server.
+// Without pidfds it is only known by its PID, which the system may give to
+// an unrelated process once it has exited and been reaped.
+type processHandle struct {
+	process *os.Process
+}
+
+// openProcess takes a handle to the process with the PID, which must still
+// be running.
+func openProcess(pid int) (*processHandle, error) {
+	process, err := os.FindProcess(pid)
+	if err != nil {
+		return nil, err
+	}
+	return &processHandle{process: process}, nil
+}
+
+// Kill kills the process if it is still running.
+func (h *processHandle) Kill() error {
+	return h.process.Kill()
+}
+
+// Close frees the handle.
+func (h *processHandle) Close() {
+	h.process.Release()
+}
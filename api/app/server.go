@@ -11,6 +11,53 @@ const (
 	Timeout        = 1200 * time.Millisecond
 	GraphTimeout   = 2000 * time.Millisecond
 	Graph3DTimeout = 2500 * time.Millisecond
+	// Workers abort requests themselves once their deadline passes. They
+	// are only killed if they still have not answered after this much more.
+	KillGrace = 500 * time.Millisecond
+	// Requests wait for a free worker for up to this fraction of their
+	// timeout before they are turned away
+	QueueWaitFraction = 0.5
+)
+
+// PoolClass is a class of operations. Each class has its own pool of
+// workers and queue, so that slow graphs cannot hold up quick commands.
+type PoolClass struct {
+	Name string
+	// The pool grows and shrinks between these with demand. Growing is
+	// also limited by the budget of workers shared by all pools.
+	MinWorkers int
+	MaxWorkers int
+	// Workers idle for this long are retired, down to the minimum
+	IdleCooldown time.Duration
+	// Workers with more memory resident than this, in bytes, are replaced.
+	// 0 means no limit.
+	MaxRSS   int64
+	MaxQueue int // Requests that may wait for a worker at once
+	Timeout  time.Duration
+}
+
+var (
+	TextClass = PoolClass{
+		Name: "text", MinWorkers: 1, MaxWorkers: 2,
+		IdleCooldown: 5 * time.Minute, MaxRSS: 512 << 20,
+		MaxQueue: 32, Timeout: Timeout,
+	}
+	AlgebraClass = PoolClass{
+		Name: "algebra", MinWorkers: 1, MaxWorkers: 4,
+		IdleCooldown: 5 * time.Minute, MaxRSS: 512 << 20,
+		MaxQueue: 32, Timeout: Timeout,
+	}
+	GraphClass = PoolClass{
+		Name: "graph", MinWorkers: 1, MaxWorkers: 4,
+		IdleCooldown: 5 * time.Minute, MaxRSS: 768 << 20,
+		MaxQueue: 16, Timeout: GraphTimeout,
+	}
+	Graph3DClass = PoolClass{
+		Name: "graph3d", MinWorkers: 1, MaxWorkers: 2,
+		IdleCooldown: 5 * time.Minute, MaxRSS: 768 << 20,
+		MaxQueue: 8, Timeout: Graph3DTimeout,
+	}
+	PoolClasses = []PoolClass{TextClass, AlgebraClass, GraphClass, Graph3DClass}
 )
 
 func SetupRouter() *gin.Engine {
@@ -19,34 +66,36 @@ func SetupRouter() *gin.Engine {
 	router.GET("/health", func(c *gin.Context) {
 		c.JSON(http.StatusOK, gin.H{"status": "ok"})
 	})
+	router.GET("/ready", HandleReady)
+	router.GET("/metrics", HandleMetrics)
 
 	// Algebra
-	router.POST("/evaluate", HandleOperation("evaluate_expression", Timeout))
-	router.POST("/expand", HandleOperation("expand_expression", Timeout))
-	router.POST("/factor", HandleOperation("factor_expression", Timeout))
-	router.POST("/simplify", HandleOperation("simplify_expression", Timeout))
+	router.POST("/evaluate", HandleOperation("evaluate_expression", AlgebraClass))
+	router.POST("/expand", HandleOperation("expand_expression", AlgebraClass))
+	router.POST("/factor", HandleOperation("factor_expression", AlgebraClass))
+	router.POST("/simplify", HandleOperation("simplify_expression", AlgebraClass))
 
 	// Calculus
-	router.POST("/derive", HandleOperation("derive_expression", Timeout))
-	router.POST("/integrate-definite", HandleOperation("integrate_definite_expression", Timeout))
-	router.POST("/integrate-indefinite", HandleOperation("integrate_indefinite_expression", Timeout))
-	router.POST("/limit", HandleOperation("limit_expression", Timeout))
+	router.POST("/derive", HandleOperation("derive_expression", AlgebraClass))
+	router.POST("/integrate-definite", HandleOperation("integrate_definite_expression", AlgebraClass))
+	router.POST("/integrate-indefinite", HandleOperation("integrate_indefinite_expression", AlgebraClass))
+	router.POST("/limit", HandleOperation("limit_expression", AlgebraClass))
 
 	// Solvers
-	router.POST("/solve", HandleOperation("solve_equation", Timeout))
-	router.POST("/linsolve", HandleOperation("solve_linear_system", Timeout))
+	router.POST("/solve", HandleOperation("solve_equation", AlgebraClass))
+	router.POST("/linsolve", HandleOperation("solve_linear_system", AlgebraClass))
 
 	// Graphs
-	router.POST("/graph-func-single", HandleOperation("graph_func_single", GraphTimeout))
-	router.POST("/graph-func-multiple", HandleOperation("graph_func_multiple", GraphTimeout))
-	router.POST("/graph-rel-single", HandleOperation("graph_rel_single", GraphTimeout))
-	router.POST("/graph-rel-multiple", HandleOperation("graph_rel_multiple", GraphTimeout))
-	router.POST("/graph-parametric", HandleOperation("graph_parametric", GraphTimeout))
-	router.POST("/graph-expr-single", HandleOperation("graph_expr_single", Graph3DTimeout))
-	router.POST("/graph-expr-multiple", HandleOperation("graph_expr_multiple", Graph3DTimeout))
+	router.POST("/graph-func-single", HandleOperation("graph_func_single", GraphClass))
+	router.POST("/graph-func-multiple", HandleOperation("graph_func_multiple", GraphClass))
+	router.POST("/graph-rel-single", HandleOperation("graph_rel_single", GraphClass))
+	router.POST("/graph-rel-multiple", HandleOperation("graph_rel_multiple", GraphClass))
+	router.POST("/graph-parametric", HandleOperation("graph_parametric", GraphClass))
+	router.POST("/graph-expr-single", HandleOperation("graph_expr_single", Graph3DClass))
+	router.POST("/graph-expr-multiple", HandleOperation("graph_expr_multiple", Graph3DClass))
 
 	// Misc
-	router.POST("/display", HandleOperation("display_text", Timeout))
+	router.POST("/display", HandleOperation("display_text", TextClass))
 
 	return router
 }
@@ -2,6 +2,7 @@ package main
 
 import (
 	"bufio"
+	"encoding/binary"
 	"encoding/json"
 	"fmt"
 	"io"
@@ -9,48 +10,186 @@ import (
 	"os/exec"
 	"path/filepath"
 	"runtime"
+	"strconv"
+	"strings"
 	"sync"
+	"sync/atomic"
 	"time"
 )
 
+// StartupTimeout bounds how long a new worker may take to import its
+// dependencies and warm up before it reports that it is ready.
+const StartupTimeout = 30 * time.Second
+
+// MaxSegmentSize caps the size of a single frame segment so that a corrupt
+// length prefix cannot make the server allocate an arbitrary amount.
+const MaxSegmentSize = 64 << 20
+
+// Frame is a message from a worker: a JSON header holding everything but
+// the image, the raw PNG image (empty if there is none) and the JSON stats
+// of the request (empty if there are none).
+// See scripts/protocol.py for the wire format.
+type Frame struct {
+	Header []byte
+	Image  []byte
+	Stats  []byte
+}
+
+// PingStats are a worker's answer to a health probe.
+type PingStats struct {
+	Status  string `json:"status"`
+	RSS     int64  `json:"rss"` // Bytes resident now
+	PeakRSS int64  `json:"peak_rss"`
+}
+
+// FrameStats are the measurements a worker reports for a request.
+type FrameStats struct {
+	Stages map[string]float64 `json:"stages"` // Seconds spent in each stage
+	Cached bool               `json:"cached"`
+}
+
+// readSegment reads one length-prefixed segment of a frame.
+func readSegment(r *bufio.Reader) ([]byte, error) {
+	var prefix [4]byte
+	if _, err := io.ReadFull(r, prefix[:]); err != nil {
+		return nil, err
+	}
+	size := binary.BigEndian.Uint32(prefix[:])
+	if size > MaxSegmentSize {
+		return nil, fmt.Errorf("frame segment of %d bytes is too large", size)
+	}
+	data := make([]byte, size)
+	if _, err := io.ReadFull(r, data); err != nil {
+		return nil, err
+	}
+	return data, nil
+}
+
+// readFrame reads a header segment followed by an image segment and a
+// stats segment.
+func readFrame(r *bufio.Reader) (*Frame, error) {
+	header, err := readSegment(r)
+	if err != nil {
+		return nil, err
+	}
+	image, err := readSegment(r)
+	if err != nil {
+		return nil, err
+	}
+	stats, err := readSegment(r)
+	if err != nil {
+		return nil, err
+	}
+	return &Frame{Header: header, Image: image, Stats: stats}, nil
+}
+
 type Worker struct {
-	cmd    *exec.Cmd
-	stdin  io.WriteCloser
-	stdout *bufio.Reader
-	mu     sync.Mutex
-	dead   bool
+	pid     int
+	kill    func() error // Kills the process
+	stdin   io.WriteCloser
+	stdout  *bufio.Reader
+	release func() // Frees the process's resources once it has been killed
+	mu      sync.Mutex
+	// Set without holding mu, so that it can be read while a request is
+	// being served
+	dead atomic.Bool
+	// Called after each request, once the worker is free again
+	onRelease func()
+	lastUsed  time.Time // When it last finished a request, guarded by mu
+	requests  atomic.Int64
+	killOnce  sync.Once
 }
 
-func NewWorker() (*Worker, error) {
+// scriptsDir returns the directory containing the Python scripts package.
+func scriptsDir() (string, error) {
 	// Get the directory of the current source file
 	_, filename, _, ok := runtime.Caller(0)
 	if !ok {
-		return nil, fmt.Errorf("could not get source file location")
+		return "", fmt.Errorf("could not get source file location")
 	}
 	currDir := filepath.Dir(filename)
-	parentDir := filepath.Dir(currDir)
-	scriptPath := filepath.Join(parentDir, "scripts", "worker.py")
+	return filepath.Dir(currDir), nil
+}
 
-	// Create the worker
-	cmd := exec.Command("python", scriptPath)
+// startScript starts the Python script with its stdin and stdout piped.
+func startScript(script string, args ...string) (*exec.Cmd, io.WriteCloser, *bufio.Reader, error) {
+	parentDir, err := scriptsDir()
+	if err != nil {
+		return nil, nil, nil, err
+	}
+	scriptPath := filepath.Join(parentDir, "scripts", script)
+
+	cmd := exec.Command("python", append([]string{scriptPath}, args...)...)
 	cmd.Env = append(os.Environ(), fmt.Sprintf("PYTHONPATH=%s", parentDir))
 
 	stdin, err := cmd.StdinPipe()
 	if err != nil {
-		return nil, err
+		return nil, nil, nil, err
 	}
 
 	stdoutPipe, err := cmd.StdoutPipe()
 	if err != nil {
-		return nil, err
+		return nil, nil, nil, err
 	}
 
 	stdout := bufio.NewReader(stdoutPipe)
 	if err := cmd.Start(); err != nil {
+		return nil, nil, nil, err
+	}
+	return cmd, stdin, stdout, nil
+}
+
+// NewWorker starts a fresh Python worker process.
+func NewWorker() (*Worker, error) {
+	cmd, stdin, stdout, err := startScript("worker.py")
+	if err != nil {
 		return nil, err
 	}
 
-	return &Worker{cmd: cmd, stdin: stdin, stdout: stdout, dead: false}, nil
+	if _, err := waitReady(stdout, StartupTimeout); err != nil {
+		cmd.Process.Kill()
+		go cmd.Wait()
+		return nil, err
+	}
+	return &Worker{
+		pid:     cmd.Process.Pid,
+		kill:    cmd.Process.Kill,
+		stdin:   stdin,
+		stdout:  stdout,
+		release: func() { cmd.Wait() },
+	}, nil
+}
+
+// waitReady blocks until the worker has finished warming up and sent its
+// readiness message, so that no traffic is routed to a cold worker.
+// It returns the process ID the worker reported.
+func waitReady(stdout *bufio.Reader, t time.Duration) (int, error) {
+	ch := make(chan *Frame, 1)
+	go func() {
+		frame, err := readFrame(stdout)
+		if err != nil {
+			ch <- nil
+		} else {
+			ch <- frame
+		}
+	}()
+
+	select {
+	case frame := <-ch:
+		if frame == nil {
+			return 0, fmt.Errorf("worker process died before becoming ready")
+		}
+		var msg struct {
+			Status string `json:"status"`
+			Pid    int    `json:"pid"`
+		}
+		if err := json.Unmarshal(frame.Header, &msg); err != nil || msg.Status != "ready" {
+			return 0, fmt.Errorf("worker sent an invalid readiness message")
+		}
+		return msg.Pid, nil
+	case <-time.After(t):
+		return 0, fmt.Errorf("worker did not become ready within %v", t)
+	}
 }
 
 // TryAcquire attempts to lock an idle, healthy worker without blocking.
@@ -59,58 +198,111 @@ func (w *Worker) TryAcquire() bool {
 	if !w.mu.TryLock() {
 		return false
 	}
-	if w.dead {
+	if w.dead.Load() {
 		w.mu.Unlock()
 		return false
 	}
 	return true
 }
 
-func (w *Worker) SendRequest(req interface{}, t time.Duration) ([]byte, error) {
-	defer w.mu.Unlock()
-	if w.dead {
+// unlock frees the worker and lets the pool hand it to a waiting request.
+func (w *Worker) unlock() {
+	w.lastUsed = time.Now()
+	w.mu.Unlock()
+	if w.onRelease != nil {
+		w.onRelease()
+	}
+}
+
+func (w *Worker) SendRequest(req interface{}, t time.Duration) (*Frame, error) {
+	defer w.unlock()
+	if w.dead.Load() {
 		return nil, fmt.Errorf("worker is dead")
 	}
+	w.requests.Add(1)
 	data, err := json.Marshal(req)
 	if err != nil {
 		return nil, err
 	}
 	_, err = w.stdin.Write(append(data, '\n'))
 	if err != nil {
-		w.dead = true
+		w.dead.Store(true)
 		return nil, err
 	}
 
-	ch := make(chan []byte, 1)
+	ch := make(chan *Frame, 1)
 	go func() {
-		line, err := w.stdout.ReadBytes('\n')
+		frame, err := readFrame(w.stdout)
 		if err != nil {
 			ch <- nil
 		} else {
-			ch <- line
+			ch <- frame
 		}
 	}()
 
 	select {
-	case line := <-ch:
-		if line == nil {
-			w.dead = true
+	case frame := <-ch:
+		if frame == nil {
+			w.dead.Store(true)
 			return nil, fmt.Errorf("worker process died or closed pipe")
 		}
-		return line, nil
+		return frame, nil
 	case <-time.After(t):
-		w.cmd.Process.Kill()
-		w.dead = true
-		go func() {
-			w.cmd.Wait()
-			<-ch
-		}()
+		w.Kill()
 		return nil, fmt.Errorf("worker timed out and was killed")
 	}
 }
 
+// Ping sends a health probe to the worker, which must have been acquired,
+// and returns its answer and how long it took to answer.
+func (w *Worker) Ping(t time.Duration) (*PingStats, time.Duration, error) {
+	start := time.Now()
+	frame, err := w.SendRequest(map[string]interface{}{"operation": "ping"}, t)
+	elapsed := time.Since(start)
+	if err != nil {
+		return nil, elapsed, err
+	}
+	var stats PingStats
+	if err := json.Unmarshal(frame.Header, &stats); err != nil || stats.Status != "ok" {
+		return nil, elapsed, fmt.Errorf("worker sent an invalid ping response")
+	}
+	return &stats, elapsed, nil
+}
+
+// Pid returns the ID of the worker's process.
+func (w *Worker) Pid() int {
+	return w.pid
+}
+
+// RSS returns the memory the worker's process has resident, in bytes. It
+// only works where /proc is available, e.g. Linux.
+func (w *Worker) RSS() (int64, error) {
+	statm, err := os.ReadFile(fmt.Sprintf("/proc/%d/statm", w.Pid()))
+	if err != nil {
+		return 0, err
+	}
+	fields := strings.Fields(string(statm))
+	if len(fields) < 2 {
+		return 0, fmt.Errorf("unexpected /proc/%d/statm", w.Pid())
+	}
+	pages, err := strconv.ParseInt(fields[1], 10, 64)
+	if err != nil {
+		return 0, err
+	}
+	return pages * int64(os.Getpagesize()), nil
+}
+
 func (w *Worker) IsDead() bool {
-	w.mu.Lock()
-	defer w.mu.Unlock()
-	return w.dead
+	return w.dead.Load()
+}
+
+// Kill stops the worker's process without waiting for it to be idle and
+// frees its resources. Only the first call has any effect, so the process
+// is never killed or waited for twice.
+func (w *Worker) Kill() {
+	w.killOnce.Do(func() {
+		w.dead.Store(true)
+		w.kill()
+		go w.release()
+	})
 }
@@ -1,85 +1,597 @@
 package main
 
 import (
+	"errors"
+	"fmt"
+	"runtime"
+	"slices"
 	"sync"
 	"time"
 )
 
+const (
+	// How often pools check whether to start or retire a worker. They also
+	// check whenever a request has to wait.
+	ScaleInterval = time.Second
+	// Pools start another worker when this fraction of theirs are busy
+	ScaleUpBusyRatio = 0.75
+	// How often idle workers are sent a ping to check their health
+	ProbeInterval = 10 * time.Second
+	// Workers that do not answer a ping in this long are killed
+	PingTimeout = 500 * time.Millisecond
+	// Workers that answer a ping slower than this are replaced
+	MaxPingTime = 100 * time.Millisecond
+)
+
+var (
+	ErrQueueFull    = errors.New("too many requests are waiting for a worker")
+	ErrQueueTimeout = errors.New("no worker became free in time")
+)
+
+// waiter is a request waiting in the queue for a free worker.
+type waiter struct {
+	operation string
+	ready     chan *Worker
+}
+
+// QueueStats measures the queue, for sizing the pool.
+type QueueStats struct {
+	Depth     int           // Requests waiting now
+	MaxDepth  int           // Most requests that have waited at once
+	Served    int           // Requests that got a worker
+	Queued    int           // Of which had to wait for one
+	TotalWait time.Duration // Time spent waiting by all requests
+	MaxWait   time.Duration
+	Rejected  int // Turned away as the queue was full
+	TimedOut  int // Gave up waiting
+}
+
+// ScaleStats measures how a pool has grown and shrunk.
+type ScaleStats struct {
+	Workers    int // Workers now, including dead ones being replaced
+	Starting   int // Workers being started
+	ScaleUps   int
+	ScaleDowns int
+	// Time taken to start the workers added by scaling up
+	TotalSpawn time.Duration
+	MaxSpawn   time.Duration
+}
+
+// WorkerBudget caps the workers of all pools together, as they all compete
+// for the same cores.
+type WorkerBudget struct {
+	mu    sync.Mutex
+	used  int
+	limit int
+}
+
+func NewWorkerBudget(limit int) *WorkerBudget {
+	return &WorkerBudget{limit: limit}
+}
+
+// Reserve takes a place for another worker, or returns false if the budget
+// is spent.
+func (b *WorkerBudget) Reserve() bool {
+	b.mu.Lock()
+	defer b.mu.Unlock()
+	if b.used >= b.limit {
+		return false
+	}
+	b.used++
+	return true
+}
+
+// take takes places for a pool's minimum workers, which are started even
+// if they exceed the budget.
+func (b *WorkerBudget) take(num int) {
+	b.mu.Lock()
+	defer b.mu.Unlock()
+	b.used += num
+}
+
+// Release gives back the places of retired workers.
+func (b *WorkerBudget) Release(num int) {
+	b.mu.Lock()
+	defer b.mu.Unlock()
+	b.used -= num
+}
+
+// Used returns the number of places taken.
+func (b *WorkerBudget) Used() int {
+	b.mu.Lock()
+	defer b.mu.Unlock()
+	return b.used
+}
+
+// WorkerPool is the workers serving one class of operations. It grows
+// while requests wait or most workers are busy, up to the class's maximum
+// and within the budget shared by all pools, and retires workers that have
+// been idle for the class's cool-down, down to its minimum.
 type WorkerPool struct {
+	class       PoolClass
 	workers     []*Worker
 	mu          sync.Mutex
-	next        int
-	replaceChan chan int
+	replaceChan chan *Worker
+	spawner     *Spawner
+	budget      *WorkerBudget
+	minWorkers  int
+	maxWorkers  int
+	starting    int
+	scaleChan   chan struct{}
+	scaleStats  ScaleStats
+	// Waiting requests, in FIFO order for each operation. Operations take
+	// turns in the order they started waiting, so none can starve another.
+	queues     map[string][]*waiter
+	operations []string
+	queued     int
+	maxQueue   int
+	stats      QueueStats
 }
 
-func NewWorkerPool(num int) (*WorkerPool, error) {
+// WorkerPools maps the name of each class of operations to its pool.
+type WorkerPools map[string]*WorkerPool
+
+// NewWorkerPools starts a pool for each class, all forking their workers
+// from the same zygote. Together they have no more workers than cores,
+// unless their minimums add up to more.
+func NewWorkerPools(classes []PoolClass) (WorkerPools, error) {
+	spawner := NewSpawner()
+	minWorkers := 0
+	for _, class := range classes {
+		minWorkers += class.MinWorkers
+	}
+	budget := NewWorkerBudget(max(minWorkers, runtime.NumCPU()))
+	pools := make(WorkerPools, len(classes))
+	var mu sync.Mutex
+	var firstErr error
+	var wg sync.WaitGroup
+	for _, class := range classes {
+		wg.Add(1)
+		go func(class PoolClass) {
+			defer wg.Done()
+			pool, err := NewWorkerPool(class, spawner, budget)
+			mu.Lock()
+			defer mu.Unlock()
+			if err != nil {
+				if firstErr == nil {
+					firstErr = err
+				}
+				return
+			}
+			pools[class.Name] = pool
+		}(class)
+	}
+	wg.Wait()
+	if firstErr != nil {
+		for _, pool := range pools {
+			pool.kill()
+		}
+		spawner.Close()
+		return nil, firstErr
+	}
+	return pools, nil
+}
+
+// NewWorkerPool starts the minimum number of workers for the class of
+// operations, taking their places in the budget.
+func NewWorkerPool(class PoolClass, spawner *Spawner, budget *WorkerBudget) (*WorkerPool, error) {
+	maxWorkers := max(class.MinWorkers, class.MaxWorkers)
 	pool := &WorkerPool{
-		replaceChan: make(chan int, num),
+		class:       class,
+		replaceChan: make(chan *Worker, maxWorkers),
+		spawner:     spawner,
+		budget:      budget,
+		minWorkers:  class.MinWorkers,
+		maxWorkers:  maxWorkers,
+		scaleChan:   make(chan struct{}, 1),
+		queues:      make(map[string][]*waiter),
+		maxQueue:    class.MaxQueue,
 	}
-	// Create workers
+	// Create workers concurrently as each one spends a while warming up
+	num := class.MinWorkers
+	workers := make([]*Worker, num)
+	errs := make(chan error, num)
+	var wg sync.WaitGroup
 	for i := 0; i < num; i++ {
-		w, err := NewWorker()
-		if err != nil {
-			return nil, err
+		wg.Add(1)
+		go func(i int) {
+			defer wg.Done()
+			w, err := spawner.Spawn()
+			if err != nil {
+				errs <- err
+				return
+			}
+			workers[i] = w
+		}(i)
+	}
+	wg.Wait()
+	close(errs)
+	if err := <-errs; err != nil {
+		for _, w := range workers {
+			if w != nil {
+				w.Kill()
+			}
 		}
-		pool.workers = append(pool.workers, w)
+		return nil, fmt.Errorf("starting %s workers: %w", class.Name, err)
+	}
+	budget.take(num)
+	for _, w := range workers {
+		pool.addLocked(w)
 	}
 	// Start async replacer
 	go pool.asyncReplacer()
-	// Start periodic health checker
-	go pool.periodicHealthCheck()
+	// Start periodic health prober
+	go pool.periodicProbe()
+	// Start autoscaler
+	go pool.autoscaler()
 	return pool, nil
 }
 
-// asyncReplacer listens for replacement requests and replaces dead workers
+// kill stops all of the pool's workers and gives back their places.
+func (p *WorkerPool) kill() {
+	p.mu.Lock()
+	defer p.mu.Unlock()
+	for _, w := range p.workers {
+		w.Kill()
+	}
+	p.budget.Release(len(p.workers))
+	p.workers = nil
+}
+
+// addLocked puts a new worker in the pool, handing it to a waiting request
+// if there is one. p.mu must be held.
+func (p *WorkerPool) addLocked(w *Worker) {
+	w.onRelease = p.dispatch
+	w.lastUsed = time.Now()
+	p.workers = append(p.workers, w)
+	p.dispatchLocked()
+}
+
+// asyncReplacer listens for replacement requests and replaces dead workers.
+// Spawn only returns once the replacement is warm, so the dead worker
+// stays in place (and is skipped by GetWorker) until then.
 func (p *WorkerPool) asyncReplacer() {
-	for idx := range p.replaceChan {
-		newWorker, err := NewWorker()
-		if err == nil {
-			p.mu.Lock()
-			p.workers[idx] = newWorker
-			p.mu.Unlock()
+	for old := range p.replaceChan {
+		// The worker may have been replaced or retired already
+		p.mu.Lock()
+		queued := slices.Contains(p.workers, old)
+		p.mu.Unlock()
+		if !queued {
+			continue
 		}
-		// If err, just skip; will retry on next trigger
+		start := time.Now()
+		newWorker, err := p.spawner.Spawn()
+		if err != nil {
+			continue // Will retry on next trigger
+		}
+		metrics.ObserveSpawn(p.class.Name, "respawn", time.Since(start))
+		p.mu.Lock()
+		if idx := slices.Index(p.workers, old); idx >= 0 {
+			p.workers = slices.Delete(p.workers, idx, idx+1)
+			p.addLocked(newWorker)
+		} else {
+			newWorker.Kill()
+		}
+		p.mu.Unlock()
 	}
 }
 
-// periodicHealthCheck triggers replacement for any dead workers every 30s
-func (p *WorkerPool) periodicHealthCheck() {
-	ticker := time.NewTicker(30 * time.Second)
+// autoscaler checks whether to start or retire a worker every
+// ScaleInterval, and whenever a request has to wait.
+func (p *WorkerPool) autoscaler() {
+	ticker := time.NewTicker(ScaleInterval)
 	defer ticker.Stop()
-	for range ticker.C {
-		p.mu.Lock()
-		for i, w := range p.workers {
-			if w.IsDead() {
-				select {
-				case p.replaceChan <- i:
-				default:
-				}
+	for {
+		select {
+		case <-ticker.C:
+		case <-p.scaleChan:
+		}
+		p.scale()
+	}
+}
+
+// scale starts a worker if requests are waiting or most workers are busy
+// and the budget allows it, or otherwise retires the worker that has been
+// idle the longest if it has been idle for the cool-down. Dead workers
+// being replaced do not count towards the minimum.
+func (p *WorkerPool) scale() {
+	p.mu.Lock()
+	defer p.mu.Unlock()
+	live, busy := 0, 0
+	var idle *Worker
+	for _, w := range p.workers {
+		if w.IsDead() {
+			continue
+		}
+		live++
+		// Locking the worker directly keeps it from being handed out
+		// until it has been checked
+		if !w.TryAcquire() {
+			busy++
+		} else if idle == nil || w.lastUsed.Before(idle.lastUsed) {
+			if idle != nil {
+				idle.mu.Unlock()
 			}
+			idle = w
+		} else {
+			w.mu.Unlock()
 		}
-		p.mu.Unlock()
+	}
+	if p.queued > 0 || float64(busy) >= ScaleUpBusyRatio*float64(live) {
+		if len(p.workers)+p.starting < p.maxWorkers && p.budget.Reserve() {
+			p.starting++
+			go p.grow()
+		}
+	} else if idle != nil && live > p.minWorkers &&
+		time.Since(idle.lastUsed) >= p.class.IdleCooldown {
+		p.workers = slices.DeleteFunc(p.workers, func(w *Worker) bool {
+			return w == idle
+		})
+		p.scaleStats.ScaleDowns++
+		p.budget.Release(1)
+		idle.Kill()
+		return
+	}
+	if idle != nil {
+		idle.mu.Unlock()
 	}
 }
 
-func (p *WorkerPool) GetWorker() *Worker {
+// grow starts another worker, measuring how long it took.
+func (p *WorkerPool) grow() {
+	start := time.Now()
+	w, err := p.spawner.Spawn()
+	elapsed := time.Since(start)
 	p.mu.Lock()
 	defer p.mu.Unlock()
-	n := len(p.workers)
-	for i := 0; i < n; i++ {
-		idx := (p.next + i) % n
-		w := p.workers[idx]
+	p.starting--
+	if err != nil {
+		p.budget.Release(1)
+		return // The next check will try again if still needed
+	}
+	p.scaleStats.ScaleUps++
+	p.scaleStats.TotalSpawn += elapsed
+	p.scaleStats.MaxSpawn = max(p.scaleStats.MaxSpawn, elapsed)
+	metrics.ObserveSpawn(p.class.Name, "scale", elapsed)
+	p.addLocked(w)
+}
+
+// Workers returns the pool's current workers.
+func (p *WorkerPool) Workers() []*Worker {
+	p.mu.Lock()
+	defer p.mu.Unlock()
+	return slices.Clone(p.workers)
+}
+
+// ScaleStats returns the measurements of scaling so far.
+func (p *WorkerPool) ScaleStats() ScaleStats {
+	p.mu.Lock()
+	defer p.mu.Unlock()
+	stats := p.scaleStats
+	stats.Workers = len(p.workers)
+	stats.Starting = p.starting
+	return stats
+}
+
+// periodicProbe probes the workers every ProbeInterval.
+func (p *WorkerPool) periodicProbe() {
+	ticker := time.NewTicker(ProbeInterval)
+	defer ticker.Stop()
+	for range ticker.C {
+		p.probe()
+	}
+}
+
+// probe sends a ping to each idle worker, and replaces the workers that are
+// dead, wedged, slow or using more memory than their class allows before
+// users' requests reach them. Busy workers are probed next time.
+func (p *WorkerPool) probe() {
+	for _, w := range p.Workers() {
 		if w.IsDead() {
-			select {
-			case p.replaceChan <- idx:
-			default:
+			p.replace(w)
+			continue
+		}
+		if !w.TryAcquire() {
+			continue
+		}
+		stats, elapsed, err := w.Ping(PingTimeout)
+		reason := ""
+		switch {
+		case err != nil:
+			reason = "unresponsive" // Already killed or dead
+		case elapsed > MaxPingTime:
+			reason = "slow"
+		case p.class.MaxRSS > 0 && stats.RSS > p.class.MaxRSS:
+			reason = "memory"
+		default:
+			continue
+		}
+		metrics.CountRecycle(p.class.Name, reason)
+		// A worker that timed out has been killed already. Otherwise it may
+		// have been handed to a request after the ping, in which case it
+		// is recycled once it is idle at the next probe
+		if !w.IsDead() {
+			if !w.TryAcquire() {
+				continue
 			}
+			w.Kill()
+		}
+		p.replace(w)
+	}
+}
+
+// replace queues the dead worker for replacement.
+func (p *WorkerPool) replace(w *Worker) {
+	select {
+	case p.replaceChan <- w:
+	default:
+	}
+}
+
+// Available returns the number of live workers, which are warm, and how
+// many of them are idle.
+func (p *WorkerPool) Available() (live int, idle int) {
+	p.mu.Lock()
+	defer p.mu.Unlock()
+	for _, w := range p.workers {
+		if w.IsDead() {
+			continue
+		}
+		live++
+		// Unlocked directly, as no request can be waiting while p.mu is
+		// held and a worker is idle
+		if w.TryAcquire() {
+			idle++
+			w.mu.Unlock()
+		}
+	}
+	return live, idle
+}
+
+// acquireLocked locks the first idle worker, or returns nil if they are
+// all busy. Always preferring the first workers leaves the spare ones idle
+// so that they can be retired. Dead workers are queued for replacement.
+// p.mu must be held.
+func (p *WorkerPool) acquireLocked() *Worker {
+	for _, w := range p.workers {
+		if w.IsDead() {
+			p.replace(w)
 			continue
 		}
 		if w.TryAcquire() {
-			p.next = (idx + 1) % n
 			return w
 		}
 	}
 	return nil
 }
+
+// dispatch hands free workers to waiting requests. Workers call it each
+// time they finish a request.
+func (p *WorkerPool) dispatch() {
+	p.mu.Lock()
+	defer p.mu.Unlock()
+	p.dispatchLocked()
+}
+
+func (p *WorkerPool) dispatchLocked() {
+	for p.queued > 0 {
+		w := p.acquireLocked()
+		if w == nil {
+			return
+		}
+		// Take the first waiter of the operation whose turn it is
+		op := p.operations[0]
+		p.operations = p.operations[1:]
+		wt := p.queues[op][0]
+		p.queues[op] = p.queues[op][1:]
+		if len(p.queues[op]) > 0 {
+			p.operations = append(p.operations, op)
+		} else {
+			delete(p.queues, op)
+		}
+		p.queued--
+		wt.ready <- w
+	}
+}
+
+// removeLocked takes a waiter that gave up out of the queue. It returns
+// false if the waiter has already been handed a worker.
+func (p *WorkerPool) removeLocked(wt *waiter) bool {
+	queue := p.queues[wt.operation]
+	for i, other := range queue {
+		if other != wt {
+			continue
+		}
+		p.queues[wt.operation] = append(queue[:i:i], queue[i+1:]...)
+		if len(p.queues[wt.operation]) == 0 {
+			delete(p.queues, wt.operation)
+			for j, op := range p.operations {
+				if op == wt.operation {
+					p.operations = append(p.operations[:j:j], p.operations[j+1:]...)
+					break
+				}
+			}
+		}
+		p.queued--
+		return true
+	}
+	return false
+}
+
+// recordWait measures a request that got a worker. p.mu must be held.
+func (p *WorkerPool) recordWait(wait time.Duration, queued bool) {
+	p.stats.Served++
+	if queued {
+		p.stats.Queued++
+	}
+	p.stats.TotalWait += wait
+	p.stats.MaxWait = max(p.stats.MaxWait, wait)
+	metrics.ObserveQueueWait(p.class.Name, wait)
+}
+
+// GetWorker returns a locked idle worker, waiting up to wait for one to
+// become free if they are all busy. Waiting requests are served in FIFO
+// order for each operation, and operations take turns. It returns
+// ErrQueueFull if too many requests are already waiting, and
+// ErrQueueTimeout if no worker became free in time.
+func (p *WorkerPool) GetWorker(operation string, wait time.Duration) (*Worker, error) {
+	start := time.Now()
+	p.mu.Lock()
+	// Only take a worker straight away if no one is waiting before us
+	if p.queued == 0 {
+		if w := p.acquireLocked(); w != nil {
+			p.recordWait(0, false)
+			p.mu.Unlock()
+			return w, nil
+		}
+	}
+	if p.queued >= p.maxQueue {
+		p.stats.Rejected++
+		p.mu.Unlock()
+		return nil, ErrQueueFull
+	}
+	wt := &waiter{operation: operation, ready: make(chan *Worker, 1)}
+	if len(p.queues[operation]) == 0 {
+		p.operations = append(p.operations, operation)
+	}
+	p.queues[operation] = append(p.queues[operation], wt)
+	p.queued++
+	p.stats.MaxDepth = max(p.stats.MaxDepth, p.queued)
+	p.dispatchLocked()
+	p.mu.Unlock()
+	// Start another worker if there is room for one
+	select {
+	case p.scaleChan <- struct{}{}:
+	default:
+	}
+
+	timer := time.NewTimer(wait)
+	defer timer.Stop()
+	select {
+	case w := <-wt.ready:
+		p.mu.Lock()
+		p.recordWait(time.Since(start), true)
+		p.mu.Unlock()
+		return w, nil
+	case <-timer.C:
+		p.mu.Lock()
+		if p.removeLocked(wt) {
+			p.stats.TimedOut++
+			p.mu.Unlock()
+			return nil, ErrQueueTimeout
+		}
+		// A worker was handed over just as the wait ran out
+		p.recordWait(time.Since(start), true)
+		p.mu.Unlock()
+		return <-wt.ready, nil
+	}
+}
+
+// QueueStats returns the measurements of the queue so far.
+func (p *WorkerPool) QueueStats() QueueStats {
+	p.mu.Lock()
+	defer p.mu.Unlock()
+	stats := p.stats
+	stats.Depth = p.queued
+	return stats
+}
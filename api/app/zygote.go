@@ -0,0 +1,203 @@
+package main
+
+import (
+	"bufio"
+	"fmt"
+	"io"
+	"net"
+	"os"
+	"os/exec"
+	"path/filepath"
+	"sync"
+	"time"
+)
+
+// UseZygote forks workers from a warm zygote process instead of starting a
+// fresh interpreter for each one. Workers are started directly whenever
+// the zygote is unavailable.
+const UseZygote = true
+
+// Zygote is a long-lived, warmed up Python parent process that forks a new
+// worker for every connection made to its Unix socket. Forking from it
+// skips the imports and warm-up a fresh interpreter has to do, and the
+// children share the parent's memory pages copy-on-write.
+type Zygote struct {
+	cmd        *exec.Cmd
+	stdin      io.WriteCloser // Closing it tells the zygote to exit
+	socketDir  string
+	socketPath string
+	mu         sync.Mutex
+	dead       bool
+}
+
+func NewZygote() (*Zygote, error) {
+	socketDir, err := os.MkdirTemp("", "das-zygote-")
+	if err != nil {
+		return nil, err
+	}
+	socketPath := filepath.Join(socketDir, "zygote.sock")
+
+	cmd, stdin, stdout, err := startScript("zygote.py", socketPath)
+	if err != nil {
+		os.RemoveAll(socketDir)
+		return nil, err
+	}
+
+	if _, err := waitReady(stdout, StartupTimeout); err != nil {
+		cmd.Process.Kill()
+		go cmd.Wait()
+		os.RemoveAll(socketDir)
+		return nil, err
+	}
+
+	z := &Zygote{
+		cmd:        cmd,
+		stdin:      stdin,
+		socketDir:  socketDir,
+		socketPath: socketPath,
+	}
+	go func() {
+		cmd.Wait()
+		z.mu.Lock()
+		z.dead = true
+		z.mu.Unlock()
+	}()
+	return z, nil
+}
+
+// Spawn forks a new worker from the zygote.
+func (z *Zygote) Spawn() (*Worker, error) {
+	if z.IsDead() {
+		return nil, fmt.Errorf("zygote is dead")
+	}
+	conn, err := net.Dial("unix", z.socketPath)
+	if err != nil {
+		return nil, err
+	}
+	stdout := bufio.NewReader(conn)
+	pid, err := waitReady(stdout, StartupTimeout)
+	if err != nil {
+		conn.Close()
+		return nil, err
+	}
+	// The zygote reaps its children as soon as they exit, after which the
+	// PID may be reused, so the child is killed through a handle taken
+	// while it is waiting for its first request
+	process, err := openProcess(pid)
+	if err != nil {
+		conn.Close()
+		return nil, err
+	}
+	return &Worker{
+		pid:    pid,
+		kill:   process.Kill,
+		stdin:  conn,
+		stdout: stdout,
+		release: func() {
+			conn.Close()
+			process.Close()
+		},
+	}, nil
+}
+
+func (z *Zygote) IsDead() bool {
+	z.mu.Lock()
+	defer z.mu.Unlock()
+	return z.dead
+}
+
+// Close stops the zygote. Workers it has already forked keep running.
+func (z *Zygote) Close() {
+	z.stdin.Close()
+	os.RemoveAll(z.socketDir)
+}
+
+// ZygoteRetryInterval is how long the spawner waits before restarting a
+// zygote that failed to start.
+const ZygoteRetryInterval = 30 * time.Second
+
+// Spawner starts the workers of all pools, forking them from one shared
+// zygote when possible.
+type Spawner struct {
+	zygote     *Zygote
+	restarting bool      // A restart is in progress
+	retryAt    time.Time // A failed restart is not retried before then
+	closed     bool
+	mu         sync.Mutex
+}
+
+func NewSpawner() *Spawner {
+	s := &Spawner{}
+	if UseZygote {
+		z, err := NewZygote()
+		if err != nil {
+			fmt.Printf("Zygote unavailable, starting workers directly: %v\n", err)
+			s.retryAt = time.Now().Add(ZygoteRetryInterval)
+		}
+		s.zygote = z
+	}
+	return s
+}
+
+// Spawn creates a ready worker, forking it from the zygote when possible
+// and starting a fresh process otherwise.
+func (s *Spawner) Spawn() (*Worker, error) {
+	if !UseZygote {
+		return NewWorker()
+	}
+	if z := s.liveZygote(); z != nil {
+		if w, err := z.Spawn(); err == nil {
+			return w, nil
+		}
+	}
+	return NewWorker()
+}
+
+// liveZygote returns the zygote, or nil if it is dead. A dead zygote is
+// restarted in the background, by one restart at a time and at most once
+// every ZygoteRetryInterval after a failure, so that spawning never waits
+// for it.
+func (s *Spawner) liveZygote() *Zygote {
+	s.mu.Lock()
+	defer s.mu.Unlock()
+	if s.zygote != nil && !s.zygote.IsDead() {
+		return s.zygote
+	}
+	if s.zygote != nil {
+		s.zygote.Close()
+		s.zygote = nil
+	}
+	if !s.restarting && !s.closed && !time.Now().Before(s.retryAt) {
+		s.restarting = true
+		go s.restart()
+	}
+	return nil
+}
+
+func (s *Spawner) restart() {
+	z, err := NewZygote()
+	s.mu.Lock()
+	defer s.mu.Unlock()
+	s.restarting = false
+	if err != nil {
+		fmt.Printf("Zygote restart failed, retrying in %v: %v\n", ZygoteRetryInterval, err)
+		s.retryAt = time.Now().Add(ZygoteRetryInterval)
+		return
+	}
+	if s.closed {
+		z.Close()
+		return
+	}
+	s.zygote = z
+}
+
+// Close stops the zygote, if there is one.
+func (s *Spawner) Close() {
+	s.mu.Lock()
+	defer s.mu.Unlock()
+	s.closed = true
+	if s.zygote != nil {
+		s.zygote.Close()
+		s.zygote = nil
+	}
+}
@@ -1,9 +1,11 @@
 import sympy as sp
 import humanize
 
+from scripts.arithmetic import NotArithmetic, evaluate_arithmetic
 from scripts.parser import parse_expr
 from scripts.renderer import render_tex
-from scripts.printer import make_pretty
+from scripts.governor import govern
+from scripts.printer import make_latex, make_pretty
 from scripts.utils import Result, Error, Response
 
 
@@ -11,7 +13,10 @@ def evaluate_expression(args: dict) -> Response:
     try:
         raw_expr = args['expr']
         expr = parse_expr(raw_expr)  # Don't evaluate to display original
-        res = parse_expr(raw_expr, evaluate=True)
+        try:
+            res = evaluate_arithmetic(expr)
+        except NotArithmetic:
+            res = parse_expr(raw_expr, evaluate=True)
         pretty = {"expr": make_pretty(expr)}
         symbol = '='
         try:
@@ -31,8 +36,8 @@ def evaluate_expression(args: dict) -> Response:
                 symbol = r'\approx'
         except TypeError:
             pass  # As not a number, user probably entered a variable.
-        image = render_tex(f"${sp.latex(expr)} {symbol} {sp.latex(res)}$")
-        answer = make_pretty(res)
-        return Result(pretty, image, answer)
+        out = govern(res)
+        image = render_tex(f"${make_latex(expr)} {symbol} {out.latex}$")
+        return Result(pretty, image, out.answer, out.attachment)
     except Exception as e:
         return Error(name=type(e).__name__, message=str(e))
@@ -2,7 +2,8 @@ import sympy as sp
 
 from scripts.parser import parse_expr
 from scripts.renderer import render_tex
-from scripts.printer import make_pretty
+from scripts.governor import govern
+from scripts.printer import make_latex, make_pretty
 from scripts.utils import Result, Error, Response
 
 
@@ -12,8 +13,8 @@ def simplify_expression(args: dict) -> Response:
         expr = parse_expr(raw_expr)
         res = sp.simplify(expr)
         pretty = {"expr": make_pretty(expr)}
-        image = render_tex(f"${sp.latex(expr)} = {sp.latex(res)}$")
-        answer = make_pretty(res)
-        return Result(pretty, image, answer)
+        out = govern(res)
+        image = render_tex(f"${make_latex(expr)} = {out.latex}$")
+        return Result(pretty, image, out.answer, out.attachment)
     except Exception as e:
         return Error(name=type(e).__name__, message=str(e))
@@ -0,0 +1,269 @@
+""" Code for evaluating plain arithmetic without SymPy.
+
+Most expressions sent to be evaluated have no symbols, e.g. 2^10+3/4 or
+sin(90deg). Their unevaluated expression is evaluated directly, with exact
+integer and Fraction arithmetic for rational numbers, floats for SymPy's
+floats and mpmath for irrational numbers, in the same way as SymPy would
+evaluate them.
+
+Anything else raises NotArithmetic, and is left for SymPy to evaluate. This
+includes symbols, unsupported functions and complex numbers. It also
+includes irrational numbers SymPy may simplify exactly, such as sin(pi) = 0,
+which cannot be told apart from tiny numbers with finite precision.
+"""
+import math
+from fractions import Fraction
+from functools import reduce
+import operator
+
+import mpmath
+import sympy as sp
+
+PRECISION = 50  # Decimal digits of irrational numbers
+FLOAT_PRECISION = 53  # Bits of SymPy's floats
+MAX_BITS = 10_000  # Of the numerator and denominator of a rational number
+MAX_FACTORIAL = 1000
+# The magnitudes of irrational numbers that are trusted to not be 0 or oo
+MIN_MAGNITUDE = mpmath.mpf(10) ** -(PRECISION - 15)
+MAX_MAGNITUDE = mpmath.mpf(10) ** (PRECISION - 15)
+# Larger arguments leave too few digits for the fractional part, on which
+# periodic functions depend, e.g. cos(715^18)
+MAX_ARGUMENT = 10 ** 20
+
+Number = int | Fraction | float | mpmath.mpf
+
+FUNCTIONS = {
+    sp.sin: mpmath.sin, sp.cos: mpmath.cos, sp.tan: mpmath.tan,
+    sp.cot: mpmath.cot, sp.sec: mpmath.sec, sp.csc: mpmath.csc,
+    sp.asin: mpmath.asin, sp.acos: mpmath.acos, sp.atan: mpmath.atan,
+    sp.acot: mpmath.acot, sp.asec: mpmath.asec, sp.acsc: mpmath.acsc,
+    sp.sinh: mpmath.sinh, sp.cosh: mpmath.cosh, sp.tanh: mpmath.tanh,
+    sp.coth: mpmath.coth, sp.sech: mpmath.sech, sp.csch: mpmath.csch,
+    sp.asinh: mpmath.asinh, sp.acosh: mpmath.acosh, sp.atanh: mpmath.atanh,
+    sp.acoth: mpmath.acoth, sp.asech: mpmath.asech, sp.acsch: mpmath.acsch,
+    sp.exp: mpmath.exp,
+}
+
+
+class NotArithmetic(Exception):
+    """ Raised when an expression is not plain arithmetic, so it has to be
+    evaluated by SymPy.
+    """
+    pass
+
+
+def _rational(value: int | Fraction) -> int | Fraction:
+    """ Checks that the rational number is not too large to work with. """
+    if max(value.numerator.bit_length(),
+           value.denominator.bit_length()) > MAX_BITS:
+        raise NotArithmetic("Too large")
+    return value
+
+
+def _float(value: Number) -> float:
+    """ Returns the number as a float, which must be in the range SymPy's
+    floats and Python's floats share.
+    """
+    if isinstance(value, (complex, mpmath.mpc)):
+        raise NotArithmetic("Complex")
+    res = float(value)
+    if not math.isfinite(res) or (0 < abs(res) < 2.2250738585072014e-308):
+        raise NotArithmetic("Out of range")
+    if res == 0 and value != 0:
+        raise NotArithmetic("Out of range")
+    return res
+
+
+def _irrational(value: Number) -> mpmath.mpf:
+    """ Checks that the irrational number is real and not so close to 0 or
+    oo that SymPy may find it to be exactly 0 or oo, e.g. tan(pi/2).
+    """
+    if not isinstance(value, mpmath.mpf) or not mpmath.isfinite(value):
+        raise NotArithmetic("Complex or infinite")
+    if value != 0 and not MIN_MAGNITUDE < abs(value) < MAX_MAGNITUDE:
+        raise NotArithmetic("Possibly 0 or oo")
+    return value
+
+
+def _mpf(value: Number) -> mpmath.mpf:
+    if isinstance(value, Fraction):
+        return mpmath.mpf(value.numerator) / value.denominator
+    return mpmath.mpf(value)
+
+
+def _apply(op, a: Number, b: Number) -> Number:
+    """ Applies the binary operator to two numbers. Irrational numbers are
+    worked with at the full precision, floats at the precision of a float
+    and rational numbers exactly.
+    """
+    if isinstance(a, mpmath.mpf) or isinstance(b, mpmath.mpf):
+        return _irrational(op(_mpf(a), _mpf(b)))
+    if isinstance(a, float) or isinstance(b, float):
+        return _float(op(_float(a), _float(b)))
+    return _rational(op(a, b))
+
+
+def _fold(op, values: list[Number]) -> Number:
+    """ Combines the values of a sum or product. As in SymPy, the rational
+    numbers and floats are combined in order first, and the irrational
+    numbers after.
+    """
+    numbers = [v for v in values if not isinstance(v, mpmath.mpf)]
+    irrationals = [v for v in values if isinstance(v, mpmath.mpf)]
+    values = ([reduce(lambda a, b: _apply(op, a, b), numbers)]
+              if numbers else []) + irrationals
+    return reduce(lambda a, b: _apply(op, a, b), values)
+
+
+def _root(base: int | Fraction, exp: Fraction) -> int | Fraction | None:
+    """ Returns the exact root of the rational number, e.g. 8^(2/3) => 4, or
+    None if it is irrational.
+    """
+    num, num_exact = sp.integer_nthroot(base.numerator, exp.denominator)
+    den, den_exact = sp.integer_nthroot(base.denominator, exp.denominator)
+    if not (num_exact and den_exact):
+        return None
+    return _power(Fraction(num, den), exp.numerator)
+
+
+def _power(base: int | Fraction, exp: int) -> int | Fraction:
+    bits = max(base.numerator.bit_length(), base.denominator.bit_length())
+    if bits * abs(exp) > MAX_BITS:
+        raise NotArithmetic("Too large")
+    res = Fraction(base) ** exp
+    return res.numerator if res.denominator == 1 else res
+
+
+def _pow(base: Number, exp: Number) -> Number:
+    if isinstance(base, mpmath.mpf) or isinstance(exp, mpmath.mpf):
+        if base < 0 and not (isinstance(exp, int) or
+                             isinstance(exp, Fraction) and
+                             exp.denominator == 1):
+            raise NotArithmetic("Complex")
+        return _irrational(_mpf(base) ** _mpf(exp))
+    if isinstance(base, float) or isinstance(exp, float):
+        # SymPy raises floats to powers with mpmath at their precision
+        if not isinstance(exp, int):
+            exp = mpmath.mpf(_float(exp))
+        with mpmath.workprec(FLOAT_PRECISION):
+            res = mpmath.mpf(_float(base)) ** exp
+        return _float(res)
+    if exp.denominator == 1:
+        return _power(base, int(exp))
+    if base < 0:
+        raise NotArithmetic("Complex")
+    res = _root(base, exp)
+    if res is None:
+        return _irrational(_mpf(base) ** (mpmath.mpf(exp.numerator) /
+                                          exp.denominator))
+    return res
+
+
+def _function(func, args: list[Number]) -> Number:
+    """ Applies a function from mpmath. SymPy evaluates functions of floats
+    at the precision of a float, and leaves functions of exact numbers
+    unevaluated until the end, e.g. sin(1).
+    """
+    if any(abs(arg) > MAX_ARGUMENT for arg in args):
+        raise NotArithmetic("Argument too large")
+    if any(isinstance(arg, float) for arg in args):
+        with mpmath.workprec(FLOAT_PRECISION):
+            res = func(*[mpmath.mpf(_float(arg)) for arg in args])
+        return _float(res)
+    return _irrational(func(*[_mpf(arg) for arg in args]))
+
+
+def _to_integer(value: Number, round_down: bool) -> int:
+    """ Returns the floor or ceiling of the number. """
+    if isinstance(value, mpmath.mpf):
+        nearest = mpmath.nint(value)
+        if abs(value - nearest) < MIN_MAGNITUDE:  # Possibly an integer
+            raise NotArithmetic("Possibly an integer")
+        value = mpmath.floor(value) if round_down else mpmath.ceil(value)
+        return int(value)
+    return math.floor(value) if round_down else math.ceil(value)
+
+
+def _factorial(value: Number, step: int) -> int:
+    if not isinstance(value, int) or not 0 <= value <= MAX_FACTORIAL:
+        raise NotArithmetic("Unsupported factorial")
+    return math.prod(range(value, 0, -step))
+
+
+def _evaluate(expr: sp.Basic) -> Number:
+    if expr.is_Integer:
+        return int(expr)
+    if expr.is_Rational:
+        return Fraction(int(expr.p), int(expr.q))
+    if expr.is_Float:
+        if expr._prec != FLOAT_PRECISION:
+            raise NotArithmetic("Float with another precision")
+        return float(expr)
+    if expr is sp.pi:
+        return +mpmath.pi
+    if expr is sp.E:
+        return +mpmath.e
+    cls = type(expr)
+    if cls is sp.Add:
+        return _fold(operator.add, [_evaluate(arg) for arg in expr.args])
+    if cls is sp.Mul:
+        return _fold(operator.mul, [_evaluate(arg) for arg in expr.args])
+    if cls is sp.Pow:
+        base, exp = expr.args
+        if base is sp.E:
+            return _function(mpmath.exp, [_evaluate(exp)])
+        return _pow(_evaluate(base), _evaluate(exp))
+    args = [_evaluate(arg) for arg in expr.args]
+    if cls in FUNCTIONS:
+        return _function(FUNCTIONS[cls], args)
+    if cls is sp.log:
+        if len(args) == 1:
+            return _function(mpmath.ln, args)
+        # A logarithm to a base b is log(x)/log(b)
+        return _apply(operator.truediv, _function(mpmath.ln, args[:1]),
+                      _function(mpmath.ln, args[1:]))
+    if cls is sp.Abs:
+        return abs(args[0])
+    if cls is sp.floor or cls is sp.ceiling:
+        return _to_integer(args[0], cls is sp.floor)
+    if cls is sp.factorial:
+        return _factorial(args[0], 1)
+    if cls is sp.factorial2:
+        return _factorial(args[0], 2)
+    if cls is sp.Mod:
+        if not all(isinstance(arg, (int, Fraction)) for arg in args):
+            raise NotArithmetic("Mod of an irrational number or float")
+        return _rational(args[0] % args[1])
+    if cls is sp.Max or cls is sp.Min:
+        return (max if cls is sp.Max else min)(args)
+    raise NotArithmetic(f"{cls.__name__} is not supported")
+
+
+def evaluate_arithmetic(expr: sp.Basic) -> int | float:
+    """ Evaluates the unevaluated expression if it is plain arithmetic,
+    returning the same number as converting SymPy's evaluation of it to an
+    int (if it is an integer) or a float. Numbers too large for a float are
+    infinite.
+    Raises NotArithmetic if the expression has to be evaluated by SymPy.
+    """
+    try:
+        with mpmath.workdps(PRECISION):
+            value = _evaluate(expr)
+            # Beyond this, the digits of an integer SymPy finds depend on the
+            # precision it works to
+            if isinstance(value, mpmath.mpf) and abs(value) >= 2 ** 53:
+                raise NotArithmetic("Large irrational number")
+            try:
+                res = float(value)
+            except OverflowError:
+                return math.inf if value > 0 else -math.inf
+            if not res.is_integer():
+                return res
+            # SymPy may find that an irrational number is exactly an
+            # integer, e.g. ln(e) = 1
+            if isinstance(value, mpmath.mpf) and value != mpmath.nint(value):
+                raise NotArithmetic("Possibly an integer")
+            return int(value)
+    except (ArithmeticError, ValueError, TypeError):
+        # e.g. division by zero, which SymPy evaluates to zoo
+        raise NotArithmetic("Undefined") from None
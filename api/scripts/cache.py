@@ -0,0 +1,227 @@
+""" Code for caching.
+
+The same inputs arrive over and over (e.g. 1+1, the examples in the docs
+and graph buttons replotting the same function), so each worker keeps the
+encoded responses of its recent successful operations. Inputs are
+canonicalised through the parser first so that e.g. 2x+1 and 2*x + 1
+share an entry.
+
+Rendered TeX images are also kept in a content-addressed store on disk
+that is shared by all workers and survives them being killed.
+"""
+import os
+import re
+import json
+import hashlib
+import tempfile
+from collections import OrderedDict
+
+import sympy as sp
+
+from scripts.deadlines import deferred
+from scripts.parser import _parse
+from scripts.timings import timed
+
+# Arguments that are parsed as expressions, equations or relations.
+EXPRESSION_ARGS = {'expr', 'expr1', 'expr2', 'eq', 'eqs', 'rel', 'rel1', 'rel2',
+                   'xt', 'yt', 't_start', 't_end', 'lt', 'ut', 'val'}
+# Arguments that are parsed as functions.
+FUNCTION_ARGS = {'func', 'func1', 'func2'}
+# Arguments that are parsed as limits (or domains for solve).
+LIMIT_ARGS = {'dom', 'ran'}
+
+FUNCTION_PATTERN = r"(.+)\((\w+)\)\s*=\s*(.+)"
+
+
+def _canonicalise_expr(s: str) -> list:
+    """ Returns the canonical form of the expression string.
+    Strings the parser rejects are kept as they are and tagged differently,
+    so that they can never collide with a canonical form.
+    """
+    try:
+        return ['expr', sp.srepr(_parse(s))]
+    except Exception:
+        return ['raw', s]
+
+
+def _canonicalise_func(s: str) -> list:
+    """ Returns the canonical form of the function string, keeping the
+    function's name and variable as written.
+    """
+    match = re.match(FUNCTION_PATTERN, s)
+    if match:
+        name, var, expr = match.groups()
+        return ['func', name, var, _canonicalise_expr(expr)]
+    return _canonicalise_expr(s)
+
+
+def _canonicalise_lim(s: str) -> list:
+    """ Returns the canonical form of the limit string. """
+    if ',' not in s:
+        return ['raw', s]
+    for char in ['(', ')', '[', ']']:
+        s = s.replace(char, '')
+    return ['lim', *[_canonicalise_expr(bound) for bound in s.split(',')]]
+
+
+def _canonicalise(name: str, value):
+    """ Returns the canonical form of the argument. """
+    if isinstance(value, list):
+        return [_canonicalise(name, item) for item in value]
+    if not isinstance(value, str):
+        return value
+    if name in EXPRESSION_ARGS:
+        return _canonicalise_expr(value)
+    if name in FUNCTION_ARGS:
+        return _canonicalise_func(value)
+    if name in LIMIT_ARGS:
+        return _canonicalise_lim(value)
+    return ['raw', value]
+
+
+@timed("parse")
+def make_key(operation: str, args) -> str | None:
+    """ Returns the cache key for the operation and its arguments,
+    or None if the request cannot be cached.
+    """
+    if not isinstance(operation, str) or not isinstance(args, dict):
+        return None
+    canonical = {name: _canonicalise(name, value)
+                 for name, value in sorted(args.items())}
+    return json.dumps([operation, canonical])
+
+
+class ResultCache:
+    """ A least recently used cache of encoded responses whose total size is
+    kept within a budget in bytes.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str | None) -> bytes | None:
+        """ Returns the cached response, or None if there isn't one. """
+        if key is None:
+            return None
+        with deferred():
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str | None, value: bytes) -> None:
+        """ Caches the response, evicting the least recently used ones until
+        the cache is within its budget.
+        """
+        if key is None or len(key) + len(value) > self.max_bytes:
+            return
+        with deferred():
+            if key in self._entries:
+                self.size -= len(key) + len(self._entries.pop(key))
+            self._entries[key] = value
+            self.size += len(key) + len(value)
+            while self.size > self.max_bytes:
+                old_key, old_value = self._entries.popitem(last=False)
+                self.size -= len(old_key) + len(old_value)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        """ Returns the cache's counters. """
+        return {"entries": len(self._entries),
+                "bytes": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions}
+
+
+class DiskCache:
+    """ A content-addressed store of files on disk, safe to share between
+    processes. Files are written to a temporary file first and then
+    atomically renamed into place, and reading a file refreshes its
+    modification time so that trimming removes the least recently used
+    files first. Any error accessing the disk is treated as a miss.
+    """
+    TRIM_INTERVAL = 64  # Writes between checks of the total size
+
+    def __init__(self, directory: str, max_bytes: int) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+
+    def _path(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest[2:])
+
+    def get(self, key: str) -> bytes | None:
+        """ Returns the cached file's contents, or None if there isn't one. """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                value = file.read()
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: bytes) -> None:
+        """ Stores the file, occasionally trimming the store back within
+        its budget.
+        """
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, 'wb') as file:
+                    file.write(value)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError:
+            return
+        self._writes += 1
+        if self._writes % self.TRIM_INTERVAL == 0:
+            self.trim()
+
+    def trim(self) -> None:
+        """ Removes the least recently used files until the store is within
+        90% of its budget.
+        """
+        files = []
+        try:
+            with os.scandir(self.directory) as shards:
+                for shard in shards:
+                    if not shard.is_dir():
+                        continue
+                    with os.scandir(shard.path) as entries:
+                        for entry in entries:
+                            stat = entry.stat()
+                            files.append((stat.st_mtime, stat.st_size,
+                                          entry.path))
+        except OSError:
+            return
+        size = sum(file[1] for file in files)
+        for _, file_size, path in sorted(files):
+            if size <= self.max_bytes * 0.9:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                pass  # Another worker got to it first
+            size -= file_size
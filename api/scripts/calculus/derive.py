@@ -2,7 +2,8 @@ import sympy as sp
 
 from scripts.parser import parse_expr, parse_var
 from scripts.renderer import render_tex
-from scripts.printer import make_pretty
+from scripts.governor import govern
+from scripts.printer import make_latex, make_pretty
 from scripts.utils import Result, Error, Response
 
 
@@ -18,8 +19,8 @@ def derive_expression(args: dict) -> Response:
             "expr": make_pretty(expr),
             "vars": [make_pretty(var) for var in vars]
         }
-        image = render_tex(f"${sp.latex(unevaluated)} = {sp.latex(res)}$")
-        answer = make_pretty(res)
-        return Result(pretty, image, answer)
+        out = govern(res)
+        image = render_tex(f"${make_latex(unevaluated)} = {out.latex}$")
+        return Result(pretty, image, out.answer, out.attachment)
     except Exception as e:
         return Error(name=type(e).__name__, message=str(e))
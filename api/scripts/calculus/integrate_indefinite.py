@@ -2,7 +2,8 @@ import sympy as sp
 
 from scripts.parser import parse_expr, parse_var
 from scripts.renderer import render_tex
-from scripts.printer import make_pretty
+from scripts.governor import govern
+from scripts.printer import make_latex, make_pretty
 from scripts.utils import Result, Error, Response
 
 
@@ -18,10 +19,10 @@ def integrate_indefinite_expression(args: dict) -> Response:
             "expr": make_pretty(expr),
             "var": make_pretty(var)
         }
-        tex = f"${sp.latex(unevaluated)} = {sp.latex(res)} + C$"
+        out = govern(res)
+        tex = f"${make_latex(unevaluated)} = {out.latex} + C$"
         tex = tex.replace(r'\int', r'\int \; \;')  # Add two spaces
         image = render_tex(tex)
-        answer = make_pretty(res)
-        return Result(pretty, image, answer)
+        return Result(pretty, image, out.answer, out.attachment)
     except Exception as e:
         return Error(name=type(e).__name__, message=str(e))
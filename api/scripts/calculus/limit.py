@@ -2,7 +2,8 @@ import sympy as sp
 
 from scripts.parser import parse_expr, parse_var, parse_dir
 from scripts.renderer import render_tex
-from scripts.printer import make_pretty
+from scripts.governor import govern
+from scripts.printer import make_latex, make_pretty
 from scripts.utils import Result, Error, Response
 
 
@@ -25,12 +26,12 @@ def limit_expression(args: dict) -> Response:
             "dir": make_pretty(dir)
         }
         dir_tex = f"^{dir}" if dir != '+-' else ''
+        out = govern(res)
         image = render_tex("$"
-                           f"\\lim_{{{var} \\to {sp.latex(val)}{dir_tex}}} "
-                           f"({sp.latex(expr)}) = "
-                           f"{sp.latex(res)}"
+                           f"\\lim_{{{var} \\to {make_latex(val)}{dir_tex}}} "
+                           f"({make_latex(expr)}) = "
+                           f"{out.latex}"
                            "$")
-        answer = make_pretty(res)
-        return Result(pretty, image, answer)
+        return Result(pretty, image, out.answer, out.attachment)
     except Exception as e:
         return Error(name=type(e).__name__, message=str(e))
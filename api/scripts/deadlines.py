@@ -0,0 +1,48 @@
+""" Code for enforcing request deadlines inside a worker.
+
+A request is aborted by raising DeadlineExceeded from a SIGALRM handler
+once its deadline has passed. The alarm can interrupt any line of Python,
+so updates to the state a worker keeps between requests (its caches) are
+made inside deferred(), which holds the alarm back until they are done.
+"""
+import signal
+from contextlib import contextmanager
+
+
+class DeadlineExceeded(BaseException):
+    """ Raised when a request runs past its deadline.
+    Derives from BaseException so that the operations' own error handling
+    cannot swallow it.
+    """
+    pass
+
+
+def _on_alarm(signum, frame):
+    raise DeadlineExceeded()
+
+
+def install() -> None:
+    """ Makes the alarm raise DeadlineExceeded. """
+    signal.signal(signal.SIGALRM, _on_alarm)
+
+
+def start(seconds: float) -> None:
+    """ Sets the alarm to go off in the number of seconds. """
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+
+
+def cancel() -> None:
+    """ Turns the alarm off. """
+    signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+@contextmanager
+def deferred():
+    """ Holds back the alarm while the block runs. An alarm that goes off
+    during it raises DeadlineExceeded once the block has finished.
+    """
+    old = signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGALRM})
+    try:
+        yield
+    finally:
+        signal.pthread_sigmask(signal.SIG_SETMASK, old)
@@ -0,0 +1,105 @@
+""" Code for limiting the size of results.
+
+Some results, e.g. the expansion of (x+y+z)^30, take far longer to convert
+to LaTeX and render than to compute, and are too long to be shown on
+Discord anyway. Such results are summarised by their leading terms, with
+their full text returned as an attachment.
+"""
+from typing import Any, NamedTuple
+
+import sympy as sp
+
+from scripts.printer import make_latex, make_pretty, make_pretty_multiple
+
+MAX_TERMS = 50
+MAX_NODES = 2000
+MAX_LATEX = 2000  # Characters
+MAX_ANSWER = 1000  # Characters
+MAX_ATTACHMENT = 1024 * 1024  # Characters
+LEADING_TERMS = 8
+TOO_LARGE = r"\text{The result is too large to show}"
+
+
+class Output(NamedTuple):
+    """ Represents how a result is shown. The attachment is the full text
+    of a result that was summarised, if it is not too large itself.
+    """
+    latex: str
+    answer: str | list[str]
+    attachment: str | None = None
+
+
+def _parts(obj: sp.Basic) -> tuple[sp.Basic, ...]:
+    """ Returns the terms of a sum or the elements of a set, in the order
+    they are printed.
+    """
+    if isinstance(obj, sp.Add):
+        return tuple(obj.as_ordered_terms())
+    if isinstance(obj, sp.FiniteSet):
+        return obj.args
+    return (obj,)
+
+
+def _is_large(obj: Any) -> bool:
+    """ Returns whether the object is too large to show, measured without
+    printing it. The nodes of its tree are counted rather than using
+    count_ops, which stops counting at the limit and does not try to iterate
+    infinite sets such as the Integers.
+    """
+    if not isinstance(obj, sp.Basic):
+        return False
+    if isinstance(obj, (sp.Add, sp.FiniteSet)) and \
+            len(obj.args) > MAX_TERMS:
+        return True
+    for i, _ in enumerate(sp.preorder_traversal(obj)):
+        if i >= MAX_NODES:
+            return True
+    return False
+
+
+def _truncate(s: str) -> str:
+    return s if len(s) <= MAX_ANSWER else s[:MAX_ANSWER] + "…"
+
+
+def _summarise(obj: sp.Basic, multiple: bool) -> Output:
+    """ Returns the leading terms of the object, e.g. a^8+8a^7b+… 37 more
+    terms, and its full text.
+    """
+    answer = make_pretty_multiple(obj) if multiple else make_pretty(obj)
+    full = '\n'.join(answer) if multiple else answer
+    attachment = full if len(full) <= MAX_ATTACHMENT else None
+    parts = _parts(obj)
+    more = len(parts) - LEADING_TERMS
+    if more <= 0:
+        latex = TOO_LARGE
+        answers = answer if multiple else [answer]
+    elif isinstance(obj, sp.Add):
+        leading = sp.Add(*parts[:LEADING_TERMS], evaluate=False)
+        latex = (f"{make_latex(leading)} + \\ldots"
+                 f" \\text{{ ({more} more terms)}}")
+        answers = [f"{make_pretty(leading)}+… {more} more terms"]
+    else:
+        leading = parts[:LEADING_TERMS]
+        latex = (f"{', '.join(make_latex(part) for part in leading)}, "
+                 f"\\ldots \\text{{ ({more} more solutions)}}")
+        answers = [make_pretty(part) for part in leading]
+        answers.append(f"… {more} more solutions")
+    if len(latex) > MAX_LATEX:
+        latex = TOO_LARGE
+    answers = [_truncate(s) for s in answers]
+    return Output(latex, answers if multiple else ','.join(answers),
+                  attachment)
+
+
+def govern(obj: Any, multiple: bool = False) -> Output:
+    """ Returns the LaTeX and answer of the result, which are summarised if
+    the result is too large. If multiple is True, the answer is a list as
+    returned by make_pretty_multiple.
+    """
+    if not _is_large(obj):
+        latex = make_latex(obj)
+        if len(latex) <= MAX_LATEX:
+            answer = make_pretty_multiple(obj) if multiple \
+                else make_pretty(obj)
+            return Output(latex, answer)
+    return _summarise(obj, multiple)
@@ -0,0 +1,459 @@
+""" Code for reading the input grammar into SymPy objects.
+
+The grammar is the one SymPy's parser accepts with the transformations DAS
+used before: implicit multiplication and application, split symbols,
+function exponents, ^ for powers, ! and !! for factorials and = for
+equations. Objects are built directly instead of generating Python code and
+evaluating it. Unevaluated objects have the same structure as SymPy's
+evaluateFalse gives them, e.g. 5 - 3 is Add(5, Mul(-1, 3)), with two
+exceptions: adding or multiplying anything but expressions, e.g. tuples, is
+invalid, and a function without brackets is applied to the whole chain of
+products after it, where SymPy's transformations gave nonsense.
+
+References:
+    https://docs.sympy.org/latest/modules/parsing.html
+"""
+import keyword
+import operator
+import re
+import unicodedata
+from typing import Any, Mapping
+
+import sympy as sp
+
+# Python's number literals, without underscores (which the parser rejects)
+_FLOAT = (r'(?:[0-9]+\.[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?'
+          r'|[0-9]+[eE][-+]?[0-9]+')
+_NUMBER = (rf'[0-9]+[jJ]|(?:{_FLOAT})[jJ]|{_FLOAT}'
+           r'|0[xX][0-9a-fA-F]+|0[bB][01]+|0[oO][0-7]+|0+|[1-9][0-9]*')
+_TOKEN = re.compile(rf'[ \t\f]*(?:(?P<number>{_NUMBER})|(?P<name>\w+)'
+                    r'|(?P<op>\*\*|//|!=|==|<=|>=|[-+*/%^()<>=,!.]))')
+
+UNARY_OPS = {'+': 'pos', '-': 'neg'}
+BINARY_OPS = {'+': 'add', '-': 'sub', '*': 'mul', '/': 'div',
+              '//': 'floordiv', '%': 'mod'}
+COMPARISON_OPS = {'==': 'eq', '!=': 'ne', '<': 'lt', '<=': 'le', '>': 'gt',
+                  '>=': 'ge'}
+OPERATORS = {'add': operator.add, 'sub': operator.sub, 'mul': operator.mul,
+             'div': operator.truediv, 'floordiv': operator.floordiv,
+             'mod': operator.mod, 'pow': operator.pow, 'neg': operator.neg,
+             'pos': operator.pos, 'eq': operator.eq, 'ne': operator.ne,
+             'lt': operator.lt, 'le': operator.le, 'gt': operator.gt,
+             'ge': operator.ge}
+RELATIONALS = {'eq': sp.Eq, 'ne': sp.Ne, 'lt': sp.Lt, 'le': sp.Le,
+               'gt': sp.Gt, 'ge': sp.Ge}
+CONSTANTS = {'True': True, 'False': False, 'None': None}
+# The functions SymPy's evaluateFalse passes evaluate=False to by name
+EVALUATE_FALSE_FUNCTIONS = {
+    'Abs', 'im', 're', 'sign', 'arg', 'conjugate',
+    'acos', 'acot', 'acsc', 'asec', 'asin', 'atan',
+    'acosh', 'acoth', 'acsch', 'asech', 'asinh', 'atanh',
+    'cos', 'cot', 'csc', 'sec', 'sin', 'tan',
+    'cosh', 'coth', 'csch', 'sech', 'sinh', 'tanh',
+    'exp', 'ln', 'log', 'sqrt', 'cbrt',
+}
+
+# A node of the syntax tree is a tuple whose first item is its kind:
+#   ('value', obj)
+#   ('call', name, func, [args])
+#   ('unary', op, operand)
+#   ('binary', op, left, right)
+#   ('compare', [ops], [operands])
+#   ('equation', [sides])
+#   ('tuple', [items])
+Node = tuple
+
+
+class UnclosedBracket(SyntaxError):
+    """ Raised when a bracket is not closed, or closed without being opened.
+    """
+    pass
+
+
+class AttributeAccess(SyntaxError):
+    """ Raised when a dot is used after a value, e.g. sin(x).cos(x). """
+    pass
+
+
+def _splittable(name: str) -> bool:
+    """ Returns whether the name of an unknown symbol is split into one
+    symbol per character, which is the case unless it is one character long
+    or the name of a Greek letter, e.g. xy => x*y but theta => theta.
+    """
+    try:
+        return not unicodedata.lookup('GREEK SMALL LETTER ' + name)
+    except KeyError:
+        return len(name) > 1
+
+
+def _is_function(value: Any) -> bool:
+    return callable(value) and not isinstance(value, sp.Symbol)
+
+
+def _tokenize(s: str) -> list[tuple[str, Any]]:
+    """ Splits the string into (kind, text) tokens, ending with an end
+    token, in the same way as Python's tokenizer.
+    """
+    tokens = []
+    pos = 0
+    depth = 0
+    while pos < len(s):
+        match = _TOKEN.match(s, pos)
+        if match is None:
+            raise SyntaxError(f"Invalid character {s[pos]!r}")
+        token = (match.lastgroup, match.group(match.lastgroup))
+        if token == ('op', '('):
+            depth += 1
+        elif token == ('op', ')'):
+            depth -= 1
+            if depth < 0:
+                raise UnclosedBracket("Unmatched )")
+        tokens.append(token)
+        pos = match.end()
+    # Mismatched brackets are found before any other error, like in Python
+    if depth > 0:
+        raise UnclosedBracket("Unclosed (")
+    tokens.append(('end', ''))
+    return tokens
+
+
+class _Parser:
+    """ A recursive descent parser of the tokens into a syntax tree, which
+    follows Python's precedence and associativity.
+    """
+
+    def __init__(self, s: str, names: Mapping[str, Any]) -> None:
+        self.tokens = _tokenize(s)
+        self.pos = 0
+        self.names = names
+        self.attribute = False  # Whether a dot is used after a value
+
+    def peek(self, offset: int = 0) -> tuple[str, Any]:
+        return self.tokens[self.pos + offset]
+
+    def next(self) -> tuple[str, Any]:
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def accept(self, *ops: str) -> str | None:
+        """ Consumes the next token if it is one of the operators. """
+        kind, text = self.tokens[self.pos]
+        if kind == 'op' and text in ops:
+            self.pos += 1
+            return text
+        return None
+
+    def starts_operand(self) -> bool:
+        """ Returns whether the next token can start an implicitly
+        multiplied or applied operand.
+        """
+        kind, text = self.tokens[self.pos]
+        return kind in ('number', 'name', 'node') or \
+            (kind, text) == ('op', '(')
+
+    def parse(self) -> Node:
+        if self.peek()[0] == 'end':
+            raise SyntaxError("Empty input")
+        node = self.parse_list()
+        kind, text = self.peek()
+        if kind != 'end':
+            raise SyntaxError(f"Unexpected {text!r}")
+        if self.attribute:
+            raise AttributeAccess("Attribute access")
+        return node
+
+    def parse_list(self) -> Node:
+        """ list: equation (',' equation)* [','] """
+        items = [self.parse_equation()]
+        if not self.accept(','):
+            return items[0]
+        while self.starts_operand() or self.peek()[1] in ('+', '-'):
+            items.append(self.parse_equation())
+            if not self.accept(','):
+                break
+        return ('tuple', items)
+
+    def parse_equation(self) -> Node:
+        """ equation: comparison ('=' comparison)* """
+        sides = [self.parse_comparison()]
+        while self.accept('='):
+            sides.append(self.parse_comparison())
+        return sides[0] if len(sides) == 1 else ('equation', sides)
+
+    def parse_comparison(self) -> Node:
+        """ comparison: sum (comparison_op sum)* """
+        operands = [self.parse_sum()]
+        ops = []
+        while op := self.accept(*COMPARISON_OPS):
+            ops.append(COMPARISON_OPS[op])
+            operands.append(self.parse_sum())
+        return ('compare', ops, operands) if ops else operands[0]
+
+    def parse_sum(self) -> Node:
+        """ sum: term (('+' | '-') term)* """
+        node = self.parse_term()
+        while op := self.accept('+', '-'):
+            node = ('binary', BINARY_OPS[op], node, self.parse_term())
+        return node
+
+    def parse_term(self) -> Node:
+        """ term: factor (('*' | '/' | '//' | '%' | implicit) factor)* """
+        node = self.parse_factor()
+        while True:
+            if op := self.accept('*', '/', '//', '%'):
+                node = ('binary', BINARY_OPS[op], node, self.parse_factor())
+            elif self.starts_operand():  # Implicit multiplication
+                node = ('binary', 'mul', node, self.parse_power())
+            else:
+                return node
+
+    def parse_factor(self) -> Node:
+        """ factor: ('+' | '-') factor | power """
+        if op := self.accept('+', '-'):
+            return ('unary', UNARY_OPS[op], self.parse_factor())
+        return self.parse_power()
+
+    def parse_power(self) -> Node:
+        """ power: postfix [('^' | '**') factor] """
+        node = self.parse_postfix()
+        if self.accept('^', '**'):
+            node = ('binary', 'pow', node, self.parse_factor())
+        return node
+
+    def parse_postfix(self) -> Node:
+        """ postfix: primary ('!' | '!!')? """
+        node = self.parse_primary()
+        return self.parse_factorial(node)
+
+    def parse_factorial(self, node: Node) -> Node:
+        count = 0
+        while self.accept('!'):
+            count += 1
+        if count > 2:
+            raise SyntaxError("Too many factorials")
+        if count:
+            name = 'factorial' if count == 1 else 'factorial2'
+            node = ('call', name, getattr(sp, name), [node])
+        # An attribute is only an error once the rest of the string is
+        # known to be valid, e.g. sin(x).cos(x)
+        if self.peek() == ('op', '.') and self.peek(1)[0] == 'name':
+            self.pos += 2
+            self.attribute = True
+        return node
+
+    def parse_primary(self) -> Node:
+        """ primary: number | name | function | '(' list ')' """
+        kind, text = self.next()
+        if kind == 'node':  # A character of a split symbol
+            return text
+        if kind == 'number':
+            return self.parse_number(text)
+        if kind == 'name':
+            return self.parse_name(text)
+        if (kind, text) == ('op', '('):
+            node = self.parse_list()
+            self.expect_close()
+            return node
+        if kind == 'end':
+            raise SyntaxError("Unexpected end of input")
+        raise SyntaxError(f"Unexpected {text!r}")
+
+    def expect_close(self) -> None:
+        if not self.accept(')'):
+            raise SyntaxError(f"Unexpected {self.peek()[1]!r}")
+
+    def parse_number(self, text: str) -> Node:
+        # An imaginary number is its coefficient times I, e.g. 2j^2 => 2*I^2
+        imaginary = text[-1] in 'jJ'
+        if imaginary:
+            text = text[:-1]
+            self.tokens[self.pos:self.pos] = [('op', '*'),
+                                              ('node', ('value', sp.I))]
+        if '.' in text or ('e' in text.lower() and text[:2].lower() != '0x'):
+            return ('value', sp.Float(text))
+        # The coefficient of an imaginary number is decimal, e.g. 07j => 7*I
+        return ('value', sp.Integer(int(text, 10 if imaginary else 0)))
+
+    def parse_name(self, name: str) -> Node:
+        if name in CONSTANTS:
+            return ('value', CONSTANTS[name])
+        if keyword.iskeyword(name):
+            raise SyntaxError(f"Unexpected keyword {name}")
+        if name in self.names:
+            value = self.names[name]
+            if _is_function(value):
+                return self.parse_function(name, value)
+            return ('value', value)
+        if not _splittable(name):
+            return ('value', sp.Symbol(name))
+        # Unknown names are split into one symbol per character, with
+        # digits kept together, e.g. x2y => x*2*y
+        nodes = []
+        for part in re.findall(r'\d+|\D', name):
+            if part.isdigit():
+                nodes.append(('value', sp.Integer(part)))
+            elif part in self.names:
+                nodes.append(('value', self.names[part]))
+            else:
+                nodes.append(('value', sp.Symbol(part)))
+        # A factorial applies to the whole name, e.g. xy! => (x*y)!
+        if self.peek() == ('op', '!'):
+            node = nodes[0]
+            for other in nodes[1:]:
+                node = ('binary', 'mul', node, other)
+            return node
+        # Otherwise the characters are separate operands, e.g. xy^2 => x*y^2
+        self.tokens[self.pos:self.pos] = [('node', node) for node in nodes[1:]]
+        return nodes[0]
+
+    def parse_function(self, name: str, func: Any) -> Node:
+        """ function: name '(' arguments ')'
+                    | name ('^' | '**') exponent ('(' arguments ')' | chain)
+                    | name chain
+        A function without brackets is applied to the chain of products and
+        powers after it, e.g. sin 2x^2 => sin(2x^2).
+        An exponent before the arguments applies to the function's value,
+        e.g. sin^2 x => sin(x)^2.
+        """
+        if self.accept('('):
+            return ('call', name, func, self.parse_arguments())
+        if self.accept('^', '**'):
+            exponent = self.parse_exponent()
+            if self.accept('('):
+                args = self.parse_arguments()
+            elif self.accept('*') or self.starts_operand():  # sin^2*x
+                args = [self.parse_chain()]
+            else:
+                raise SyntaxError(f"{name} has no arguments")
+            if self.accept('^', '**'):  # Right associative
+                exponent = ('binary', 'pow', exponent, self.parse_factor())
+            return ('binary', 'pow', ('call', name, func, args), exponent)
+        if self.starts_operand():
+            return ('call', name, func, [self.parse_chain()])
+        return ('value', func)
+
+    def parse_arguments(self) -> list[Node]:
+        """ arguments: [equation (',' equation)*] ')' """
+        args = []
+        if not self.accept(')'):
+            args.append(self.parse_equation())
+            while self.accept(','):
+                args.append(self.parse_equation())
+            self.expect_close()
+        return args
+
+    def parse_exponent(self) -> Node:
+        """ exponent: ('+' | '-') exponent | postfix """
+        if op := self.accept('+', '-'):
+            return ('unary', UNARY_OPS[op], self.parse_exponent())
+        return self.parse_postfix()
+
+    def parse_chain(self) -> Node:
+        """ chain: power (('*' | implicit) power)* """
+        node = self.parse_power()
+        while self.accept('*') or self.starts_operand():
+            node = ('binary', 'mul', node, self.parse_power())
+        return node
+
+
+def _build(node: Node, evaluate: bool) -> Any:
+    """ Builds the SymPy object of the syntax tree. When evaluate is False,
+    additions, multiplications and powers are built unevaluated and
+    flattened, as by SymPy's evaluateFalse. The operands of // and %, which
+    evaluateFalse leaves alone, are built with Python's operators, which
+    the caller keeps from evaluating.
+    """
+    kind = node[0]
+    if kind == 'value':
+        return node[1]
+    if kind == 'call':
+        _, name, func, args = node
+        args = [_build(arg, evaluate) for arg in args]
+        if not evaluate and name in EVALUATE_FALSE_FUNCTIONS:
+            return func(*args, evaluate=False)
+        return func(*args)
+    if kind == 'unary':
+        return OPERATORS[node[1]](_build(node[2], evaluate))
+    if kind == 'binary':
+        op = node[1]
+        if not evaluate and op in ('add', 'sub'):
+            return sp.Add(*_operands(node, evaluate), evaluate=False)
+        if not evaluate and op in ('mul', 'div'):
+            return sp.Mul(*_operands(node, evaluate), evaluate=False)
+        if op in ('floordiv', 'mod'):
+            evaluate = True
+        left = _build(node[2], evaluate)
+        right = _build(node[3], evaluate)
+        if not evaluate and op == 'pow':
+            return sp.Pow(_expr(left), _expr(right), evaluate=False)
+        return OPERATORS[op](left, right)
+    if kind == 'compare':
+        return _build_comparison(node[1], node[2], evaluate)
+    if kind == 'equation':
+        return sp.Eq(*[_build(side, evaluate) for side in node[1]])
+    if kind == 'tuple':
+        return tuple(_build(item, evaluate) for item in node[1])
+    raise ValueError(f"Unknown node {kind}")
+
+
+def _operands(node: Node, evaluate: bool) -> list:
+    """ Returns the unevaluated operands of an addition or multiplication,
+    taking the operands of nested additions or multiplications in turn.
+    A subtraction adds -1 times its right side and a division multiplies by
+    its right side to the power of -1.
+    Raises a SyntaxError if an operand is not an expression, e.g. a tuple.
+    """
+    op = node[1]
+    group = ('add', 'sub') if op in ('add', 'sub') else ('mul', 'div')
+
+    def flatten(child: Node) -> list:
+        if child[0] == 'binary' and child[1] in group:
+            return _operands(child, evaluate)
+        return [_expr(_build(child, evaluate))]
+
+    left = flatten(node[2])
+    if op == 'sub':
+        return left + [sp.Mul(sp.S.NegativeOne,
+                              _expr(_build(node[3], evaluate)),
+                              evaluate=False)]
+    if op == 'div':
+        return left + [sp.Pow(_expr(_build(node[3], evaluate)),
+                              sp.S.NegativeOne, evaluate=False)]
+    return left + flatten(node[3])
+
+
+def _expr(value: Any) -> sp.Expr:
+    """ Returns the value as an operand of an addition or multiplication.
+    Raises a SyntaxError if it is not an expression.
+    """
+    value = sp.sympify(value)
+    if not isinstance(value, sp.Expr):
+        raise SyntaxError(f"{type(value).__name__} is not an expression")
+    return value
+
+
+def _build_comparison(ops: list[str], operands: list[Node], evaluate: bool):
+    """ Builds a comparison, which is chained like in Python,
+    e.g. 1 < x < 2 => 1 < x and x < 2.
+    """
+    values = [_build(operand, evaluate) for operand in operands]
+    if not evaluate:
+        relations = [RELATIONALS[op](left, right, evaluate=False)
+                     for op, left, right in zip(ops, values, values[1:])]
+        if len(relations) == 1:
+            return relations[0]
+        return sp.And(*relations, evaluate=False)
+    for op, left, right in zip(ops[:-1], values, values[1:]):
+        res = OPERATORS[op](left, right)
+        if not res:  # Raises a TypeError for an undecidable relation
+            return res
+    return OPERATORS[ops[-1]](values[-2], values[-1])
+
+
+def parse(s: str, names: Mapping[str, Any], evaluate: bool) -> Any:
+    """ Converts the string s to a SymPy object, looking up names in the
+    mapping. Other names are symbols.
+    Raises a SyntaxError if the string does not follow the grammar.
+    """
+    return _build(_Parser(s.strip(), names).parse(), evaluate)
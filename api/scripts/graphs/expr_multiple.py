@@ -1,10 +1,7 @@
-import sympy as sp
-from sympy.plotting import plot3d
-
 from scripts.parser import parse_expr, parse_lim
-from scripts.renderer import render_plot
-from scripts.printer import make_pretty
-from scripts.utils import Var
+from scripts.plotter import plot_surfaces
+from scripts.renderer import render_figure
+from scripts.printer import make_latex, make_pretty
 from scripts.utils import Result, Error, Response
 
 
@@ -18,18 +15,14 @@ def graph_expr_multiple(args: dict) -> Response:
         expr2 = parse_expr(raw_expr2)
         dom = parse_lim(raw_dom)
         ran = parse_lim(raw_ran)
-        plot = plot3d(expr1,
-                      expr2,
-                      (Var.X, dom.lower, dom.upper),
-                      (Var.Y, ran.lower, ran.upper),
-                      show=False)
-        legend = [f'$f1(x,y) = {sp.latex(expr1)}$',
-                  f'$f2(x,y) = {sp.latex(expr2)}$']
+        fig, handles = plot_surfaces([expr1, expr2], dom, ran)
+        legend = [f'$f1(x,y) = {make_latex(expr1)}$',
+                  f'$f2(x,y) = {make_latex(expr2)}$']
         pretty = {"expr1": make_pretty(expr1),
                   "expr2": make_pretty(expr2),
                   "dom": make_pretty(dom),
                   "ran": make_pretty(ran)}
-        image = render_plot(plot, legend)
+        image = render_figure(fig, legend, handles)
         return Result(pretty, image)
     except Exception as e:
         return Error(name=type(e).__name__, message=str(e))
@@ -1,7 +1,6 @@
-import sympy as sp
-
 from scripts.parser import parse_func, parse_var, parse_lim
-from scripts.renderer import render_plot
+from scripts.plotter import plot_funcs
+from scripts.renderer import render_figure
 from scripts.printer import make_pretty
 from scripts.utils import Result, Error, Response
 
@@ -22,23 +21,14 @@ def graph_func_multiple(args: dict) -> Response:
         var = parse_var(raw_var)
         dom = parse_lim(raw_dom)
         ran = parse_lim(raw_ran) if raw_ran else None
-        plot = sp.plot(func1.expr,
-                       func2.expr,
-                       (var, dom.lower, dom.upper),
-                       show=False,
-                       xlabel=None,
-                       ylabel=None,
-                       xlim=dom,
-                       ylim=ran)
-        plot[0].line_color = COLOR1
-        plot[1].line_color = COLOR2
+        fig = plot_funcs([func1, func2], [COLOR1, COLOR2], dom, ran)
         legend = [func1.get_latex(), func2.get_latex()]
         pretty = {"func1": make_pretty(func1),
                   "func2": make_pretty(func2),
                   "dom": make_pretty(dom),
                   "var": make_pretty(var),
                   "ran": make_pretty(ran)}
-        image = render_plot(plot, legend)
+        image = render_figure(fig, legend)
         return Result(pretty, image)
     except Exception as e:
         return Error(name=type(e).__name__, message=str(e))
@@ -1,9 +1,7 @@
-import sympy as sp
-
 from scripts.parser import parse_expr
-from scripts.renderer import render_plot
-from scripts.printer import make_pretty
-from scripts.utils import Var
+from scripts.plotter import plot_parametric
+from scripts.renderer import render_figure
+from scripts.printer import make_latex, make_pretty
 from scripts.utils import Result, Error, Response
 
 
@@ -17,17 +15,14 @@ def graph_parametric(args: dict) -> Response:
         yt = parse_expr(raw_yt)
         t_start = parse_expr(raw_t_start)
         t_end = parse_expr(raw_t_end)
-        plot = sp.plot_parametric(xt,
-                                  yt,
-                                  (Var.T, t_start, t_end),
-                                  show=False)
-        legend = [f'$x(t) = {sp.latex(xt)}$, '
-                  f'$y(t) = {sp.latex(yt)}$']
+        fig = plot_parametric(xt, yt, t_start, t_end)
+        legend = [f'$x(t) = {make_latex(xt)}$, '
+                  f'$y(t) = {make_latex(yt)}$']
         pretty = {"xt": make_pretty(xt),
                   "yt": make_pretty(yt),
                   "t_start": make_pretty(t_start),
                   "t_end": make_pretty(t_end)}
-        image = render_plot(plot, legend)
+        image = render_figure(fig, legend)
         return Result(pretty, image)
     except Exception as e:
         return Error(name=type(e).__name__, message=str(e))
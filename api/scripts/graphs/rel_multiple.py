@@ -1,8 +1,9 @@
 import sympy as sp
 
 from scripts.parser import parse_rel, parse_lim
-from scripts.renderer import render_plot
-from scripts.printer import make_pretty
+from scripts.plotter import plot_rels
+from scripts.renderer import render_plot, render_figure
+from scripts.printer import make_latex, make_pretty
 from scripts.utils import Var
 from scripts.utils import Result, Error, Response
 
@@ -21,27 +22,32 @@ def graph_rel_multiple(args: dict) -> Response:
         rel2 = parse_rel(raw_rel2)
         dom = parse_lim(raw_dom)
         ran = parse_lim(raw_ran)
-        plot = sp.plot_implicit(rel1,
-                                (Var.X, dom.lower, dom.upper),
-                                (Var.Y, ran.lower, ran.upper),
-                                show=False,
-                                line_color=COLOR1,
-                                xlabel=None,
-                                ylabel=None)
-        plot2 = sp.plot_implicit(rel2,
-                                 (Var.X, dom.lower, dom.upper),
-                                 (Var.Y, ran.lower, ran.upper),
-                                 show=False,
-                                 line_color=COLOR2,
-                                 xlabel=None,
-                                 ylabel=None)
-        plot.append(plot2[0])
-        legend = [f'${sp.latex(rel1)}$', f'${sp.latex(rel2)}$']
+        legend = [f'${make_latex(rel1)}$', f'${make_latex(rel2)}$']
         pretty = {"rel1": make_pretty(rel1),
                   "rel2": make_pretty(rel2),
                   "dom": make_pretty(dom),
                   "ran": make_pretty(ran)}
-        image = render_plot(plot, legend)
+        plotted = plot_rels([rel1, rel2], [COLOR1, COLOR2], dom, ran)
+        if plotted is not None:
+            fig, handles = plotted
+            image = render_figure(fig, legend, handles)
+        else:  # Fall back to SymPy's interval arithmetic
+            plot = sp.plot_implicit(rel1,
+                                    (Var.X, dom.lower, dom.upper),
+                                    (Var.Y, ran.lower, ran.upper),
+                                    show=False,
+                                    line_color=COLOR1,
+                                    xlabel=None,
+                                    ylabel=None)
+            plot2 = sp.plot_implicit(rel2,
+                                     (Var.X, dom.lower, dom.upper),
+                                     (Var.Y, ran.lower, ran.upper),
+                                     show=False,
+                                     line_color=COLOR2,
+                                     xlabel=None,
+                                     ylabel=None)
+            plot.append(plot2[0])
+            image = render_plot(plot, legend)
         return Result(pretty, image)
     except Exception as e:
         return Error(name=type(e).__name__, message=str(e))
@@ -1,8 +1,9 @@
 import sympy as sp
 
 from scripts.parser import parse_rel, parse_lim
-from scripts.renderer import render_plot
-from scripts.printer import make_pretty
+from scripts.plotter import plot_rels
+from scripts.renderer import render_plot, render_figure
+from scripts.printer import make_latex, make_pretty
 from scripts.utils import Var
 from scripts.utils import Result, Error, Response
 
@@ -18,18 +19,23 @@ def graph_rel_single(args: dict) -> Response:
         rel = parse_rel(raw_rel)
         dom = parse_lim(raw_dom)
         ran = parse_lim(raw_ran)
-        plot = sp.plot_implicit(rel,
-                                (Var.X, dom.lower, dom.upper),
-                                (Var.Y, ran.lower, ran.upper),
-                                show=False,
-                                line_color=COLOR,
-                                xlabel=None,
-                                ylabel=None)
-        legend = [f'${sp.latex(rel)}$']
+        legend = [f'${make_latex(rel)}$']
         pretty = {"rel": make_pretty(rel),
                   "dom": make_pretty(dom),
                   "ran": make_pretty(ran)}
-        image = render_plot(plot, legend)
+        plotted = plot_rels([rel], [COLOR], dom, ran)
+        if plotted is not None:
+            fig, handles = plotted
+            image = render_figure(fig, legend, handles)
+        else:  # Fall back to SymPy's interval arithmetic
+            plot = sp.plot_implicit(rel,
+                                    (Var.X, dom.lower, dom.upper),
+                                    (Var.Y, ran.lower, ran.upper),
+                                    show=False,
+                                    line_color=COLOR,
+                                    xlabel=None,
+                                    ylabel=None)
+            image = render_plot(plot, legend)
         return Result(pretty, image)
     except Exception as e:
         return Error(name=type(e).__name__, message=str(e))
@@ -0,0 +1,183 @@
+""" Code for compiling expressions to NumPy functions.
+
+Graph buttons replot the same few functions over and over, so each worker
+keeps its recently compiled kernels and only generates code for new ones.
+"""
+import time
+from collections import OrderedDict
+
+import numpy as np
+import sympy as sp
+
+from scripts.deadlines import deferred
+
+MAX_KERNELS = 256
+
+
+def _as_real(values: np.ndarray) -> np.ndarray:
+    """ Returns the real part of the values, with NaN wherever the value is
+    not real or not finite.
+    """
+    if np.iscomplexobj(values):
+        real = values.real.copy()
+        real[~np.isclose(values.imag, 0)] = np.nan
+    else:
+        real = values.astype(float)
+    real[~np.isfinite(real)] = np.nan
+    return real
+
+
+class Kernel:
+    """ Represents an expression compiled to a NumPy function. A tuple of
+    expressions, such as the components of a parametric curve, is compiled
+    to one function so that they share their common subexpressions.
+    """
+
+    def __init__(self,
+                 expr: sp.Expr | sp.Tuple,
+                 symbols: list[sp.Symbol]) -> None:
+        extra = expr.free_symbols - set(symbols)
+        if extra:
+            raise ValueError(f"Too many free symbols.\n"
+                             f"Expected {len(symbols)} free symbols.\n"
+                             f"Received {len(expr.free_symbols)}: "
+                             f"{expr.free_symbols}")
+        self.expr = expr
+        self.symbols = tuple(symbols)
+        # The number of components, or None for a single expression
+        self.size = len(expr) if isinstance(expr, sp.Tuple) else None
+        start = time.perf_counter()
+        # Common subexpressions, e.g. the sin(x) in sin(x)^2 + sin(x), are
+        # evaluated once over the whole grid
+        self.func = sp.lambdify(self.symbols, expr, modules='numpy', cse=True)
+        self.compile_time = time.perf_counter() - start
+        self._scalar_func = None
+
+    def __call__(self,
+                 *grids: np.ndarray,
+                 pointwise: bool = True) -> np.ndarray:
+        """ Evaluates the expression over the grids, which must all have the
+        same shape. Returns the real values of the expression, with NaN
+        wherever it is undefined, not real or not finite. The values of a
+        tuple's components are stacked along the first axis.
+        Expressions NumPy cannot vectorise are evaluated point by point,
+        unless pointwise is False, in which case the error is raised.
+        """
+        with np.errstate(all='ignore'):
+            try:
+                return self._evaluate_vectorised(grids)
+            except Exception:  # e.g. factorial, which NumPy cannot vectorise
+                if not pointwise:
+                    raise
+                return self._evaluate_pointwise(grids)
+
+    def _broadcast(self, values, shape: tuple[int, ...]) -> np.ndarray:
+        """ Broadcasts the output of the function, in which constants are
+        scalars, to the shape of the grids.
+        """
+        if self.size is None:
+            return np.broadcast_to(values, shape)
+        return np.stack([np.broadcast_to(value, shape) for value in values])
+
+    def _evaluate_vectorised(self,
+                             grids: tuple[np.ndarray, ...]) -> np.ndarray:
+        shape = grids[0].shape
+        values = _as_real(self._broadcast(self.func(*grids), shape))
+        # SymPy evaluates plots with complex arithmetic, which keeps
+        # expressions such as sqrt(x)^2 defined for negative x. Only the
+        # points that are undefined in real arithmetic need to be redone.
+        undefined = np.isnan(values)
+        if self.size is not None:
+            undefined = undefined.any(axis=0)
+        if undefined.any():
+            points = [grid[undefined].astype(complex) for grid in grids]
+            try:
+                redone = self.func(*points)
+            except Exception:  # e.g. floor, which is undefined for complex
+                return values
+            values[..., undefined] = _as_real(
+                self._broadcast(redone, points[0].shape))
+        return values
+
+    def _evaluate_pointwise(self,
+                            grids: tuple[np.ndarray, ...]) -> np.ndarray:
+        if self._scalar_func is None:
+            self._scalar_func = sp.lambdify(self.symbols, self.expr,
+                                            modules='sympy')
+        nan = complex(np.nan, np.nan)
+
+        def evaluate_point(*point: float) -> complex | tuple[complex, ...]:
+            try:
+                values = self._scalar_func(*point)
+                if self.size is None:
+                    return complex(values)
+                return tuple(complex(value) for value in values)
+            except (TypeError, ValueError, ZeroDivisionError, OverflowError):
+                return nan if self.size is None else (nan,) * self.size
+
+        evaluate = np.vectorize(evaluate_point,
+                                otypes=[complex] * (self.size or 1))
+        values = evaluate(*grids)
+        return _as_real(values if self.size is None else np.stack(values))
+
+
+class KernelCache:
+    """ A least recently used cache of kernels, keyed by the expression and
+    the symbols it is a function of.
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.compile_time = 0.0  # Total seconds spent compiling
+        self.max_compile_time = 0.0
+        self._entries: OrderedDict[tuple, Kernel] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self,
+            expr: sp.Expr | sp.Tuple,
+            symbols: list[sp.Symbol]) -> Kernel:
+        """ Returns the kernel of the expression, compiling it if it is not
+        cached.
+        """
+        key = (sp.srepr(expr), tuple(sp.srepr(symbol) for symbol in symbols))
+        with deferred():
+            kernel = self._entries.get(key)
+            if kernel is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return kernel
+            self.misses += 1
+        # Compiling can take a while, so it is left open to the deadline
+        kernel = Kernel(expr, symbols)
+        with deferred():
+            self.compile_time += kernel.compile_time
+            self.max_compile_time = max(self.max_compile_time,
+                                        kernel.compile_time)
+            self._entries[key] = kernel
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return kernel
+
+    def stats(self) -> dict:
+        """ Returns the cache's counters. """
+        return {"entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "compile_seconds": self.compile_time,
+                "max_compile_seconds": self.max_compile_time}
+
+
+kernels = KernelCache(MAX_KERNELS)
+
+
+def get_kernel(expr: sp.Expr | sp.Tuple,
+               symbols: list[sp.Symbol]) -> Kernel:
+    """ Returns the shared, cached kernel of the expression. """
+    return kernels.get(expr, symbols)
@@ -4,11 +4,16 @@ References:
     https://docs.sympy.org/latest/modules/parsing.html
     https://stackoverflow.com/questions/45996040
 """
+import builtins
 import re
+from collections import ChainMap, OrderedDict
+from types import MappingProxyType
+
 import sympy as sp
-from sympy.parsing import sympy_parser
-from tokenize import TokenError
 
+from scripts.deadlines import deferred
+from scripts.grammar import AttributeAccess, UnclosedBracket, parse
+from scripts.timings import timed
 from scripts.utils import Func, Limit, BANNED
 from scripts.utils.error_messages import (invalid_character,
                                           invalid_input,
@@ -22,103 +27,236 @@ from scripts.utils.error_messages import (invalid_character,
                                           invalid_mod)
 
 
+# Names the parser knows, i.e. the functions and constants DAS supports.
+# Any other name is parsed as a symbol.
+SUPPORTED = [
+    # Constants
+    'E', 'I', 'pi', 'oo', 'zoo', 'nan',
+    # Trigonometric and hyperbolic functions
+    'sin', 'cos', 'tan', 'cot', 'sec', 'csc',
+    'asin', 'acos', 'atan', 'acot', 'asec', 'acsc', 'atan2',
+    'sinh', 'cosh', 'tanh', 'coth', 'sech', 'csch',
+    'asinh', 'acosh', 'atanh', 'acoth', 'asech', 'acsch',
+    # Powers, roots and logarithms
+    'exp', 'log', 'ln', 'sqrt', 'cbrt', 'root', 'real_root',
+    # Other functions
+    'Abs', 'sign', 're', 'im', 'arg', 'conjugate',
+    'floor', 'ceiling', 'frac', 'Mod', 'Max', 'Min',
+    'factorial', 'factorial2', 'binomial', 'gamma', 'gcd', 'lcm',
+]
+NAMESPACE = MappingProxyType({
+    **{name: getattr(sp, name) for name in SUPPORTED},
+    'abs': builtins.abs,  # Same as SymPy's default
+    'max': sp.Max,
+    'min': sp.Min,
+})
+
+CONVERSIONS = MappingProxyType({
+    'e': sp.E,
+    'π': sp.pi,
+    'arcsin': sp.asin,
+    'arccos': sp.acos,
+    'arctan': sp.atan,
+    'cosec': sp.csc,
+    'arcsinh': sp.asinh,
+    'arccosh': sp.acosh,
+    'arctanh': sp.atanh,
+})
+REPLACEMENTS = (
+    ('⋅', '*'),
+    ('×', '*'),
+    ('÷', '/'),
+    ('–', '-'),
+    ('°', '*(pi/180)'),
+    ('deg', '*(pi/180)'),
+    ('mod', 'Mod'),
+    ('million', '*(10^6)'),
+    ('billion', '*(10^9)'),
+    ('trillion', '*(10^12)'),
+    ('quadrillion', '*(10^15)'),
+    ('quintillion', '*(10^18)'),
+    ('sextillion', '*(10^21)'),
+    ('septillion', '*(10^24)'),
+    ('octillion', '*(10^27)'),
+    ('nonillion', '*(10^30)'),
+    ('decillion', '*(10^33)'),
+)
+MAX_PARSES = 1024
+
+# Substrings that make a string invalid, with the error message for each.
+# They are checked in this order, so the message of the first one found is
+# raised. None is the message for invalid input, which quotes the string.
+INVALID = ['"', "#", "$", "&", "'", ":", ";", "?", "@", "_", "`", "~"]
+CHECKS = (
+    # Invalid characters
+    *((char, invalid_character(char)) for char in INVALID),
+    # Blacklist
+    *((banned, None) for banned in BANNED),
+    # Latex
+    ('\\', no_latex()),
+    # Factorial
+    ('!!!', invalid_factorial()),
+    # Absolute value
+    ('|', invalid_syntax("abs(x)", "|x|")),
+    # Power
+    *((digit, invalid_syntax(f"^{i+2}", digit))
+      for i, digit in enumerate(['²', '³', '⁴', '⁵', '⁶', '⁷', '⁸', '⁹'])),
+    ('squared', invalid_syntax("^2", "squared")),
+    ('cubed', invalid_syntax("^3", "cubed")),
+    # Square root
+    ('√', invalid_syntax("sqrt(x) or root(x, 2)", "√x")),
+    ('square root', invalid_syntax("sqrt(x) or root(x, 2)", "square root x")),
+    # Brackets
+    *((bracket, invalid_syntax("()", "{}")) for bracket in '{}'),
+    *((bracket, invalid_syntax("()", "[]")) for bracket in '[]'),
+)
+
+
+def _trie_pattern(words: list[str]) -> str:
+    """ Returns a regular expression that matches any of the words, with the
+    words that share a prefix merged into one branch. The regex engine tries
+    each alternative in turn, so merging them makes a scan much faster.
+    e.g. ['sin', 'sinh', 'sec'] => s(?:ec|in(?:h)?)
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}  # End of a word
+
+    def to_pattern(node: dict) -> str:
+        branches = [re.escape(char) + to_pattern(child)
+                    for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        pattern = branches[0] if len(branches) == 1 else \
+            '(?:' + '|'.join(branches) + ')'
+        return f'(?:{pattern})?' if '' in node else pattern
+
+    return to_pattern(trie)
+
+
+# Finds whether any check is in the lowercase string in one pass
+_CHECK_PATTERN = re.compile(_trie_pattern([text for text, _ in CHECKS]))
+# Makes all of the replacements in one pass
+_REPLACEMENT_PATTERN = re.compile(
+    _trie_pattern([old for old, _ in REPLACEMENTS]))
+_REPLACEMENT_DICT = dict(REPLACEMENTS)
+
+
 class ParsingError(ValueError):
     """ Represents an error in the parsing of a string to a SymPy object. """
     pass
 
 
+class ParseCache:
+    """ A least recently used cache of parsed strings, keyed by the string,
+    the local dict and whether it is evaluated. SymPy objects are immutable,
+    so they can be shared. Parsing errors are cached too, as the same
+    invalid input is often retried.
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[tuple, sp.Basic | ParsingError] = \
+            OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: tuple) -> sp.Basic | ParsingError | None:
+        """ Returns the cached object or error, or None if there isn't one. """
+        with deferred():
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: tuple, value: sp.Basic | ParsingError) -> None:
+        """ Caches the object or error, evicting the least recently used one
+        if the cache is full.
+        """
+        with deferred():
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        """ Returns the cache's counters. """
+        return {"entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions}
+
+
+parses = ParseCache(MAX_PARSES)
+
+
+def _check(s: str) -> None:
+    """ Raises a parsing error if the string s contains any of the checks. """
+    lowered = s.lower()
+    if _CHECK_PATTERN.search(lowered) is None:
+        return
+    # Only invalid strings are searched again, for the first check in order
+    for text, message in CHECKS:
+        if text in lowered:
+            if message is None:
+                message = invalid_input(s)
+            raise ParsingError(message)
+
+
+@timed("parse")
 def _parse(s: str,
            local_dict: dict | None = None,
            evaluate: bool = False) -> sp.Basic:
     """ Converts the string s to a SymPy object.
     If the string is an equation, then a SymPy relational object is returned.
     Otherwise, a SymPy expression object is returned.
+    Results and parsing errors are cached.
     """
-    # Invalid characters
-    INVALID = ['"', "#", "$", "&", "'", ":", ";", "?", "@", "_", "`", "~"]
-    for char in INVALID:
-        if char in s:
-            raise ParsingError(invalid_character(char))
-    # Blacklist
-    for banned in BANNED:
-        if banned in s.lower():
-            raise ParsingError(invalid_input(s))
-    # Latex
-    if '\\' in s:
-        raise ParsingError(no_latex())
-    # Factorial
-    if "!!!" in s:
-        raise ParsingError(invalid_factorial())
-    # Absolute value
-    if '|' in s:
-        raise ParsingError(invalid_syntax("abs(x)", "|x|"))
-    # Power
-    for i, digit in enumerate(['²', '³', '⁴', '⁵', '⁶', '⁷', '⁸', '⁹']):
-        if digit in s:
-            raise ParsingError(invalid_syntax(f"^{i+2}", digit))
-    if 'squared' in s.lower():
-        raise ParsingError(invalid_syntax("^2", "squared"))
-    if 'cubed' in s.lower():
-        raise ParsingError(invalid_syntax("^3", "cubed"))
-    # Square root
-    if '√' in s:
-        raise ParsingError(invalid_syntax("sqrt(x) or root(x, 2)", "√x"))
-    if 'square root' in s.lower():
-        raise ParsingError(invalid_syntax("sqrt(x) or root(x, 2)",
-                                          "square root x"))
-    # Brackets
-    if '{' in s or '}' in s:
-        raise ParsingError(invalid_syntax("()", "{}"))
-    if '[' in s or ']' in s:
-        raise ParsingError(invalid_syntax("()", "[]"))
-    # Local dict
-    CONVERSIONS = {
-        'e': sp.E,
-        'π': sp.pi,
-        'arcsin': sp.asin,
-        'arccos': sp.acos,
-        'arctan': sp.atan,
-        'cosec': sp.csc,
-        'arcsinh': sp.asinh,
-        'arccosh': sp.acosh,
-        'arctanh': sp.atanh,
-    }
-    if local_dict is None:
-        local_dict = {}
-    local_dict.update(CONVERSIONS)
+    key = (s, frozenset((local_dict or {}).items()), evaluate)
+    res = parses.get(key)
+    if res is None:
+        try:
+            res = _parse_uncached(s, local_dict, evaluate)
+        except ParsingError as error:
+            # A new error, so that the cache does not keep the traceback
+            res = ParsingError(str(error))
+        parses.put(key, res)
+    if isinstance(res, ParsingError):
+        raise ParsingError(str(res))
+    return res
+
+
+def _parse_uncached(s: str,
+                    local_dict: dict | None,
+                    evaluate: bool) -> sp.Basic:
+    """ Converts the string s to a SymPy object without the cache. """
+    # Invalid input
+    _check(s)
+    # Names, with the conversions taking precedence over the local dict
+    names = ChainMap(CONVERSIONS, local_dict or {}, NAMESPACE)
     # Manual replacements
-    REPLACEMENTS = {
-        '⋅': '*',
-        '×': '*',
-        '÷': '/',
-        '–': '-',
-        '°': '*(pi/180)',
-        'deg': '*(pi/180)',
-        'mod': 'Mod',
-        'million': '*(10^6)',
-        'billion': '*(10^9)',
-        'trillion': '*(10^12)',
-        'quadrillion': '*(10^15)',
-        'quintillion': '*(10^18)',
-        'sextillion': '*(10^21)',
-        'septillion': '*(10^24)',
-        'octillion': '*(10^27)',
-        'nonillion': '*(10^30)',
-        'decillion': '*(10^33)',
-    }
-    for old, new in REPLACEMENTS.items():
-        s = s.replace(old, new)
+    s = _REPLACEMENT_PATTERN.sub(
+        lambda match: _REPLACEMENT_DICT[match.group()], s)
     # Parsing
-    transformations = sympy_parser.T[:11]  # Skip rationalize
     try:
         with sp.evaluate(evaluate):  # Prevents 1=1 from evaluating to True
-            return sympy_parser.parse_expr(s,
-                                           local_dict=local_dict,
-                                           transformations=transformations,
-                                           evaluate=evaluate)
-    except TokenError:
+            return parse(s, names, evaluate)
+    except UnclosedBracket:
         raise ParsingError(missing_closing_bracket(s))
-    except AttributeError as error:
+    except AttributeAccess:
+        raise ParsingError(invalid_syntax("*", "."))
+    except AttributeError:
         if '.' in s:
             raise ParsingError(invalid_syntax("*", "."))
         raise ParsingError(invalid_input(s))
@@ -140,7 +278,9 @@ def _parse(s: str,
             if str(error).startswith(func):
                 raise ParsingError(only_one_argument(func))
         raise ParsingError(invalid_input(s))
-    except SyntaxError:
+    except (SyntaxError, RecursionError):  # e.g. very deeply nested brackets
+        raise ParsingError(invalid_input(s))
+    except sp.SympifyError:  # e.g. a function without arguments, sin + 1
         raise ParsingError(invalid_input(s))
 
 
@@ -199,20 +339,20 @@ def parse_func(s: str, var_str: str) -> Func:
             raise ParsingError(f"The variable in your function does not match "
                                f"the variable you have specified: "
                                f"{func_var_str} != {var_str}")
+        var = parse_var(var_str)
+        expr = parse_expr(expr_str, local_dict={var_str: var})
     # Otherwise, check if the user has entered an expression.
-    # If so, add the function notation.
+    # If so, add the function notation. The expression is only parsed once,
+    # as the check also gives its value.
     # e.g. 2x => f(x) = 2x
     else:
         try:
-            _ = parse_expr(s)
+            expr = parse_expr(s, local_dict={var_str: sp.Symbol(var_str)})
         except Exception:
             raise ParsingError(f"{s} is not a function")
-        else:
-            name = DEFAULT_FUNCTION_NAME
-            expr_str = s
+        name = DEFAULT_FUNCTION_NAME
+        var = parse_var(var_str)
     # Finally, return the function object.
-    var = parse_var(var_str)
-    expr = parse_expr(expr_str, local_dict={var_str: var})
     return Func(name, var, expr)
 
 
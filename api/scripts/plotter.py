@@ -0,0 +1,427 @@
+""" Code for plotting graphs with NumPy and Matplotlib directly, instead of
+going through SymPy's plotting module.
+"""
+from typing import Callable
+
+import numpy as np
+import sympy as sp
+from matplotlib import colormaps
+from matplotlib.axes import Axes
+from matplotlib.collections import LineCollection
+from matplotlib.colors import ListedColormap, Normalize
+from matplotlib.figure import Figure
+from matplotlib.patches import Patch
+from mpl_toolkits.mplot3d import proj3d
+from mpl_toolkits.mplot3d.axes3d import Axes3D
+
+from scripts.kernels import Kernel, get_kernel
+from scripts.timings import timed
+from scripts.utils import Func, Limit, Var
+
+# Function and parametric graphs start from evenly spaced samples and are
+# refined where the line is long or turns sharply on screen, measured in
+# axes units.
+INITIAL_SAMPLES = 201
+MAX_SAMPLES = 5000  # Per curve
+MAX_DEPTH = 12  # Times an interval may be halved
+MAX_LENGTH = 0.01  # Of a line segment
+MAX_ANGLE = 0.1  # Radians turned between line segments
+CLIP = 0.5  # How far off screen a line is still refined
+FENCE = 3  # Interquartile ranges beyond which y values are outliers
+GRID_SIZE = (400, 300)  # Points along x and y for implicit graphs
+# Matplotlib sorts the polygons of a 3D surface by depth one at a time in
+# Python, so their number bounds how long a 3D graph takes to draw.
+MAX_POLYGONS = 3600  # Shared between the surfaces of a 3D graph
+SURFACE_CMAP = 'viridis'
+
+
+def make_figure() -> tuple[Figure, Axes]:
+    """ Creates a figure for a 2D graph, styled like SymPy's plots. """
+    fig = Figure()
+    ax = fig.add_subplot()
+    ax.spines['right'].set_color('none')
+    ax.spines['top'].set_color('none')
+    ax.xaxis.set_ticks_position('bottom')
+    ax.yaxis.set_ticks_position('left')
+    return fig, ax
+
+
+def set_limits(ax: Axes, dom: Limit | None, ran: Limit | None) -> None:
+    """ Sets the domain and range of the graph, autoscaling whichever is not
+    given. The axis lines pass through the origin if it is in view and
+    through the centre otherwise.
+    """
+    ax.autoscale_view()
+    if dom:
+        ax.set_xlim(float(dom.lower), float(dom.upper))
+    if ran:
+        ax.set_ylim(float(ran.lower), float(ran.upper))
+    xl, xh = ax.get_xlim()
+    yl, yh = ax.get_ylim()
+    ax.spines['left'].set_position(('data', 0) if xl * xh <= 0 else 'center')
+    ax.spines['bottom'].set_position(('data', 0) if yl * yh <= 0 else 'center')
+    ax.set_aspect('auto')
+
+
+def _robust_range(values: np.ndarray) -> tuple[float, float] | None:
+    """ Returns the range of the finite values without any outliers, such as
+    those near an asymptote, or None if there are no finite values.
+    """
+    values = values[np.isfinite(values)]
+    if values.size == 0:
+        return None
+    lower, upper = values.min(), values.max()
+    q1, q3 = np.percentile(values, [25, 75])
+    iqr = q3 - q1
+    if iqr > 0:
+        lower = max(lower, q1 - FENCE * iqr)
+        upper = min(upper, q3 + FENCE * iqr)
+    return float(lower), float(upper)
+
+
+def _sample(evaluate: Callable[[np.ndarray], np.ndarray],
+            t: np.ndarray,
+            points: np.ndarray,
+            lower: tuple[float, float],
+            upper: tuple[float, float]) -> tuple[np.ndarray, np.ndarray, int]:
+    """ Refines the evenly spaced samples t of a curve, whose points (one
+    per column) are given by evaluate, where the line through the points is
+    long or turns sharply within the view from the lower to the upper
+    corner. Returns the refined samples and points, with NaN separating the
+    pieces of the line either side of a jump, and the number of jumps and
+    asymptotes found.
+    """
+    lower = np.array(lower, dtype=float)[:, np.newaxis]
+    size = np.array(upper, dtype=float)[:, np.newaxis] - lower
+    size[size == 0] = 1.0
+    min_step = (t[1] - t[0]) / 2 ** MAX_DEPTH
+
+    def to_screen(points):
+        """ Returns the steps between the points in axes units. """
+        screen = np.clip((points - lower) / size, -CLIP, 1 + CLIP)
+        return np.diff(screen, axis=1)
+
+    for _ in range(MAX_DEPTH + 1):
+        du, dv = to_screen(points)
+        with np.errstate(invalid='ignore'):
+            length = np.hypot(du, dv)
+            refine = length > MAX_LENGTH
+            # Both sides of a sharp turn
+            turns = np.abs(np.diff(np.arctan2(dv, du))) > MAX_ANGLE
+        refine[:-1] |= turns
+        refine[1:] |= turns
+        # The edges of the curve's domain, e.g. x = 0 for sqrt(x)
+        defined = np.isfinite(points).all(axis=0)
+        refine |= defined[:-1] != defined[1:]
+        refine &= np.diff(t) > min_step
+        index = np.flatnonzero(refine)
+        if index.size > MAX_SAMPLES - t.size:
+            # Spend what is left of the budget on the longest lines, so that
+            # the whole curve is refined evenly
+            longest = np.argsort(-np.nan_to_num(length[index]), kind='stable')
+            index = np.sort(index[longest[:MAX_SAMPLES - t.size]])
+        if index.size == 0:
+            break
+        new_t = (t[index] + t[index + 1]) / 2
+        t = np.insert(t, index + 1, new_t)
+        points = np.insert(points, index + 1, evaluate(new_t), axis=1)
+
+    # A continuous line is short on screen once it has been fully refined,
+    # so any line that is still long there is a jump. A line that leaves the
+    # view where the curve becomes undefined has an asymptote there,
+    # e.g. log(x) at x = 0.
+    du, dv = to_screen(points)
+    refined = np.diff(t) <= min_step
+    defined = np.isfinite(points).all(axis=0)
+    with np.errstate(invalid='ignore'):
+        jumps = refined & (np.hypot(du, dv) > MAX_LENGTH)
+        outside = ((points < lower) | (points > lower + size)).any(axis=0)
+    asymptotes = (refined & (defined[:-1] != defined[1:])
+                  & (outside[:-1] | outside[1:]))
+    index = np.flatnonzero(jumps)
+    t = np.insert(t, index + 1, (t[index] + t[index + 1]) / 2)
+    points = np.insert(points, index + 1, np.nan, axis=1)
+    return t, points, index.size + np.count_nonzero(asymptotes)
+
+
+def _sample_func(kernel: Kernel,
+                 x: np.ndarray,
+                 y: np.ndarray,
+                 view: tuple[float, float]) -> tuple[np.ndarray, np.ndarray,
+                                                     int]:
+    """ Refines the evenly spaced samples x and y of the function's kernel
+    within the view of y values. See _sample.
+    """
+    x, points, breaks = _sample(lambda t: np.stack([t, kernel(t)]),
+                                x,
+                                np.stack([x, y]),
+                                (x[0], view[0]),
+                                (x[-1], view[1]))
+    return x, points[1], breaks
+
+
+@timed("plot")
+def plot_funcs(funcs: list[Func],
+               colors: list[str],
+               dom: Limit,
+               ran: Limit | None) -> Figure:
+    """ Plots the functions over the domain. If no range is given, the
+    range is chosen to show all of the functions, or all but their outliers
+    if a function has a jump or an asymptote.
+    """
+    fig, ax = make_figure()
+    kernels = [get_kernel(func.expr, [func.var]) for func in funcs]
+    x = np.linspace(float(dom.lower), float(dom.upper), INITIAL_SAMPLES)
+    ys = [kernel(x) for kernel in kernels]
+    values = np.concatenate(ys)
+    if not np.isfinite(values).any() or x[-1] == x[0]:
+        lines = [(x, y) for y in ys]
+    elif ran:
+        view = (float(ran.lower), float(ran.upper))
+        lines = [_sample_func(k, x, y, view)[:2] for k, y in zip(kernels, ys)]
+    else:
+        view = _robust_range(values)
+        samples = [_sample_func(k, x, y, view) for k, y in zip(kernels, ys)]
+        breaks = sum(count for *_, count in samples)
+        full_view = (np.nanmin(values), np.nanmax(values))
+        if view != full_view and breaks == 0:
+            # The outliers are part of a continuous line, so show them
+            samples = [_sample_func(k, x, y, full_view)
+                       for k, y in zip(kernels, ys)]
+        elif view != full_view:
+            # Leave the same margin as autoscaling would
+            margin = (view[1] - view[0]) * ax.margins()[1]
+            ax.set_ylim(view[0] - margin, view[1] + margin)
+        lines = [(line_x, line_y) for line_x, line_y, _ in samples]
+    for (line_x, line_y), color in zip(lines, colors):
+        ax.plot(line_x, line_y, color=color)
+    set_limits(ax, dom, ran)
+    return fig
+
+
+@timed("plot")
+def plot_parametric(xt: sp.Expr,
+                    yt: sp.Expr,
+                    t_start: sp.Expr,
+                    t_end: sp.Expr) -> Figure:
+    """ Plots the parametric curve (x(t), y(t)) over the interval of t. The
+    domain and range are chosen to show all of the curve, or all but its
+    outliers if it has a jump or an asymptote.
+    """
+    fig, ax = make_figure()
+    kernel = get_kernel(sp.Tuple(xt, yt), [Var.T])
+    t = np.linspace(float(t_start), float(t_end), INITIAL_SAMPLES)
+    samples = kernel(t)
+    points = samples
+    finite = samples[:, np.isfinite(samples).all(axis=0)]
+    if finite.size and t[-1] != t[0]:
+        full = (tuple(finite.min(axis=1)), tuple(finite.max(axis=1)))
+        view = tuple(zip(*[_robust_range(values) for values in finite]))
+        _, points, breaks = _sample(kernel, t, samples, *view)
+        if view != full and breaks == 0:
+            # The outliers are part of a continuous curve, so show them
+            _, points, _ = _sample(kernel, t, samples, *full)
+        elif view != full:
+            # Leave the same margins as autoscaling would
+            (xl, yl), (xh, yh) = view
+            xm, ym = ax.margins()
+            ax.set_xlim(xl - (xh - xl) * xm, xh + (xh - xl) * xm)
+            ax.set_ylim(yl - (yh - yl) * ym, yh + (yh - yl) * ym)
+    ax.plot(points[0], points[1])
+    set_limits(ax, None, None)
+    return fig
+
+
+def _marching_squares(x: np.ndarray,
+                      y: np.ndarray,
+                      z: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """ Finds the line segments where z, sampled on the evenly spaced grid
+    of x and y values, crosses zero. Returns an array of shape (n, 2, 2)
+    holding the end points of the n segments, and the largest magnitude of
+    z at the corners of the cell each segment is in.
+    """
+    # The corners of each cell in anticlockwise order from the bottom left.
+    # Edge i of a cell goes from corner i to corner i + 1, so the edges are
+    # the bottom, right, top and left in that order.
+    corners = np.stack([z[:-1, :-1], z[:-1, 1:], z[1:, 1:], z[1:, :-1]])
+    above = corners > 0
+    crossed = above != np.roll(above, -1, axis=0)
+    with np.errstate(all='ignore'):
+        t = corners / (corners - np.roll(corners, -1, axis=0))
+    # Interpolate where each edge crosses zero
+    x0, y0 = np.meshgrid(x[:-1], y[:-1])
+    dx, dy = x[1] - x[0], y[1] - y[0]
+    points_x = np.stack([x0 + t[0] * dx, x0 + dx, x0 + (1 - t[2]) * dx, x0])
+    points_y = np.stack([y0, y0 + t[1] * dy, y0 + dy, y0 + (1 - t[3]) * dy])
+
+    valid = np.isfinite(corners).all(axis=0)
+    count = crossed.sum(axis=0)
+    pairs = []
+    # A cell crossed on two edges holds one segment joining them
+    cells = valid & (count == 2)
+    first, second = np.argsort(~crossed[:, cells], axis=0, kind='stable')[:2]
+    pairs.append((cells, first, second))
+    # A cell crossed on all four edges is a saddle. The sign at its centre
+    # decides which two opposite corners are cut off.
+    cells = valid & (count == 4)
+    centre = corners[:, cells].mean(axis=0)
+    joined = (centre > 0) == above[0, cells]
+    # Either the bottom right and top left corners are cut off, or the
+    # bottom left and top right corners
+    pairs.append((cells, np.where(joined, 0, 3), np.where(joined, 1, 0)))
+    pairs.append((cells, np.where(joined, 2, 1), np.where(joined, 3, 2)))
+
+    segments, scales = [], []
+    size = np.abs(corners).max(axis=0)
+    for cells, i, j in pairs:
+        px, py = points_x[:, cells], points_y[:, cells]
+        index = np.arange(i.size)
+        start = np.stack([px[i, index], py[i, index]], axis=-1)
+        end = np.stack([px[j, index], py[j, index]], axis=-1)
+        segments.append(np.stack([start, end], axis=1))
+        scales.append(size[cells])
+    return np.concatenate(segments), np.concatenate(scales)
+
+
+def _contour(kernel: Kernel,
+             x: np.ndarray,
+             y: np.ndarray,
+             z: np.ndarray) -> np.ndarray:
+    """ Returns the line segments where the kernel's values z, sampled on
+    the grid of x and y values, are zero.
+    """
+    segments, scales = _marching_squares(x, y, z)
+    # A sign change across a pole or jump (e.g. 1/x = y at x = 0) is not a
+    # zero. The middle of a true segment is closer to zero than the corners
+    # of its cell, so segments whose middle is not are dropped.
+    middle = segments.mean(axis=1)
+    values = np.abs(kernel(middle[:, 0], middle[:, 1], pointwise=False))
+    return segments[values < scales]
+
+
+@timed("plot")
+def plot_rels(rels: list[sp.Rel],
+              colors: list[str],
+              dom: Limit,
+              ran: Limit) -> tuple[Figure, list[Patch]] | None:
+    """ Plots the relations in x and y over the domain and range, styled
+    like SymPy's implicit plots. The relations are evaluated over one grid
+    shared between them. Returns the figure and a legend handle for each
+    relation, or None if a relation cannot be evaluated with NumPy.
+    """
+    kernels = []
+    for rel in rels:
+        if isinstance(rel, sp.Eq):
+            expr = rel.lhs - rel.rhs
+        elif isinstance(rel, (sp.StrictGreaterThan, sp.StrictLessThan,
+                              sp.GreaterThan, sp.LessThan)):
+            expr = rel.gts - rel.lts  # Positive where the relation holds
+        else:
+            return None
+        kernels.append(get_kernel(expr, [Var.X, Var.Y]))
+
+    fig, ax = make_figure()
+    x = np.linspace(float(dom.lower), float(dom.upper), GRID_SIZE[0])
+    y = np.linspace(float(ran.lower), float(ran.upper), GRID_SIZE[1])
+    grid = np.meshgrid(x, y)
+    handles = []
+    for rel, kernel, color in zip(rels, kernels, colors):
+        try:
+            z = kernel(*grid, pointwise=False)
+            segments = _contour(kernel, x, y, z)
+        except Exception:
+            return None
+        if not isinstance(rel, sp.Eq):
+            # Fill the region where the inequality holds
+            region = np.where(z > 0, 1.0, np.nan)
+            ax.imshow(region,
+                      cmap=ListedColormap([color]),
+                      extent=(x[0], x[-1], y[0], y[-1]),
+                      origin='lower',
+                      aspect='auto',
+                      interpolation='nearest')
+        # The boundary is dashed where it is not part of the region
+        strict = isinstance(rel, (sp.StrictGreaterThan, sp.StrictLessThan))
+        ax.add_collection(LineCollection(segments,
+                                         colors=color,
+                                         linestyles='dashed' if strict
+                                         else 'solid'))
+        handles.append(Patch(color=color))
+    set_limits(ax, dom, ran)
+    return fig, handles
+
+
+def _legend_color(ax: Axes3D,
+                  grid: list[np.ndarray],
+                  z: np.ndarray,
+                  cmap) -> tuple:
+    """ Returns the colour Matplotlib gives the legend entry of the surface,
+    which is the colour of the polygon furthest away in the current view.
+    Matplotlib would find it by sorting all of the polygons an extra time,
+    one at a time in Python, so it is found here with NumPy instead.
+    """
+    defined = np.isfinite(z)
+    corners = (slice(None, -1), slice(1, None))
+
+    def cells(values: np.ndarray) -> np.ndarray:
+        # The mean of the defined corners of each polygon, as Matplotlib
+        # drops the others
+        values = np.where(defined, values, 0)
+        total = sum(values[i, j] for i in corners for j in corners)
+        count = sum(defined[i, j] for i in corners for j in corners)
+        return np.where(count > 0, total / np.maximum(count, 1), np.nan)
+
+    heights = cells(z)
+    finite = np.isfinite(heights)
+    if not finite.any():
+        return cmap(0.5)
+    _, _, depth = proj3d.proj_transform(grid[0].ravel(), grid[1].ravel(),
+                                        z.ravel(), ax.get_proj())
+    depth = cells(depth.reshape(z.shape))
+    far = np.argmax(np.where(finite, depth, -np.inf))
+    norm = Normalize(heights[finite].min(), heights[finite].max())
+    return cmap(norm(heights.flat[far]))
+
+
+@timed("plot")
+def plot_surfaces(exprs: list[sp.Expr],
+                  dom: Limit,
+                  ran: Limit) -> tuple[Figure, list[Patch]]:
+    """ Plots the expressions in x and y as surfaces over the domain and
+    range, styled like SymPy's 3D plots. The surfaces are evaluated over one
+    grid shared between them, as fine as the polygon budget allows.
+    Returns the figure and a legend handle for each surface.
+    """
+    kernels = [get_kernel(expr, [Var.X, Var.Y]) for expr in exprs]
+    fig = Figure()
+    ax = fig.add_subplot(projection='3d')
+    cells = int(np.sqrt(MAX_POLYGONS / len(exprs)))
+    x = np.linspace(float(dom.lower), float(dom.upper), cells + 1)
+    y = np.linspace(float(ran.lower), float(ran.upper), cells + 1)
+    grid = np.meshgrid(x, y)
+    cmap = colormaps[SURFACE_CMAP]
+    surfaces = []
+    lower, upper = np.inf, -np.inf
+    for kernel in kernels:
+        z = kernel(*grid)
+        ax.plot_surface(*grid, z,
+                        cmap=cmap,
+                        rstride=1,
+                        cstride=1,
+                        linewidth=0.1,
+                        rasterized=True,
+                        label='_nolegend_')
+        finite = z[np.isfinite(z)]
+        if finite.size:
+            lower, upper = min(lower, finite.min()), max(upper, finite.max())
+        surfaces.append(z)
+    ax.set_xlim(x[0], x[-1])
+    ax.set_ylim(y[0], y[-1])
+    if lower < upper:
+        ax.set_zlim(lower, upper)
+    ax.set_xlabel('$x$')
+    ax.set_ylabel('$y$')
+    ax.set_zlabel('$f\\left(x, y\\right)$')
+    # The view is only known once the limits are set
+    handles = [Patch(color=_legend_color(ax, grid, z, cmap)) for z in surfaces]
+    return fig, handles
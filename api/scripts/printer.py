@@ -1,79 +1,297 @@
-""" Code for printing. """
-import re
-import sympy as sp
+""" Code for printing.
+
+Objects are printed in one walk of their tree by SymPy printers, with the
+output of each subtree memoised, as results often repeat subexpressions.
+"""
 from typing import Any
 
+import sympy as sp
+from sympy.printing.latex import LatexPrinter
+from sympy.printing.precedence import precedence
+from sympy.printing.str import StrPrinter
+
+from scripts.timings import timed
 from scripts.utils import Func, Limit
 
+# The last and first characters of two factors between which the
+# multiplication sign is left out, e.g. 2x and (x+1)(x+2) but x*2
+BEFORE_IMPLICIT = set('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+                      '0123456789)]π')
+AFTER_IMPLICIT = set('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+                     '(π')
+
 
-def _neaten(s: str) -> str:
-    """ Replaces some characters with more readable ones
-    and strips unnecessary characters. 
+class _MemoPrinter:
+    """ Memoises the output of each subtree in a printer. Subtrees printed
+    with options, such as the exponent of a function, are not memoised.
     """
-    STRIP = [' ']
-    for char in STRIP:
-        s = s.replace(char, '')
 
-    REPLACEMENTS = [('**', '^'),
-                    ('E', 'e'),
-                    ('I', 'i'),
-                    ('-1*', '-'),
-                    ('(-1)*', '-'),
-                    ('Mod', 'mod'),
-                    ('Abs', 'abs')]
-    for old, new in REPLACEMENTS:
-        s = s.replace(old, new)
+    def __init__(self, settings: dict | None = None) -> None:
+        super().__init__(settings)
+        self._memo: dict[sp.Basic, str] = {}
 
-    # Strip * between non-number*non-number or number*non-number
-    # Don't strip between number*non-number or number*number
-    s = re.sub(r'(?<=[a-zA-Z0-9\)\]])\*(?=[a-zA-Z\(])', '', s)
+    def _print(self, expr: Any, **kwargs) -> str:
+        # The root is printed once, and may be printed differently
+        if kwargs or self._print_level == 0 or not isinstance(expr, sp.Basic):
+            return super()._print(expr, **kwargs)
+        res = self._memo.get(expr)
+        if res is None:
+            res = self._memo[expr] = super()._print(expr)
+        return res
 
-    s = s.replace('pi', 'π')
-    return s
 
+class DasPrinter(_MemoPrinter, StrPrinter):
+    """ Prints SymPy objects in DAS's format, which is SymPy's without
+    spaces, with ^ for powers, e, i and π for the constants and without the
+    multiplication signs that are not needed, e.g. 2*x**2 + E => 2x^2+e.
+    """
 
-def make_pretty(obj: Any) -> str:
-    """ Returns the pretty print of the object. """
-    # Func
-    if isinstance(obj, Func):
-        return f"{obj.name}({obj.var})={make_pretty(obj.expr)}"
+    def doprint(self, expr: Any) -> str:
+        # SymPy separates arguments with ', ' in many places, e.g. Subs,
+        # Limit and Matrix, so the spaces are stripped once at the end
+        return super().doprint(expr).replace(' ', '')
 
-    # Limit
-    if isinstance(obj, Limit):
-        return f"[{make_pretty(obj.lower)},{make_pretty(obj.upper)}]"
+    def _print_Basic(self, expr: sp.Basic) -> str:
+        args = ','.join([self._print(arg) for arg in expr.args])
+        return f"{type(expr).__name__}({args})"
+
+    def _print_Exp1(self, expr: sp.Basic) -> str:
+        return 'e'
+
+    def _print_ImaginaryUnit(self, expr: sp.Basic) -> str:
+        return 'i'
+
+    def _print_Pi(self, expr: sp.Basic) -> str:
+        return 'π'
 
-    # Simple Sets
-    if obj == sp.EmptySet:
+    def _print_Dummy(self, expr: sp.Dummy) -> str:
+        return expr.name  # e.g. the n in the solutions 2nπ
+
+    def _print_Abs(self, expr: sp.Abs) -> str:
+        return f"abs({self.stringify(expr.args, ',')})"
+
+    def _print_Mod(self, expr: sp.Mod) -> str:
+        return f"mod({self.stringify(expr.args, ',')})"
+
+    def _print_EmptySet(self, expr: sp.Set) -> str:
         return "∅"
-    if obj == sp.Reals:
-        return "Reals"
-    if obj == sp.Complexes:
-        return "Complexes"
 
-    # Equations
-    if isinstance(obj, sp.Eq):
-        s = f"{obj.lhs} = {obj.rhs}"
-    elif isinstance(obj, sp.Ne):
-        s = f"{obj.lhs} != {obj.rhs}"
+    def _print_Interval(self, expr: sp.Interval) -> str:
+        left_bracket = '(' if expr.left_open else '['
+        right_bracket = ')' if expr.right_open else ']'
+        return (f"{left_bracket}{self._print(expr.start)},"
+                f"{self._print(expr.end)}{right_bracket}")
+
+    def _print_ImageSet(self, expr: sp.ImageSet) -> str:
+        return self._print(expr.lamda.expr)
+
+    def _print_Relational(self, expr: sp.Rel) -> str:
+        # Equations are written without brackets, e.g. x+y=1
+        if expr.rel_op in ('==', '!='):
+            op = '=' if expr.rel_op == '==' else '!='
+            return f"{self._print(expr.lhs)}{op}{self._print(expr.rhs)}"
+        op = self._relationals.get(expr.rel_op) or expr.rel_op
+        return (f"{self.parenthesize(expr.lhs, precedence(expr))}{op}"
+                f"{self.parenthesize(expr.rhs, precedence(expr))}")
 
-    # Interval
-    elif isinstance(obj, sp.Interval):
-        left_bracket = '(' if obj.left_open else '['
-        right_bracket = ')' if obj.right_open else ']'
-        s = f"{left_bracket}{obj.start},{obj.end}{right_bracket}"
+    def _print_LatticeOp(self, expr: sp.Basic) -> str:
+        # e.g. Max, Min and Union
+        args = sorted(expr.args, key=sp.default_sort_key)
+        return f"{type(expr).__name__}({self.stringify(args, ',')})"
 
-    # Image Set
-    elif isinstance(obj, sp.ImageSet):
-        s = str(obj.lamda.expr).replace('_n', 'n')
+    def _print_FiniteSet(self, expr: sp.FiniteSet) -> str:
+        items = sorted(expr, key=sp.default_sort_key)
+        if any(item.has(sp.FiniteSet) for item in items):
+            return f"FiniteSet({self.stringify(items, ',')})"
+        return f"{{{self.stringify(items, ',')}}}"
 
-    else:
-        s = str(obj)
+    def _print_Integral(self, expr: sp.Integral) -> str:
+        limits = [lim[0] if len(lim) == 1 else sp.Tuple(*lim)
+                  for lim in expr.limits]
+        return (f"{type(expr).__name__}({self._print(expr.function)},"
+                f"{self.stringify(limits, ',')})")
 
-    return _neaten(s)
+    _print_Sum = _print_Integral
+
+    def _print_ExprCondPair(self, expr: sp.Basic) -> str:
+        return f"({self._print(expr.expr)},{self._print(expr.cond)})"
+
+    def _print_Add(self, expr: sp.Add, order: str | None = None) -> str:
+        terms = self._as_ordered_terms(expr, order=order)
+        prec = precedence(expr)
+        res = []
+        for term in terms:
+            s = self._print(term)
+            if s.startswith('-') and not term.is_Add:
+                sign = "-"
+                s = s[1:]
+            else:
+                sign = "+"
+            if precedence(term) < prec or term.is_Add:
+                s = f"({s})"
+            res.append(sign + s)
+        s = ''.join(res)
+        return s[1:] if s.startswith('+') else s
+
+    @staticmethod
+    def _join(factors: list[str]) -> str:
+        """ Joins the factors of a product, e.g. ['2', 'x', '(-1)', 'y'] =>
+        2x*-y. A factor of -1 becomes the sign of the next factor, and the
+        multiplication sign is left out where it is not needed.
+        """
+        merged = []
+        for factor in reversed(factors):
+            if factor in ('-1', '(-1)') and merged:
+                merged[-1] = '-' + merged[-1]
+            else:
+                merged.append(factor)
+        merged.reverse()
+        res = [merged[0]]
+        for factor in merged[1:]:
+            if res[-1][-1] not in BEFORE_IMPLICIT or \
+                    factor[0] not in AFTER_IMPLICIT:
+                res.append('*')
+            res.append(factor)
+        return ''.join(res)
+
+    def _print_Mul(self, expr: sp.Mul) -> str:
+        # The same as SymPy's StrPrinter, except for how factors are joined
+        prec = precedence(expr)
+        args = expr.args
+        # Unevaluated products show all of their factors in order
+        if args[0] is sp.S.One or any(
+                isinstance(arg, sp.Number) or
+                arg.is_Pow and all(a.is_Integer for a in arg.args)
+                for arg in args[1:]):
+            d, n = sp.utilities.iterables.sift(
+                args,
+                lambda x: isinstance(x, sp.Pow) and
+                bool(x.exp.as_coeff_Mul()[0] < 0),
+                binary=True)
+            for i, di in enumerate(d):
+                if di.exp.is_Number:
+                    e = -di.exp
+                else:
+                    dargs = list(di.exp.args)
+                    dargs[0] = -dargs[0]
+                    e = sp.Mul._from_args(dargs)
+                d[i] = sp.Pow(di.base, e, evaluate=False) if e - 1 else di.base
+            pre = []
+            # The first factor is not bracketed if it is negative
+            if n and not n[0].is_Add and n[0].could_extract_minus_sign():
+                pre = [self._print(n.pop(0))]
+            nfactors = pre + [self.parenthesize(a, prec, strict=False)
+                              for a in n] or ['1']
+            if len(d) > 1 and d[0].could_extract_minus_sign():
+                pre = [self._print(d.pop(0))]
+            else:
+                pre = []
+            dfactors = pre + [self.parenthesize(a, prec, strict=False)
+                              for a in d]
+            num = self._join(nfactors)
+            if len(dfactors) > 1:
+                return f"{num}/({self._join(dfactors)})"
+            if dfactors:
+                return f"{num}/{dfactors[0]}"
+            return num
+
+        c, e = expr.as_coeff_Mul()
+        if c < 0:
+            expr = sp.core.mul._keep_coeff(-c, e)
+            sign = "-"
+        else:
+            sign = ""
+        a = []  # Factors in the numerator
+        b = []  # Factors in the denominator
+        pow_paren = []  # Powers to the -1 of products, e.g. 1/(x*y)
+        if self.order not in ('old', 'none'):
+            args = expr.as_ordered_factors()
+        else:
+            args = sp.Mul.make_args(expr)
+
+        def apow(item: sp.Basic) -> sp.Basic:
+            base, exp = item.as_base_exp()
+            eargs = list(sp.Mul.make_args(exp))
+            if eargs[0] is sp.S.NegativeOne:
+                eargs = eargs[1:]
+            else:
+                eargs[0] = -eargs[0]
+            exp = sp.Mul._from_args(eargs)
+            if isinstance(item, sp.Pow):
+                return item.func(base, exp, evaluate=False)
+            return item.func(exp, evaluate=False)
+
+        for item in args:
+            if (item.is_commutative and isinstance(item, sp.Pow) and
+                    bool(item.exp.as_coeff_Mul()[0] < 0)):
+                if item.exp is not sp.S.NegativeOne:
+                    b.append(apow(item))
+                else:
+                    if (len(item.args[0].args) != 1 and
+                            isinstance(item.base, (sp.Mul, sp.Pow))):
+                        pow_paren.append(item)
+                    b.append(item.base)
+            elif item.is_Rational and item is not sp.S.Infinity:
+                if item.p != 1:
+                    a.append(sp.Rational(item.p))
+                if item.q != 1:
+                    b.append(sp.Rational(item.q))
+            else:
+                a.append(item)
+        a = a or [sp.S.One]
+        a_str = [self.parenthesize(x, prec, strict=False) for x in a]
+        b_str = [self.parenthesize(x, prec, strict=False) for x in b]
+        for item in pow_paren:
+            if item.base in b:
+                b_str[b.index(item.base)] = f"({b_str[b.index(item.base)]})"
+        if not b:
+            return sign + self._join(a_str)
+        if len(b) == 1:
+            return f"{sign}{self._join(a_str)}/{b_str[0]}"
+        return f"{sign}{self._join(a_str)}/({self._join(b_str)})"
+
+    def _print_Pow(self, expr: sp.Pow, rational: bool = False) -> str:
+        # The same as SymPy's StrPrinter, except for the ^
+        prec = precedence(expr)
+        if expr.exp is sp.S.Half and not rational:
+            return f"sqrt({self._print(expr.base)})"
+        if expr.is_commutative:
+            if -expr.exp is sp.S.Half and not rational:
+                return f"1/sqrt({self._print(expr.base)})"
+            if expr.exp is sp.S.NegativeOne:
+                return f"1/{self.parenthesize(expr.base, prec, strict=False)}"
+        base = self.parenthesize(expr.base, prec, strict=False)
+        exp = self.parenthesize(expr.exp, prec, strict=False)
+        return f"{base}^{exp}"
+
+
+class DasLatexPrinter(_MemoPrinter, LatexPrinter):
+    """ Prints SymPy objects in LaTeX, the same as sp.latex. """
+    pass
+
+
+@timed("print")
+def make_latex(obj: Any) -> str:
+    """ Returns the LaTeX of the object. """
+    return DasLatexPrinter().doprint(obj)
+
+
+@timed("print")
+def make_pretty(obj: Any) -> str:
+    """ Returns the pretty print of the object. """
+    # Func
+    if isinstance(obj, Func):
+        return f"{obj.name}({obj.var})={make_pretty(obj.expr)}"
+    # Limit
+    if isinstance(obj, Limit):
+        return f"[{make_pretty(obj.lower)},{make_pretty(obj.upper)}]"
+    return DasPrinter().doprint(obj)
 
 
+@timed("print")
 def make_pretty_multiple(obj: Any) -> list[str]:
     """ Returns the pretty print of a sequence of objects. """
     if isinstance(obj, (sp.FiniteSet, sp.Union, sp.Intersection)):
-        return [make_pretty(arg) for arg in obj.args]
+        printer = DasPrinter()  # Shares the memo between the objects
+        return [printer.doprint(arg) for arg in obj.args]
     return [make_pretty(obj)]
@@ -0,0 +1,44 @@
+""" Code for framing the worker's messages to the API server.
+
+Every message is a frame made up of three segments, each prefixed with its
+length as a 4-byte big-endian unsigned integer:
+
+    | header length | header (JSON) | image length | image (raw PNG) |
+    | stats length | stats (JSON) |
+
+The header holds everything but the image, e.g. pretty, answer or an
+error. Sending the PNG as raw bytes avoids Base64 inflating it by a third
+and keeps the JSON the server has to decode small. Messages without an
+image have an image length of 0.
+
+The stats are measurements of the request for the server's metrics, such as
+the time spent in each stage. They are kept apart from the header so that
+the header and image of a response can be cached and sent again as they
+are. Messages without stats have a stats length of 0.
+"""
+import json
+import struct
+from typing import BinaryIO
+
+LENGTH = struct.Struct('>I')
+
+
+def encode(message: dict) -> bytes:
+    """ Encodes the message as the header and image segments of a frame. """
+    header = dict(message)
+    image = header.pop('image', None) or b''
+    body = json.dumps(header).encode('utf-8')
+    return b''.join([LENGTH.pack(len(body)), body,
+                     LENGTH.pack(len(image)), image])
+
+
+def encode_stats(stats: dict | None) -> bytes:
+    """ Encodes the stats as the last segment of a frame. """
+    body = json.dumps(stats).encode('utf-8') if stats else b''
+    return LENGTH.pack(len(body)) + body
+
+
+def write(stream: BinaryIO, message: dict, stats: dict | None = None) -> None:
+    """ Writes the message and its stats to the stream as a frame. """
+    stream.write(encode(message) + encode_stats(stats))
+    stream.flush()
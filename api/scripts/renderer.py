@@ -1,21 +1,42 @@
 """ Code for rendering. """
 import io
-import base64
+import os
+import tempfile
 from typing import Any
 
+import numpy as np
 import matplotlib
 import matplotlib.pyplot as plt
+import matplotlib.image as mimage
 import warnings
+from matplotlib import cbook
+from matplotlib.artist import Artist
+from matplotlib.backends.backend_agg import RendererAgg
+from matplotlib.figure import Figure
+from matplotlib.font_manager import FontProperties
+from matplotlib.path import Path
+from matplotlib.transforms import Affine2D
 # from sympy.plotting.plot import Plot, MatplotlibBackend
 
+from scripts.cache import DiskCache
+from scripts.timings import timed
+
 TEX_DPI = 300
 PLOT_DPI = 300
+TEX_PAD_INCHES = 0.05
+TEX_LINESPACING = 1.2  # Matplotlib's default for text
+TEX_CACHE_DIR = os.environ.get('DAS_TEX_CACHE_DIR',
+                               os.path.join(tempfile.gettempdir(),
+                                            'das-tex-cache'))
+TEX_CACHE_BYTES = 256 * 1024 * 1024
 
 matplotlib.use('agg')  # Non-interactive backend
 plt.rcParams['mathtext.fontset'] = 'cm'  # Computer Modern
 plt.rcParams['font.family'] = 'DejaVu Serif'
 warnings.filterwarnings('ignore', category=UserWarning)  # Suppress warnings
 
+tex_cache = DiskCache(TEX_CACHE_DIR, TEX_CACHE_BYTES)
+
 
 def _strip(tex: str) -> str:
     """ Removes some latex symbols and replaces some symbols to be
@@ -34,43 +55,112 @@ def _strip(tex: str) -> str:
     return tex
 
 
-def _encode(buf: io.BytesIO) -> str:
-    """ Encodes the image to Base64. """
-    return base64.b64encode(buf.getvalue()).decode('utf-8')
+def _tex_cache_key(tex: str) -> str:
+    """ Returns the key of the rendered TeX expression in the cache, which
+    covers everything that affects how it looks.
+    """
+    style = (plt.rcParams['mathtext.fontset'], plt.rcParams['font.family'])
+    return repr((tex, TEX_DPI, style, 'agg'))
 
 
-def render_tex(tex: str) -> str:
+@timed("render")
+def render_tex(tex: str) -> bytes:
     """ Converts the TeX expression to a PNG image. """
     tex = _strip(tex)
-    fig = plt.figure()
+    key = _tex_cache_key(tex)
+    image = tex_cache.get(key)
+    if image is None:
+        image = _render_tex(tex)
+        tex_cache.put(key, image)
+    return image
+
+
+def _split_math(line: str) -> tuple[str, bool]:
+    """ Returns the line to draw and whether it contains math text, in the
+    same way as Matplotlib's Text does.
+    """
+    if line == " ":
+        return r"\ ", False
+    if cbook.is_math_text(line):
+        return line, True
+    return line.replace(r"\$", "$"), False
+
+
+def _render_tex(tex: str) -> bytes:
+    """ Rasterises the stripped TeX expression straight onto an Agg canvas
+    that is measured once and sized to fit, instead of drawing a pyplot
+    figure twice to find its tight bounding box. Lines are laid out the
+    same way as Matplotlib's Text lays them out.
+    """
+    prop = FontProperties()
+    renderer = RendererAgg(1, 1, TEX_DPI)  # Only used for measuring
+    _, lp_h, lp_d = renderer.get_text_width_height_descent("lp", prop, False)
+    min_dy = (lp_h - lp_d) * TEX_LINESPACING
+    lines = []  # Each is (text, ismath, offset of the baseline from the top)
+    width = 0
+    offset = 0
+    for i, line in enumerate(tex.split('\n')):
+        line, ismath = _split_math(line)
+        w, h, d = 0, 0, 0
+        if line:
+            w, h, d = renderer.get_text_width_height_descent(line, prop,
+                                                             ismath)
+        h, d = max(h, lp_h), max(d, lp_d)
+        if i == 0:
+            offset = h - d
+        else:
+            offset += max(min_dy, (h - d) * TEX_LINESPACING)
+        lines.append((line, ismath, offset))
+        width = max(width, w)
+        offset += d
+    pad = TEX_PAD_INCHES * TEX_DPI
+    canvas_w = int(np.ceil(width + 2 * pad))
+    canvas_h = int(np.ceil(offset + 2 * pad))  # Offset is now the height
+
+    renderer = RendererAgg(canvas_w, canvas_h, TEX_DPI)
+    gc = renderer.new_gc()
+    gc.set_linewidth(0)
+    background = Affine2D().scale(canvas_w, canvas_h)
+    renderer.draw_path(gc, Path.unit_rectangle(), background, (1, 1, 1, 1))
+    gc.set_foreground('black')
+    for line, ismath, offset in lines:
+        if line:
+            renderer.draw_text(gc, pad, pad + offset, line, prop, 0,
+                               ismath=ismath)
+    gc.restore()
     buf = io.BytesIO()
-    try:
-        fig.text(x=0, y=0, s=tex, color='black')
-        plt.savefig(buf,
-                    format='png',
-                    dpi=TEX_DPI,
-                    bbox_inches='tight',
-                    pad_inches=0.05,
-                    transparent=False)
-        buf.seek(0)
-    finally:
-        plt.close(fig)
-    image = _encode(buf)
+    mimage.imsave(buf, np.asarray(renderer.buffer_rgba()), format='png',
+                  dpi=TEX_DPI)
+    image = buf.getvalue()
     buf.close()
     return image
 
 
-def render_plot(plot: Any, legend: list[str]) -> str:
-    """ Styles and saves the plot as a PNG image. """
-    buf = io.BytesIO()
+def render_plot(plot: Any, legend: list[str]) -> bytes:
+    """ Styles and saves the SymPy plot as a PNG image. """
     try:
         plot.process_series()
-        plot.ax.grid(True, linestyle=':')
-        plot.fig.legend([_strip(item) for item in legend])
-        plot.fig.savefig(buf, format='png', dpi=PLOT_DPI)
-        buf.seek(0)
+        return render_figure(plot.fig, legend)
     finally:
         plot.close()
-    image = _encode(buf)
+
+
+@timed("render")
+def render_figure(fig: Figure,
+                  legend: list[str],
+                  handles: list[Artist] | None = None) -> bytes:
+    """ Styles and saves the figure as a PNG image. The legend labels the
+    handles if given, and the artists of the figure otherwise.
+    """
+    for ax in fig.axes:
+        ax.grid(True, linestyle=':')
+    labels = [_strip(item) for item in legend]
+    if handles is None:
+        fig.legend(labels)
+    else:
+        fig.legend(handles, labels)
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=PLOT_DPI)
+    image = buf.getvalue()
     buf.close()
     return image
@@ -2,6 +2,7 @@ import sympy as sp
 
 from scripts.parser import parse_eq, parse_var
 from scripts.renderer import render_tex
+from scripts.governor import govern
 from scripts.printer import make_pretty
 from scripts.utils import Result, Error, Response
 
@@ -20,15 +21,22 @@ def solve_linear_system(args: dict) -> Response:
         if res == sp.EmptySet:
             image = render_tex("$\\text{No solution}$")
             answer = [make_pretty(res)]
+            attachment = None
         else:
             sols = list(res.args[0])  # type: ignore
+            outs = [govern(sol) for sol in sols]
             tex = ""
             for i in range(len(sols)):
-                tex += f"{vars[i]} = {sp.latex(sols[i])}"
+                tex += f"{vars[i]} = {outs[i].latex}"
                 if i < len(sols)-1:
                     tex += '|'  # Will be converted to ", "
             image = render_tex(f"${tex}$")
-            answer = [make_pretty(sol) for sol in sols]
-        return Result(pretty, image, answer)
+            answer = [out.answer for out in outs]
+            attachment = None
+            if any(out.attachment for out in outs):
+                attachment = '\n'.join(
+                    f"{var}={out.attachment or out.answer}"
+                    for var, out in zip(vars, outs))
+        return Result(pretty, image, answer, attachment)
     except Exception as e:
         return Error(name=type(e).__name__, message=str(e))
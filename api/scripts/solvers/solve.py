@@ -2,7 +2,8 @@ import sympy as sp
 
 from scripts.parser import parse_eq, parse_var, parse_dom
 from scripts.renderer import render_tex
-from scripts.printer import make_pretty, make_pretty_multiple
+from scripts.governor import govern
+from scripts.printer import make_pretty
 from scripts.utils import Result, Error, Response
 
 
@@ -17,6 +18,7 @@ def solve_equation(args) -> Response:
         res = sp.solveset(eq, var, dom)
         pretty = {"eq": make_pretty(eq),
                   "var": make_pretty(var)}
+        out = govern(res, multiple=True)
         if res == sp.EmptySet:
             image = render_tex(f"No solution")
         elif res == sp.Reals:
@@ -24,10 +26,9 @@ def solve_equation(args) -> Response:
         elif res == sp.Complexes:
             image = render_tex(f"${var} \\in \\mathbb{{C}}$")
         elif isinstance(res, sp.Interval):
-            image = render_tex(f"${var} \\in {sp.latex(res)}$")
+            image = render_tex(f"${var} \\in {out.latex}$")
         else:
-            image = render_tex(f"${var} = {sp.latex(res)}$")
-        answer = make_pretty_multiple(res)
-        return Result(pretty, image, answer)
+            image = render_tex(f"${var} = {out.latex}$")
+        return Result(pretty, image, out.answer, out.attachment)
     except Exception as e:
         return Error(name=type(e).__name__, message=str(e))
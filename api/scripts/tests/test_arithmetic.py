@@ -0,0 +1,53 @@
+import math
+import unittest
+
+from scripts.arithmetic import NotArithmetic, evaluate_arithmetic
+from scripts.parser import parse_expr
+
+
+class TestArithmetic(unittest.TestCase):
+
+    def test_same_as_sympy(self):
+        tests = [
+            "2^10 + 3/4", "1/3 + 1/6", "12345 * 6789", "5 % 2", "-2^3",
+            "2.5^3", "2.5 - 0.2", "2^0.5", "sqrt(2) * 5", "8^(2/3)",
+            "sin(90deg)", "cos(pi/3)", "e^2", "log(100, 10)", "12!",
+            "floor(7/2)", "abs(-3.5)", "1 million + 2 billion", "99^99",
+            "1.5e40", "2^-200", "ln(2) + 1",
+        ]
+        for s in tests:
+            with self.subTest(s):
+                # Converted in the same way as the result of evaluate
+                expected = parse_expr(s, evaluate=True)
+                expected = int(expected) if float(expected).is_integer() \
+                    else float(expected)
+                res = evaluate_arithmetic(parse_expr(s))
+                self.assertEqual(type(expected), type(res))
+                self.assertAlmostEqual(expected, res,
+                                       delta=abs(expected) * 2 ** -50)
+
+    def test_exact(self):
+        self.assertEqual(2 ** 100, evaluate_arithmetic(parse_expr("2^100")))
+        self.assertEqual(4, evaluate_arithmetic(parse_expr("8^(2/3)")))
+        self.assertEqual(math.inf,
+                         evaluate_arithmetic(parse_expr("10^400")))
+
+    def test_not_arithmetic(self):
+        tests = [
+            "x + 1",  # Symbols
+            "sqrt(-1)",  # Complex
+            "1/0",  # Undefined
+            "tan(pi/2)",  # Infinite
+            "sin(pi)",  # Exactly 0
+            "ln(e)",  # Exactly an integer
+            "99^99999999",  # Too large
+            "cos(715^18)",  # Too large for its fractional part
+        ]
+        for s in tests:
+            with self.subTest(s):
+                with self.assertRaises(NotArithmetic):
+                    evaluate_arithmetic(parse_expr(s))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+
+import sympy as sp
+
+from scripts.algebra import expand_expression
+from scripts.governor import LEADING_TERMS, TOO_LARGE, govern
+from scripts.parser import parse_expr
+from scripts.printer import make_latex, make_pretty
+
+
+class TestGovernor(unittest.TestCase):
+
+    def test_small(self):
+        for s in ["x^2 + 2x + 1", "sin(x)/x", "5"]:
+            with self.subTest(s):
+                expr = parse_expr(s)
+                out = govern(expr)
+                self.assertEqual(make_latex(expr), out.latex)
+                self.assertEqual(make_pretty(expr), out.answer)
+                self.assertIsNone(out.attachment)
+
+    def test_sum(self):
+        expr = sp.expand(parse_expr("(x+y+z)^30"))
+        out = govern(expr)
+        more = len(expr.args) - LEADING_TERMS
+        self.assertTrue(out.answer.startswith("x^30+30x^29y+"))
+        self.assertTrue(out.answer.endswith(f"+… {more} more terms"))
+        self.assertIn(f"\\ldots \\text{{ ({more} more terms)}}", out.latex)
+        self.assertEqual(make_pretty(expr), out.attachment)
+
+    def test_solutions(self):
+        res = sp.FiniteSet(*range(100))
+        out = govern(res, multiple=True)
+        self.assertEqual(LEADING_TERMS + 1, len(out.answer))
+        self.assertEqual("… 92 more solutions", out.answer[-1])
+        self.assertEqual(100, len(out.attachment.split('\n')))
+        # Infinite sets are measured without iterating them
+        res = sp.solveset(sp.sin(sp.Symbol('x')))
+        self.assertEqual(["2nπ", "2nπ+π"], govern(res, multiple=True).answer)
+
+    def test_single_term(self):
+        expr = sp.diff(parse_expr("tan(tan(x))^3"), sp.Symbol('x'), 8)
+        out = govern(expr)
+        self.assertEqual(TOO_LARGE, out.latex)
+        self.assertTrue(out.answer.endswith("…"))
+
+    def test_op(self):
+        res = expand_expression({"expr": "(x+y+z)^30"})
+        self.assertTrue(res.answer.endswith("… 488 more terms"))
+        self.assertIsNotNone(res.attachment)
+        res = expand_expression({"expr": "(x+1)^2"})
+        self.assertEqual("x^2+2x+1", res.answer)
+        self.assertIsNone(res.attachment)
+
+
+if __name__ == '__main__':
+    unittest.main()
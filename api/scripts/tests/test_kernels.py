@@ -0,0 +1,81 @@
+import inspect
+import unittest
+
+import numpy as np
+import sympy as sp
+
+from scripts.kernels import Kernel, KernelCache
+from scripts.parser import parse_expr
+from scripts.utils import Var
+
+
+class TestKernels(unittest.TestCase):
+
+    def evaluate(self, s: str, x: list[float]) -> list[float]:
+        kernel = Kernel(parse_expr(s), [Var.X])
+        return kernel(np.array(x, dtype=float)).tolist()
+
+    def assert_values(self, actual: list[float], expected: list[float]):
+        np.testing.assert_allclose(actual, expected, equal_nan=True)
+
+    def test_kernel(self):
+        tests = [
+            # Vectorised
+            ("x^2 + 1", [-1, 0, 2], [2, 1, 5]),
+            # Constant
+            ("5", [-1, 0, 1], [5, 5, 5]),
+            # Undefined and non-real points
+            ("1/x", [-2, 0, 2], [-0.5, np.nan, 0.5]),
+            ("sqrt(x)", [-4, 0, 4], [np.nan, 0, 2]),
+            ("log(x)", [-1, 1], [np.nan, 0]),
+            # Defined when evaluated with complex arithmetic
+            ("sqrt(x)*sqrt(x)", [-4, 4], [-4, 4]),
+            # Not supported by NumPy for complex numbers
+            ("floor(x)", [-1.5, 1.5], [-2, 1]),
+            # Not vectorised by NumPy
+            ("factorial(x)", [-1, 3], [np.nan, 6]),
+        ]
+        for s, x, expected in tests:
+            with self.subTest(s):
+                self.assert_values(self.evaluate(s, x), expected)
+
+    def test_kernel_symbols(self):
+        with self.assertRaises(ValueError):
+            Kernel(Var.X * Var.Y, [Var.X])
+        kernel = Kernel(Var.X * Var.Y, [Var.X, Var.Y])
+        x, y = np.meshgrid([1.0, 2.0], [3.0, 4.0])
+        self.assert_values(kernel(x, y), [[3, 6], [4, 8]])
+
+    def test_kernel_tuple(self):
+        kernel = Kernel(sp.Tuple(sp.sqrt(Var.T), 2), [Var.T])
+        self.assert_values(kernel(np.array([-1.0, 4.0])), [[np.nan, 2],
+                                                            [2, 2]])
+        # Evaluated point by point
+        kernel = Kernel(sp.Tuple(sp.factorial(Var.T), Var.T), [Var.T])
+        self.assert_values(kernel(np.array([3.0])), [[6], [3]])
+
+    def test_kernel_cache(self):
+        cache = KernelCache(max_entries=2)
+        kernel = cache.get(parse_expr("x^2"), [Var.X])
+        # Equal expressions share a kernel, however they were written
+        self.assertIs(kernel, cache.get(parse_expr("x**2"), [Var.X]))
+        # A kernel is a function of its symbols in order
+        cache.get(Var.X * Var.Y, [Var.X, Var.Y])
+        cache.get(Var.X * Var.Y, [Var.Y, Var.X])  # Evicts x^2
+        self.assertIsNot(kernel, cache.get(parse_expr("x^2"), [Var.X]))
+        stats = cache.stats()
+        self.assertEqual((2, 1, 4, 2), (stats["entries"], stats["hits"],
+                                        stats["misses"], stats["evictions"]))
+        self.assertGreater(stats["compile_seconds"], 0)
+        with self.assertRaises(ValueError):
+            cache.get(Var.X * Var.Y, [Var.X])
+
+    def test_kernel_cse(self):
+        kernel = Kernel(sp.sin(Var.X) ** 2 + sp.sin(Var.X), [Var.X])
+        # sin(x) is evaluated once
+        self.assertEqual(inspect.getsource(kernel.func).count("sin("), 1)
+        self.assert_values(kernel(np.array([np.pi / 2])), [2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,21 @@
+import os
+import timeit
 import unittest
 from typing import Callable
 
-from scripts.parser import (ParsingError,
+import sympy as sp
+from sympy.parsing import sympy_parser
+
+from scripts.parser import (CHECKS,
+                            CONVERSIONS,
+                            NAMESPACE,
+                            REPLACEMENTS,
+                            ParseCache,
+                            ParsingError,
+                            _CHECK_PATTERN,
+                            _check,
                             _parse,
+                            _parse_uncached,
                             parse_expr,
                             parse_var,
                             parse_eq,
@@ -21,6 +34,39 @@ from scripts.utils.error_messages import (invalid_character,
                                           invalid_root,
                                           invalid_mod)
 
+# The speed comparisons depend on the machine's load, so only run on request
+BENCHMARK = bool(os.environ.get('DAS_BENCHMARK'))
+
+# Inputs that SymPy's parser and DAS's grammar must parse the same
+CONFORMANCE = [
+    "2x^2 + 3x - 5", "x//2", "mod(2x, 3)", "-x^2", "2^-x", "x^2^3", "x**-1",
+    "1/2x", "sin x/2", "sin 2x", "sin x cos x", "sin^2 x + cos^2 x",
+    "sin(x)cos(x)", "e^-x^2", "e^(2x)", "x!", "(x+1)!", "5!!", "xy!",
+    "2j", "3.5e2x", ".5x", "0x1F", "x = y", "x < 2", "x != 1",
+    "ln(x)/log(x, 2)", "root(8, 3)", "abs(-x)", "sqrt x", "cos(30°)",
+    "2 billion", "arcsin(x)", "cosec x", "π r^2", "theta^2", "alpha beta",
+    "f(x)", "(a+b)(a-b)", "2(x+1)", "-7e^x+3e^(2x)+2", "max(x, 1)",
+    "gcd(4, 6)", "floor(x) + ceiling(x)", "1, 2", "2xπ10//Abs3", "x2y%3",
+    "xy/2 % (x-1)", "sin^2*x", "ln^2*x/2",
+]
+
+
+def parse_with_sympy(s: str, evaluate: bool) -> sp.Basic:
+    """ Parses the string with SymPy's parser, as DAS used to. """
+    for old, new in REPLACEMENTS:
+        s = s.replace(old, new)
+    # The names the transformations and evaluateFalse generate code for
+    generated = ['Symbol', 'Function', 'Number', 'Integer', 'Float', 'Add',
+                 'Mul', 'Pow', 'Eq', 'Ne', 'Lt', 'Le', 'Gt', 'Ge', 'And']
+    global_dict = {**NAMESPACE, **{name: getattr(sp, name)
+                                   for name in generated}}
+    with sp.evaluate(evaluate):
+        return sympy_parser.parse_expr(s,
+                                       local_dict=dict(CONVERSIONS),
+                                       global_dict=global_dict,
+                                       transformations=sympy_parser.T[:11],
+                                       evaluate=evaluate)
+
 
 class TestParser(unittest.TestCase):
 
@@ -72,6 +118,7 @@ class TestParser(unittest.TestCase):
             # Implicit multiplication / split symbols
             ("2x", "2*x"),
             ("xyz", "x*y*z"),
+            ("x2y", "x*2*y"),
             ("theta", "theta"),
 
             # Implicit application
@@ -177,6 +224,119 @@ class TestParser(unittest.TestCase):
         self.run_subtests(_parse, valid)
         self.run_invalid_subtests(_parse, invalid)
 
+    def test_check_pattern(self):
+        def check_each(s: str) -> None:
+            for text, message in CHECKS:
+                if text in s.lower():
+                    raise ParsingError(message or invalid_input(s))
+
+        def result(check: Callable, s: str) -> str | None:
+            try:
+                check(s)
+            except ParsingError as e:
+                return str(e)
+            return None
+
+        corpus = list(CONFORMANCE)
+        for text, _ in CHECKS:
+            corpus += [text, text.upper(), f"2x + {text}(1)", f"{text}{text}"]
+        for s in corpus:
+            with self.subTest(s):
+                contains = any(text in s.lower() for text, _ in CHECKS)
+                self.assertEqual(contains,
+                                 _CHECK_PATTERN.search(s.lower()) is not None)
+                self.assertEqual(result(check_each, s), result(_check, s))
+
+    @unittest.skipUnless(BENCHMARK, "set DAS_BENCHMARK to compare speeds")
+    def test_check_speed(self):
+        def check_each(s: str) -> None:
+            for text, message in CHECKS:
+                if text in s.lower():
+                    raise ParsingError(message)
+
+        s = "(x+1)*(x-2)*cos(3x)/(1+e^x) " * 18  # About 500 characters
+        each = min(timeit.repeat(lambda: check_each(s), number=100, repeat=3))
+        scan = min(timeit.repeat(lambda: _check(s), number=100, repeat=3))
+        self.assertLess(2 * scan, each)
+
+    def test_parse_conformance(self):
+        for s in CONFORMANCE:
+            for evaluate in [False, True]:
+                with self.subTest(s, evaluate=evaluate):
+                    expected = parse_with_sympy(s, evaluate)
+                    res = _parse_uncached(s, None, evaluate)
+                    self.assertEqual(sp.srepr(expected), sp.srepr(res))
+
+    @unittest.skipUnless(BENCHMARK, "set DAS_BENCHMARK to compare speeds")
+    def test_parse_speed(self):
+        def parse_each(f: Callable) -> None:
+            for s in CONFORMANCE:
+                f(s, False)
+
+        old = min(timeit.repeat(lambda: parse_each(parse_with_sympy),
+                                number=1, repeat=3))
+        new = min(timeit.repeat(
+            lambda: parse_each(lambda s, _: _parse_uncached(s, None, False)),
+            number=1, repeat=3))
+        self.assertLess(2 * new, old)
+
+    def test_parse_differences(self):
+        # Where SymPy's parser gave nonsense, the grammar gives these trees
+        tests = [
+            ("sin x2y (x+1)", "sin(Mul(Integer(2), Symbol('x'), Symbol('y'), "
+                              "Add(Symbol('x'), Integer(1))))"),
+            ("x=1, y", "(Equality(Symbol('x'), Integer(1)), Symbol('y'))"),
+        ]
+        for s, expected in tests:
+            with self.subTest(s):
+                res = _parse_uncached(s, None, False)
+                self.assertEqual(expected, sp.srepr(res))
+        # Only expressions can be added or multiplied
+        for s in ["(1,2)x", "2(1,2)", "x - (1,2)", "(1,2)^2"]:
+            with self.subTest(s):
+                with self.assertRaises(ParsingError):
+                    _parse_uncached(s, None, False)
+
+    def test_parse_namespace(self):
+        # Only the supported functions can be called
+        valid = [
+            ("sinc(x)", "c*i*n*s*x"),
+            ("N*2", "N*2"),
+            ("Q", "Q"),
+        ]
+        self.run_subtests(_parse, valid)
+        # Neither the namespace nor the caller's dict is changed
+        names = set(NAMESPACE)
+        local_dict = {}
+        _parse("f(x) + y", local_dict)
+        self.assertEqual(names, set(NAMESPACE))
+        self.assertEqual({}, local_dict)
+        # Nor can it be changed by anything else
+        with self.assertRaises(TypeError):
+            NAMESPACE['f'] = sp.Function('f')
+        with self.assertRaises(TypeError):
+            CONVERSIONS['e'] = sp.Symbol('e')
+
+    def test_parse_cache(self):
+        cache = ParseCache(2)
+        cache.put(('x', frozenset(), False), _parse('x'))
+        error = ParsingError(invalid_input('1 +'))
+        cache.put(('1 +', frozenset(), False), error)
+        self.assertIsNotNone(cache.get(('x', frozenset(), False)))
+        cache.put(('y', frozenset(), False), _parse('y'))  # Evicts 1 +
+        self.assertIsNone(cache.get(('1 +', frozenset(), False)))
+        stats = cache.stats()
+        self.assertEqual((2, 1, 1, 1), (stats['entries'], stats['hits'],
+                                        stats['misses'], stats['evictions']))
+        # Cached errors are raised again
+        for _ in range(2):
+            with self.assertRaises(ParsingError) as cm:
+                _parse("1 ^")
+            self.assertEqual(invalid_input("1 ^"), str(cm.exception))
+        # The local dict is part of the key
+        self.assertEqual("x*y", str(_parse("xy")))
+        self.assertEqual("xy", str(_parse("xy", {'xy': sp.Symbol('xy')})))
+
     def test_parse_expr(self):
         valid = [
             ("1 + 1", "1 + 1"),
@@ -0,0 +1,124 @@
+import unittest
+
+import numpy as np
+
+from scripts.kernels import Kernel
+from scripts.plotter import (MAX_POLYGONS, MAX_SAMPLES, _contour,
+                             _robust_range, _sample_func, plot_funcs,
+                             plot_parametric, plot_rels, plot_surfaces)
+from scripts.parser import parse_expr, parse_rel, parse_lim
+from scripts.utils import Func, Var
+
+
+class TestPlotter(unittest.TestCase):
+
+    def sample(self, s: str, view: tuple[float, float]):
+        kernel = Kernel(parse_expr(s), [Var.X])
+        x = np.linspace(-5, 5, 201)
+        return _sample_func(kernel, x, kernel(x), view)
+
+    def test_sample(self):
+        # Smooth lines are not broken
+        x, y, breaks = self.sample("x^2", (0, 25))
+        self.assertEqual(breaks, 0)
+        self.assertFalse(np.isnan(y).any())
+        self.assertTrue(np.all(np.diff(x) > 0))
+        # Sign-changing poles at +-pi/2 and +-3pi/2
+        x, y, breaks = self.sample("tan(x)", (-10, 10))
+        self.assertEqual(breaks, 4)
+        gaps = x[np.isnan(y)]
+        np.testing.assert_allclose(np.sort(np.abs(gaps)),
+                                   [np.pi / 2] * 2 + [3 * np.pi / 2] * 2,
+                                   atol=1e-3)
+        # Jumps at each integer after -5, including the endpoint
+        x, y, breaks = self.sample("floor(x)", (-5, 5))
+        self.assertEqual(breaks, 10)
+        # Asymptote at x = 0 without a sign change
+        x, y, breaks = self.sample("log(x)", (-5, 5))
+        self.assertGreater(breaks, 0)
+
+    def test_plot_funcs(self):
+        dom = parse_lim("(-5, 5)")
+        tests = [
+            # Clipped to the values away from the asymptotes
+            ("tan(x)", 5, 20),
+            # Shows the whole of a continuous line
+            ("exp(x)", 140, 200),
+        ]
+        for s, lower, upper in tests:
+            with self.subTest(s):
+                func = Func('f', Var.X, parse_expr(s))
+                fig = plot_funcs([func], ['red'], dom, None)
+                top = fig.axes[0].get_ylim()[1]
+                self.assertTrue(lower < top < upper, top)
+        self.assertIsNone(_robust_range(np.array([np.nan])))
+
+    def parametric(self, xt: str, yt: str, t_end: str) -> np.ndarray:
+        fig = plot_parametric(parse_expr(xt), parse_expr(yt),
+                              parse_expr("0"), parse_expr(t_end))
+        return fig.axes[0].lines[0].get_xydata()
+
+    def test_plot_parametric(self):
+        # Long intervals are refined evenly within the budget
+        points = self.parametric("t*cos(t)", "t*sin(t)", "200")
+        self.assertLessEqual(len(points), MAX_SAMPLES)
+        steps = np.hypot(*np.diff(points, axis=0).T)
+        self.assertLess(steps.max(), 2 * np.median(steps))
+        # Broken at the asymptotes of tan(t)
+        points = self.parametric("tan(t)", "sin(t)", "6")
+        self.assertEqual(np.isnan(points[:, 0]).sum(), 2)
+
+    def contour(self, s: str) -> np.ndarray:
+        rel = parse_rel(s)
+        kernel = Kernel(rel.lhs - rel.rhs, [Var.X, Var.Y])
+        x = np.linspace(-2, 2, 41)
+        y = np.linspace(-2, 2, 31)
+        return _contour(kernel, x, y, kernel(*np.meshgrid(x, y)))
+
+    def test_contour(self):
+        segments = self.contour("x^2 + y^2 = 1")
+        self.assertGreater(len(segments), 0)
+        radii = np.hypot(segments[:, :, 0], segments[:, :, 1])
+        np.testing.assert_allclose(radii, 1, atol=0.01)
+        # Saddle at the origin
+        segments = self.contour("x*y = 0")
+        self.assertTrue(np.all(np.isclose(segments, 0).any(axis=2)))
+        # No segments along the pole at x = 0
+        segments = self.contour("1/x = y")
+        self.assertGreater(len(segments), 0)
+        self.assertTrue(np.all(np.abs(segments[:, :, 0]) > 0.4))
+
+    def test_plot_rels(self):
+        dom = parse_lim("(-2, 2)")
+        tests = [
+            ("x^2 + y^2 = 1", True),
+            ("y < x^2", True),
+            ("x != y", False),
+            ("factorial(x) = y", False),
+        ]
+        for s, supported in tests:
+            with self.subTest(s):
+                plotted = plot_rels([parse_rel(s)], ['red'], dom, dom)
+                self.assertEqual(plotted is not None, supported)
+                if supported:
+                    self.assertEqual(len(plotted[1]), 1)
+
+    def test_plot_surfaces(self):
+        lim = parse_lim("(-2, 2)")
+        exprs = [parse_expr("x*y"), parse_expr("sqrt(x + y)")]
+        fig, handles = plot_surfaces(exprs, lim, lim)
+        self.assertEqual(len(handles), 2)
+        ax = fig.axes[0]
+        # Both surfaces share the polygon budget
+        polygons = sum(len(c.get_paths()) for c in ax.collections)
+        self.assertLessEqual(polygons, MAX_POLYGONS)
+        # The undefined half of sqrt(x + y) does not break the limits
+        self.assertEqual(ax.get_zlim(), (-4, 4))
+        # The legend colours are the ones Matplotlib would pick
+        for handle, surface in zip(handles, ax.collections):
+            np.testing.assert_allclose(handle.get_facecolor(),
+                                       surface.get_facecolor()[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
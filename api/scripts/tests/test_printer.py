@@ -1,8 +1,10 @@
 import unittest
 from typing import Callable
 
-from scripts.parser import parse_expr
-from scripts.printer import make_pretty
+import sympy as sp
+
+from scripts.parser import parse_expr, parse_eq
+from scripts.printer import DasPrinter, make_latex, make_pretty
 
 
 class TestAlgebra(unittest.TestCase):
@@ -85,6 +87,53 @@ class TestAlgebra(unittest.TestCase):
                 res = make_pretty(parse_expr(expr))
                 self.assertEqual(expected, res)
 
+    def test_printer_objects(self):
+        x, y = sp.symbols('x y')
+        f = sp.Function('f')
+        tests = [
+            (parse_eq("x^2 + 1 = 2x"), "x^2+1=2x"),
+            (sp.Ne(x, 1), "x!=1"),
+            (sp.Max(1, x), "Max(1,x)"),
+            (sp.FiniteSet(-sp.sqrt(2), sp.sqrt(2)), "{-sqrt(2),sqrt(2)}"),
+            (sp.Interval.Lopen(0, 1), "(0,1]"),
+            (sp.Union(sp.Interval(0, 1), sp.Interval(2, 3)),
+             "Union([0,1],[2,3])"),
+            (sp.EmptySet, "∅"),
+            (sp.Abs(x - 1), "abs(x-1)"),
+            # Names containing E, I or pi are left as they are
+            (sp.Ei(x), "Ei(x)"),
+            (sp.Integral(x, x), "Integral(x,x)"),
+            (sp.Symbol('pie'), "pie"),
+            # Objects printed by SymPy's printer have no spaces either
+            (sp.ConditionSet(x, sp.Eq(sp.exp(x), 1), sp.S.Complexes),
+             "ConditionSet(x,exp(x)=1,Complexes)"),
+            (sp.Subs(f(x), x, 1), "Subs(f(x),x,1)"),
+            (sp.Limit(sp.sin(x) / x, x, 0), "Limit(sin(x)/x,x,0,dir='+')"),
+            (sp.Derivative(f(x, y), (x, 2), y), "Derivative(f(x,y),(x,2),y)"),
+            (sp.Lambda((x, y), x + y), "Lambda((x,y),x+y)"),
+            (sp.Matrix([[1, 2]]), "Matrix([[1,2]])"),
+        ]
+        for obj, expected in tests:
+            with self.subTest(expected):
+                self.assertEqual(expected, make_pretty(obj))
+
+    def test_printer_memo(self):
+        printer = DasPrinter()
+        expr = parse_expr("sin(x)^2 + sin(x) + 1")
+        self.assertEqual("sin(x)^2+sin(x)+1", printer.doprint(expr))
+        self.assertEqual("sin(x)", printer._memo[sp.sin(sp.Symbol('x'))])
+        # The same subtree printed with the memo
+        expr = 2 * sp.sin(sp.Symbol('x'))
+        self.assertEqual("2sin(x)", printer.doprint(expr))
+
+    def test_latex(self):
+        tests = ["2x^2 + sin(x)", "exp(x)/(x + 1)", "sqrt(x)^3",
+                 "sin(x)^2 + sin(x)", "e^(2x) - x/2"]
+        for s in tests:
+            with self.subTest(s):
+                expr = parse_expr(s, evaluate=False)
+                self.assertEqual(sp.latex(expr), make_latex(expr))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,41 @@
+import io
+import unittest
+
+from PIL import Image
+
+from scripts.renderer import _render_tex
+
+
+class TestRenderer(unittest.TestCase):
+
+    def get_size(self, tex: str) -> tuple[int, int]:
+        image = _render_tex(tex)
+        self.assertTrue(image.startswith(b'\x89PNG'))
+        return Image.open(io.BytesIO(image)).size
+
+    def test_render_tex(self):
+        tests = [
+            "No solution",
+            "$x \\in \\mathbb{R}$",
+            "$\\frac{1}{2} + x^2 = \\int x dx$",
+            "Hello $x_1$ world",
+            "price \\$5",
+        ]
+        for tex in tests:
+            with self.subTest(tex):
+                width, height = self.get_size(tex)
+                self.assertGreater(width, height)
+
+    def test_render_tex_lines(self):
+        one_line = self.get_size("$x^2$")
+        two_lines = self.get_size("$x^2$\n$x^2$")
+        self.assertEqual(one_line[0], two_lines[0])
+        self.assertGreater(two_lines[1], one_line[1])
+
+    def test_render_tex_invalid(self):
+        with self.assertRaises(ValueError):
+            _render_tex("$\\frac{1}{$")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import os
+import signal
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from scripts import deadlines, parser, protocol, worker
+from scripts.algebra import expand_expression
+from scripts.cache import DiskCache, ResultCache, make_key
+
+
+class TestWorker(unittest.TestCase):
+
+    def test_protocol(self):
+        tests = [
+            ({"pretty": {"expr": "1+1"}, "image": b"\x89PNG", "answer": "2"},
+             b'{"pretty": {"expr": "1+1"}, "answer": "2"}', b"\x89PNG"),
+            ({"name": "ParsingError", "message": "1+ is invalid"},
+             b'{"name": "ParsingError", "message": "1+ is invalid"}', b""),
+        ]
+        for message, header, image in tests:
+            with self.subTest(message):
+                frame = protocol.encode(message)
+                size = protocol.LENGTH.size
+                header_length, = protocol.LENGTH.unpack(frame[:size])
+                self.assertEqual(header, frame[size:size+header_length])
+                rest = frame[size+header_length:]
+                image_length, = protocol.LENGTH.unpack(rest[:size])
+                self.assertEqual(len(image), image_length)
+                self.assertEqual(image, rest[size:])
+
+    def test_stats(self):
+        self.assertEqual(b"\x00\x00\x00\x00", protocol.encode_stats(None))
+        args = {"expr": "(x+7)^2"}
+        frame, stats = worker.run("expand_expression", expand_expression,
+                                  args, None)
+        self.assertFalse(stats["cached"])
+        self.assertEqual({"parse", "print", "render", "compute"},
+                         set(stats["stages"]))
+        self.assertTrue(all(t >= 0 for t in stats["stages"].values()))
+        # Cached responses are the same, with new stats
+        cached_frame, stats = worker.run("expand_expression",
+                                         expand_expression, args, None)
+        self.assertEqual(frame, cached_frame)
+        self.assertTrue(stats["cached"])
+
+    def test_ping(self):
+        res = worker.ping()
+        self.assertEqual("ok", res["status"])
+        self.assertGreater(res["rss"], 0)
+        # Every ping parses
+        hits = parser.parses.hits
+        worker.ping()
+        self.assertEqual(hits, parser.parses.hits)
+
+    def test_cache_key(self):
+        same = [
+            ({"expr": "2x+1"}, {"expr": "2*x + 1"}),
+            ({"func": "f(x)=x^2", "var": "x", "dom": "[-5,5]"},
+             {"func": "f(x) = x**2", "var": "x", "dom": "(-5, 5)"}),
+            ({"eqs": ["x+y=1", "x-y=1"], "vars": ["x", "y"]},
+             {"eqs": ["x + y = 1", "x - y = 1"], "vars": ["x", "y"]}),
+        ]
+        for args1, args2 in same:
+            with self.subTest(args1):
+                self.assertEqual(make_key("op", args1), make_key("op", args2))
+        different = [
+            ({"expr": "2x+1"}, {"expr": "2x+2"}),
+            ({"text": "x+1"}, {"text": "x + 1"}),  # Display is not parsed
+            ({"func": "f(x)=x^2", "var": "x"}, {"func": "g(x)=x^2", "var": "x"}),
+            ({"expr": "x"}, {"expr": "Symbol('x')"}),  # Unparsable
+        ]
+        for args1, args2 in different:
+            with self.subTest(args1):
+                self.assertNotEqual(make_key("op", args1),
+                                    make_key("op", args2))
+        self.assertNotEqual(make_key("op1", {"expr": "x"}),
+                            make_key("op2", {"expr": "x"}))
+        self.assertIsNone(make_key("op", ["x"]))
+
+    def test_cache(self):
+        cache = ResultCache(max_bytes=15)
+        self.assertIsNone(cache.get("a"))
+        cache.put("a", b"12345")
+        cache.put("b", b"12345")
+        self.assertEqual(b"12345", cache.get("a"))  # a is now most recent
+        cache.put("c", b"12345")  # Evicts b
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(b"12345", cache.get("a"))
+        self.assertEqual(b"12345", cache.get("c"))
+        cache.put("d", b"x" * 100)  # Larger than the budget
+        self.assertIsNone(cache.get("d"))
+        self.assertEqual({"entries": 2, "bytes": 12, "hits": 3, "misses": 3,
+                          "evictions": 1}, cache.stats())
+
+    def test_cache_deadline(self):
+        class Alarming(bytes):
+            """ Sets off the alarm as the cache adds it to its size, after
+            checking it against the budget.
+            """
+            calls = 0
+
+            def __len__(self):
+                Alarming.calls += 1
+                if Alarming.calls == 2:
+                    signal.raise_signal(signal.SIGALRM)
+                return super().__len__()
+
+        handler = signal.getsignal(signal.SIGALRM)
+        deadlines.install()
+        try:
+            cache = ResultCache(max_bytes=15)
+            cache.put("a", b"12345")
+            # The deadline is only raised once the cache is consistent
+            with self.assertRaises(deadlines.DeadlineExceeded):
+                cache.put("b", Alarming(b"12345"))
+        finally:
+            signal.signal(signal.SIGALRM, handler)
+        self.assertEqual(b"12345", cache.get("b"))
+        self.assertEqual({"entries": 2, "bytes": 12, "hits": 1, "misses": 0,
+                          "evictions": 0}, cache.stats())
+
+    def test_run_deadline(self):
+        def slow_key(operation, args):
+            time.sleep(5)
+
+        handler = signal.getsignal(signal.SIGALRM)
+        deadlines.install()
+        try:
+            # Building the cache key counts towards the deadline
+            with mock.patch.object(worker, 'make_key', slow_key):
+                start = time.perf_counter()
+                frame, _ = worker.run("expand_expression", expand_expression,
+                                      {"expr": "x"}, time.time() + 0.1)
+        finally:
+            signal.signal(signal.SIGALRM, handler)
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertIn(b"TimeoutError", frame)
+
+    def test_operations(self):
+        self.assertIn("evaluate_expression", worker.OPERATIONS)
+        self.assertIn("graph_expr_multiple", worker.OPERATIONS)
+        for name in ["serve", "run", "ping", "warm_up", "main"]:
+            self.assertNotIn(name, worker.OPERATIONS)
+
+    def test_disk_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = DiskCache(directory, max_bytes=25)
+            self.assertIsNone(cache.get("a"))
+            cache.put("a", b"1234567890")
+            cache.put("b", b"1234567890")
+            # Make b the least recently used
+            os.utime(cache._path("b"), (0, 0))
+            self.assertEqual(b"1234567890", cache.get("a"))
+            cache.put("c", b"1234567890")
+            cache.trim()
+            self.assertIsNone(cache.get("b"))
+            self.assertEqual(b"1234567890", cache.get("a"))
+            self.assertEqual(b"1234567890", cache.get("c"))
+            # Shared with other processes using the same directory
+            other = DiskCache(directory, max_bytes=25)
+            self.assertEqual(b"1234567890", other.get("c"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+""" Code for timing the stages of a request.
+
+The time a worker spends on a request is split into stages (parsing,
+printing, plotting and rendering), which are reported to the API server for
+its metrics. The rest of the time is spent computing the result.
+"""
+import time
+from functools import wraps
+from typing import Callable
+
+COMPUTE = "compute"
+
+_stages: dict[str, float] = {}
+_current: str | None = None  # The stage being timed
+
+
+def timed(stage: str) -> Callable:
+    """ Decorates a function so that calls to it are timed as the stage.
+    Calls made while another stage is being timed count towards that one,
+    e.g. the printing done while rendering.
+    """
+    def decorate(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            global _current
+            if _current is not None:
+                return func(*args, **kwargs)
+            _current = stage
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _stages[stage] = (_stages.get(stage, 0.0) +
+                                  time.perf_counter() - start)
+                _current = None
+        return wrapper
+    return decorate
+
+
+def start() -> None:
+    """ Starts timing a new request. """
+    global _current
+    _stages.clear()
+    _current = None
+
+
+def finish(total: float) -> dict[str, float]:
+    """ Returns the seconds spent in each stage of the request, which took
+    total seconds, with the time not spent in any stage as computing.
+    """
+    stages = dict(_stages)
+    stages[COMPUTE] = max(0.0, total - sum(stages.values()))
+    return stages
@@ -6,8 +6,9 @@ from collections.abc import Mapping
 @dataclass
 class Result:
     pretty: Mapping[str, str | list[str]]
-    image: str
+    image: bytes
     answer: str | list[str] | None = None
+    attachment: str | None = None  # The full text of a summarised answer
 
 
 @dataclass
@@ -1,35 +1,165 @@
 """ Code for the worker process. """
+import os
 import sys
 import json
+import time
+import resource
+
+import sympy as sp
+import matplotlib.pyplot as plt
 
 from scripts.algebra import *
 from scripts.calculus import *
 from scripts.graphs import *
 from scripts.solvers import *
 from scripts.misc import *
-from scripts.utils import Error
+from scripts import parser, plotter, printer, renderer, protocol, timings
+from scripts import deadlines
+from scripts.deadlines import DeadlineExceeded
+from scripts.cache import ResultCache, make_key
+from scripts.utils import Result, Error, Func, Limit, Var
 
+RESULT_CACHE_BYTES = 32 * 1024 * 1024
 
-def main():
+results = ResultCache(RESULT_CACHE_BYTES)
+
+# The operations the API server can request, by name
+OPERATIONS = {func.__name__: func for func in [
+    evaluate_expression, expand_expression, factor_expression,
+    simplify_expression,
+    derive_expression, integrate_definite_expression,
+    integrate_indefinite_expression, limit_expression,
+    solve_equation, solve_linear_system,
+    graph_func_single, graph_func_multiple, graph_rel_single,
+    graph_rel_multiple, graph_parametric, graph_expr_single,
+    graph_expr_multiple,
+    display_text,
+]}
+
+
+def ready_message() -> dict:
+    """ Returns the line a worker sends once it can accept requests. """
+    return {"status": "ready", "pid": os.getpid()}
+
+
+def memory() -> dict:
+    """ Returns the memory the worker has resident now and at its peak, in
+    bytes. The current figure is only available where /proc is, e.g. Linux.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    try:
+        with open('/proc/self/statm') as f:
+            rss = int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        rss = peak
+    return {"rss": rss, "peak_rss": peak}
+
+
+def ping() -> dict:
+    """ Answers a health probe from the API server with the worker's memory
+    use, after a trivial parse to check that it is responsive. The parse
+    bypasses the cache, which would otherwise answer it after the first
+    probe.
+    """
+    parser._parse_uncached("2x+1", None, False)
+    return {"status": "ok", **memory()}
+
+
+def warm_up() -> None:
+    """ Runs a representative parse, render and plot so that the lazy
+    initialisation (parser globals, mathtext fonts, Agg backend) is paid for
+    before the worker accepts any requests.
+    """
+    expr = parser.parse_expr("2x^2 + sin(x)")
+    renderer.render_tex(f"${printer.make_latex(expr)} = "
+                        f"{printer.make_latex(sp.expand(expr))}$")
+    func = Func('f', Var.X, expr)
+    fig = plotter.plot_funcs([func], ['lightskyblue'], Limit(-1, 1), None)
+    renderer.render_figure(fig, [func.get_latex()])
+
+
+def run(operation: str,
+        func,
+        args: dict,
+        deadline: float | None) -> tuple[bytes, dict]:
+    """ Runs the operation and returns its encoded response and its stats,
+    which are the time spent in each stage and whether it was cached.
+    Successful responses are cached. The operation, including parsing its
+    arguments for the cache key, is aborted once the deadline (a Unix
+    timestamp) has passed so that the worker survives to serve the next
+    request.
+    """
+    start = time.perf_counter()
+    timings.start()
+    cached = False
+    try:
+        if deadline is not None:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise DeadlineExceeded()
+            deadlines.start(remaining)
+        try:
+            # Building the key parses the arguments, so it is also bounded
+            key = make_key(operation, args)
+            frame = results.get(key)
+            cached = frame is not None
+            if frame is None:
+                response = func(args)
+        finally:
+            deadlines.cancel()
+        if frame is None:
+            frame = protocol.encode(response.__dict__)
+            if isinstance(response, Result):
+                results.put(key, frame)
+    except DeadlineExceeded:
+        plt.close('all')  # Discard any half-drawn figures
+        frame = protocol.encode(Error(name="TimeoutError",
+                                      message="Exceeded time limit").__dict__)
+    stats = {"stages": timings.finish(time.perf_counter() - start),
+             "cached": cached}
+    return frame, stats
+
+
+def serve() -> None:
+    """ Answers requests read from stdin, one JSON object per line, until
+    stdin is closed. Responses are written to stdout as frames.
+    """
+    deadlines.install()
+    out = sys.stdout.buffer
+    protocol.write(out, ready_message())
     while True:
         line = sys.stdin.readline()
         if not line:
             break
+        stats = None
         try:
             req = json.loads(line)
             operation = req.get("operation")
             args = req.get("args", {})
-            func = globals().get(operation)
-            if callable(func):
-                output = func(args).__dict__
+            deadline = req.get("deadline")
+            if operation == "ping":
+                frame = protocol.encode(ping())
+            elif operation in OPERATIONS:
+                frame, stats = run(operation, OPERATIONS[operation], args,
+                                   deadline)
             else:
-                output = Error(
+                frame = protocol.encode(Error(
                     name="UnknownOperation",
                     message=f"Unknown operation: {operation}",
-                ).__dict__
+                ).__dict__)
         except Exception as e:
-            output = Error(name=type(e).__name__, message=str(e)).__dict__
-        print(json.dumps(output), flush=True)
+            frame = protocol.encode(Error(name=type(e).__name__,
+                                          message=str(e)).__dict__)
+        out.write(frame + protocol.encode_stats(stats))
+        out.flush()
+
+
+def main():
+    try:
+        warm_up()
+    except Exception:
+        pass  # A failed warm-up only costs latency on the first request
+    serve()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,64 @@
+""" Code for the zygote (fork server) process.
+
+The zygote imports and warms up everything once, then forks a worker for
+every connection made to its Unix socket. Each child inherits the warm
+interpreter, so replacing a killed worker takes milliseconds instead of a
+fresh import of SymPy and Matplotlib. The warm heap is frozen before forking
+so that the garbage collector does not touch it and the children keep
+sharing those pages copy-on-write.
+
+Usage: python scripts/zygote.py <socket path>
+The zygote exits once its stdin is closed.
+"""
+import os
+import gc
+import sys
+import select
+import signal
+import socket
+
+from scripts import protocol
+from scripts.worker import warm_up, serve, ready_message
+
+
+def _spawn(conn: socket.socket) -> None:
+    """ Turns the forked child into a worker that talks over conn. """
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    os.dup2(conn.fileno(), sys.stdin.fileno())
+    os.dup2(conn.fileno(), sys.stdout.fileno())
+    conn.close()
+    serve()
+
+
+def main():
+    path = sys.argv[1]
+    try:
+        warm_up()
+    except Exception:
+        pass  # A failed warm-up only costs latency on the first request
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)  # Children reap themselves
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+    gc.collect()
+    gc.freeze()
+    protocol.write(sys.stdout.buffer, ready_message())
+    while True:
+        readable, _, _ = select.select([server, sys.stdin], [], [])
+        if sys.stdin in readable and not sys.stdin.readline():
+            break  # The API server has gone away
+        if server in readable:
+            conn, _ = server.accept()
+            if os.fork() == 0:
+                server.close()
+                try:
+                    _spawn(conn)
+                finally:
+                    os._exit(0)
+            conn.close()
+    server.close()
+    os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,9 +13,6 @@ async def graph_single_func(itx: discord.Interaction,
                             dom: str,
                             ran: str | None) -> None:
     """ Plots a single function and sends the answer. """
-    # Check for bug with tan functions where automatic range fails.
-    if 'tan' in func and ran is None:
-        ran = '-5,5'
     res = await send_request('/graph-func-single', {'func': func,
                                                     'var': var,
                                                     'dom': dom,
@@ -36,9 +33,6 @@ async def graph_multiple_func(itx: discord.Interaction,
                               dom: str,
                               ran: str | None) -> None:
     """ Plots two functions and sends the answer. """
-    # Check for bug with tan functions where automatic range doesn't work.
-    if ('tan' in func1 or 'tan' in func2) and ran is None:
-        ran = '-5,5'
     res = await send_request('/graph-func-multiple', {'func1': func1,
                                                       'func2': func2,
                                                       'var': var,